@@ -0,0 +1,72 @@
+﻿from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from reportlab.pdfgen import canvas
+
+from transcription_service.infrastructure.pdf.reportlab_adapter import ReportLabPdfWriterAdapter, _wrap_text
+
+
+def _wrap_by_joining(c, text: str, max_width: float) -> list[str]:
+    # The previous wrapper: re-joins and re-measures the growing line for every word.
+    lines: list[str] = []
+    cur: list[str] = []
+    for w in text.split():
+        if c.stringWidth(" ".join(cur + [w]).strip()) <= max_width or not cur:
+            cur.append(w)
+        else:
+            lines.append(" ".join(cur))
+            cur = [w]
+    if cur:
+        lines.append(" ".join(cur))
+    return lines
+
+
+def _synthetic_transcript(words: int) -> str:
+    rng = random.Random(7)
+    vocab = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyzáéíóúñ") for _ in range(rng.randint(1, 12)))
+        for _ in range(5000)
+    ]
+    return " ".join(rng.choice(vocab) for _ in range(words))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare PDF line wrapping against re-measuring whole lines.")
+    parser.add_argument("--words", type=int, default=100_000)
+    parser.add_argument("--max-width", type=float, default=512.0)
+    args = parser.parse_args()
+
+    text = _synthetic_transcript(args.words)
+    with tempfile.TemporaryDirectory() as tmp:
+        c = canvas.Canvas(str(Path(tmp) / "wrap.pdf"))
+        c.setFont("Helvetica", 10)
+
+        t0 = time.perf_counter()
+        old = _wrap_by_joining(c, text, args.max_width)
+        old_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        new = _wrap_text(c, text, args.max_width)
+        new_s = time.perf_counter() - t0
+
+        print(f"joining: {old_s:.3f}s  lines={len(old)}")
+        print(f"cached:  {new_s:.3f}s  lines={len(new)}  identical={old == new}")
+        print(f"speedup: {old_s / new_s:.1f}x")
+
+        t0 = time.perf_counter()
+        ReportLabPdfWriterAdapter().write_pdf(
+            Path(tmp) / "transcript.pdf",
+            title="Benchmark",
+            source_url=None,
+            transcript_lines=[text],
+        )
+        print(f"write_pdf: {time.perf_counter() - t0:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+﻿from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from transcription_service.processing.energy import detect_silences_energy
+from transcription_service.processing.pcm import SAMPLE_RATE, PcmAudio
+from transcription_service.processing.segmenter import parse_silencedetect_output, silencedetect_filter
+from transcription_service.shared.fs__shared_util import run, which
+
+
+def _write_synthetic_wav(path: Path, minutes: float) -> None:
+    rng = np.random.default_rng(7)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    block = SAMPLE_RATE * 60
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        written = 0
+        while written < total:
+            n = min(block, total - written)
+            speech = rng.normal(0, 4000, n)
+            gate = np.repeat(rng.random(n // 8000 + 1) > 0.3, 8000)[:n]
+            w.writeframes((speech * gate).astype(np.int16).tobytes())
+            written += n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare the numpy energy detector with ffmpeg silencedetect.")
+    parser.add_argument("--minutes", type=float, default=30.0)
+    parser.add_argument("--silence-db", default="-35dB")
+    parser.add_argument("--min-duration", type=float, default=0.6)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav_path = Path(tmp) / "audio.wav"
+        _write_synthetic_wav(wav_path, args.minutes)
+
+        t0 = time.perf_counter()
+        silences = detect_silences_energy(PcmAudio(wav_path), silence_db=args.silence_db, min_duration=args.min_duration)
+        energy_s = time.perf_counter() - t0
+        print(f"energy:  {energy_s:.3f}s  silences={len(silences)}")
+
+        ffmpeg = which("ffmpeg")
+        if not ffmpeg:
+            print("ffmpeg:  skipped (not in PATH)")
+            return
+        t0 = time.perf_counter()
+        res = run(
+            [ffmpeg, "-hide_banner", "-nostats", "-i", str(wav_path), "-af",
+             silencedetect_filter(args.silence_db, args.min_duration), "-f", "null", "-"],
+            capture=True,
+            check=False,
+        )
+        ffmpeg_s = time.perf_counter() - t0
+        print(f"ffmpeg:  {ffmpeg_s:.3f}s  silences={len(parse_silencedetect_output(res.stderr or ''))}")
+        print(f"speedup: {ffmpeg_s / energy_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
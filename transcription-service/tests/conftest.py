@@ -0,0 +1,48 @@
+﻿from datetime import datetime, timezone
+
+import fakeredis
+import pytest
+from redis import Redis
+
+from transcription_service.jobs import queue
+from transcription_service.jobs.models import JobInput, JobOptions, JobState, JobTimestamps
+from transcription_service.settings import settings
+
+
+@pytest.fixture
+def redis_client(monkeypatch) -> Redis:
+    # Everything that calls get_redis() (stores, locks, barriers, RQ queues) shares one in-memory server.
+    server = fakeredis.FakeServer()
+    pool = fakeredis.FakeRedis(server=server).connection_pool
+    monkeypatch.setattr(queue, "_POOL", pool)
+    return Redis(connection_pool=pool)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_ROOT", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def api(redis_client, storage):
+    from fastapi.testclient import TestClient
+
+    from transcription_service import main
+
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_state():
+    def make(job_id: str, job_input: JobInput, options: JobOptions | None = None, status: str = "queued") -> JobState:
+        ts = datetime.now(timezone.utc).isoformat()
+        return JobState(
+            job_id=job_id,
+            status=status,
+            timestamps=JobTimestamps(created_at=ts, updated_at=ts),
+            input=job_input,
+            options=options or JobOptions(language="es"),
+        )
+
+    return make
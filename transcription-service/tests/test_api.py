@@ -0,0 +1,280 @@
+﻿import hashlib
+import io
+import json
+import threading
+import zipfile
+
+import pytest
+
+from transcription_service.jobs.dedupe import JobDedupeIndex, options_hash, url_fingerprint
+from transcription_service.jobs.models import JobInput
+from transcription_service.jobs.paths import JobPaths
+from transcription_service.jobs.queue import QUEUE_SPLITTER, get_queue
+from transcription_service.jobs.uploads import UploadSession
+from transcription_service.jobs.utils import open_job_store, storage_root
+from transcription_service.main import _build_options
+
+
+def test_duplicate_waits_for_an_owner_that_is_still_being_created(api, redis_client, make_state):
+    url = "https://x.com/i/spaces/ABC"
+    options = _build_options(None)
+    JobDedupeIndex(redis_client).claim(url_fingerprint(url), options_hash(options), "owner-1")
+    # The owner has claimed the slot but not written its state yet.
+    timer = threading.Timer(0.3, open_job_store().create, [make_state("owner-1", JobInput(type="url", value=url), options)])
+    timer.start()
+
+    r = api.post("/v1/transcriptions/jobs", json={"input": {"type": "url", "value": url}})
+    timer.join()
+    assert r.status_code == 202
+    assert r.json()["job_id"] == "owner-1"
+    assert r.json()["deduplicated"] is True
+
+
+def _created(r) -> tuple:
+    assert r.status_code == 202, r.text
+    job_id = r.json()["job_id"]
+    return open_job_store().load(job_id), JobPaths(storage_root(), job_id)
+
+
+def test_create_job_documents_every_body(api):
+    schema = api.get("/openapi.json").json()
+    body = schema["paths"]["/v1/transcriptions/jobs"]["post"]["requestBody"]
+    assert set(body["content"]) == {"application/json", "multipart/form-data", "application/octet-stream", "video/*"}
+    assert body["content"]["application/json"]["schema"]["$ref"] == "#/components/schemas/JobCreateRequest"
+    assert {"JobCreateRequest", "JobCreateInput", "JobCreateOptions"} <= set(schema["components"]["schemas"])
+
+
+def test_create_job_from_json(api):
+    r = api.post(
+        "/v1/transcriptions/jobs",
+        json={"input": {"type": "url", "value": "https://example.com/a.mp4"}, "options": {"language": "en"}},
+    )
+    job, _ = _created(r)
+    assert (job.input.type, job.input.value, job.options.language) == ("url", "https://example.com/a.mp4", "en")
+    assert get_queue(QUEUE_SPLITTER).count == 1
+
+
+def test_create_job_from_json_rejects_uploads_and_missing_values(api):
+    r = api.post("/v1/transcriptions/jobs", json={"input": {"type": "upload", "value": "a.mp4"}})
+    assert r.status_code == 422
+    r = api.post("/v1/transcriptions/jobs", json={"input": {"type": "url"}})
+    assert r.status_code == 422
+
+
+def test_create_job_from_multipart(api):
+    data = b"multipart media" * 1000
+    r = api.post(
+        "/v1/transcriptions/jobs",
+        files={"file": ("talk.mp4", data, "video/mp4")},
+        data={"options": json.dumps({"language": "en"})},
+    )
+    job, paths = _created(r)
+    assert (job.input.type, job.input.value, job.options.language) == ("upload", "talk.mp4", "en")
+    assert paths.original_mp4.read_bytes() == data
+    assert job.input.sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_create_job_from_a_raw_body(api):
+    data = bytes(range(256)) * 40_000
+    r = api.post(
+        "/v1/transcriptions/jobs",
+        content=data,
+        headers={"content-type": "video/mp4"},
+        params={"filename": "raw.mp4", "options": json.dumps({"produce_pdf": False})},
+    )
+    job, paths = _created(r)
+    assert (job.input.type, job.input.value, job.options.produce_pdf) == ("upload", "raw.mp4", False)
+    assert paths.original_mp4.read_bytes() == data
+    assert job.input.sha256 == hashlib.sha256(data).hexdigest()
+
+
+def test_create_job_rejects_an_empty_raw_body(api, storage):
+    r = api.post("/v1/transcriptions/jobs", content=b"", headers={"content-type": "application/octet-stream"})
+    assert r.status_code == 422
+    assert list(storage.glob("jobs/*")) == []
+
+
+def _upload(api, data: bytes, **extra) -> str:
+    r = api.post("/v1/transcriptions/uploads", json={"size": len(data), "filename": "big.mp4", **extra})
+    assert r.status_code == 201
+    return r.json()["upload_id"]
+
+
+def _put(api, upload_id: str, data: bytes, start: int, end: int, *, sha: str | None = None, total: int | None = None):
+    part = data[start:end]
+    return api.put(
+        f"/v1/transcriptions/uploads/{upload_id}",
+        content=part,
+        headers={
+            "content-range": f"bytes {start}-{end - 1}/{total if total is not None else len(data)}",
+            "x-part-sha256": sha or hashlib.sha256(part).hexdigest(),
+        },
+    )
+
+
+def test_resumable_upload_completes_into_a_job(api):
+    data = bytes(range(256)) * 400
+    upload_id = _upload(api, data, sha256=hashlib.sha256(data).hexdigest())
+    for start in (40_000, 0, 80_000):
+        r = _put(api, upload_id, data, start, min(start + 40_000, len(data)))
+        assert r.status_code == 200, r.text
+    assert api.get(f"/v1/transcriptions/uploads/{upload_id}").json()["offset"] == len(data)
+
+    r = api.post(f"/v1/transcriptions/uploads/{upload_id}/complete")
+    job, paths = _created(r)
+    assert job.job_id == upload_id
+    assert job.input.sha256 == hashlib.sha256(data).hexdigest()
+    assert paths.original_mp4.read_bytes() == data
+    assert api.get(f"/v1/transcriptions/uploads/{upload_id}").json()["completed"] is True
+
+    r = api.post(f"/v1/transcriptions/uploads/{upload_id}/complete")
+    assert r.status_code == 202 and r.json()["job_id"] == upload_id
+    assert get_queue(QUEUE_SPLITTER).count == 1
+    assert _put(api, upload_id, data, 0, 10).status_code == 409
+
+
+def test_upload_part_content_range_is_validated(api):
+    data = b"x" * 1000
+    upload_id = _upload(api, data)
+    url = f"/v1/transcriptions/uploads/{upload_id}"
+    assert api.put(url, content=b"x", headers={"x-part-sha256": "0"}).status_code == 400
+    assert api.put(url, content=b"x", headers={"content-range": "bytes a-b/1000", "x-part-sha256": "0"}).status_code == 400
+    assert _put(api, upload_id, data, 0, 10, total=999).status_code == 416
+    assert api.put(url, content=b"x", headers={"content-range": "bytes 990-1000/1000", "x-part-sha256": "0"}).status_code == 416
+    assert api.put(url, content=b"x", headers={"content-range": "items 0-0/1000", "x-part-sha256": "0"}).status_code == 416
+    assert api.put(url, content=b"x", headers={"content-range": "bytes 0-9/1000"}).status_code == 400
+    r = api.put(url, content=b"x" * 5, headers={"content-range": "bytes 0-9/*", "x-part-sha256": "0"})
+    assert r.status_code == 400 and "shorter" in r.json()["detail"]
+    assert _put(api, upload_id, data, 0, 10, total=None).status_code == 200
+
+
+def test_upload_part_checksum_and_overlaps(api):
+    data = bytes(range(256)) * 4
+    upload_id = _upload(api, data)
+    assert _put(api, upload_id, data, 0, 512).status_code == 200
+
+    r = _put(api, upload_id, data, 512, 1024, sha="0" * 64)
+    assert r.status_code == 400 and r.json()["detail"] == "part checksum mismatch"
+    assert api.get(f"/v1/transcriptions/uploads/{upload_id}").json()["ranges"] == [[0, 512]]
+    session = UploadSession(JobPaths(storage_root(), upload_id))
+    assert session.load()["inflight"] == []
+
+    # Another request is still receiving 768-1024.
+    token = session.reserve(768, 1024)
+    assert _put(api, upload_id, data, 512, 1024).status_code == 409
+    session.release(token)
+
+    assert _put(api, upload_id, data, 0, 512).status_code == 200
+    assert _put(api, upload_id, data, 256, 768).status_code == 409
+    assert api.post(f"/v1/transcriptions/uploads/{upload_id}/complete").status_code == 409
+
+    assert _put(api, upload_id, data, 512, 1024).status_code == 200
+    _, paths = _created(api.post(f"/v1/transcriptions/uploads/{upload_id}/complete"))
+    assert paths.original_mp4.read_bytes() == data
+
+
+def test_complete_rejects_a_whole_file_checksum_mismatch(api):
+    data = b"y" * 100
+    upload_id = _upload(api, data, sha256="0" * 64)
+    assert _put(api, upload_id, data, 0, 100).status_code == 200
+    assert api.post(f"/v1/transcriptions/uploads/{upload_id}/complete").status_code == 422
+
+
+def test_complete_resubmits_after_a_failed_enqueue(api, monkeypatch):
+    from transcription_service import main
+
+    data = b"z" * 100
+    upload_id = _upload(api, data)
+    assert _put(api, upload_id, data, 0, 100).status_code == 200
+
+    enqueue = main.enqueue
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("redis went away")
+
+    monkeypatch.setattr(main, "enqueue", fail)
+    with pytest.raises(ConnectionError):
+        api.post(f"/v1/transcriptions/uploads/{upload_id}/complete")
+    assert api.get(f"/v1/transcriptions/uploads/{upload_id}").json()["completed"] is False
+
+    monkeypatch.setattr(main, "enqueue", enqueue)
+    job, paths = _created(api.post(f"/v1/transcriptions/uploads/{upload_id}/complete"))
+    assert job.job_id == upload_id and paths.original_mp4.read_bytes() == data
+    assert get_queue(QUEUE_SPLITTER).count == 1
+
+
+def test_concurrent_completes_create_one_job(api):
+    data = bytes(range(256)) * 4000
+    upload_id = _upload(api, data)
+    assert _put(api, upload_id, data, 0, len(data)).status_code == 200
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(api.post(f"/v1/transcriptions/uploads/{upload_id}/complete")))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r.status_code for r in results] == [202] * 4
+    assert {r.json()["job_id"] for r in results} == {upload_id}
+    assert get_queue(QUEUE_SPLITTER).count == 1
+
+
+@pytest.fixture
+def streamed_job(api, make_state, monkeypatch):
+    from transcription_service.jobs.models import JobOptions
+    from transcription_service.settings import settings
+    from transcription_service.workers.packager import package_job
+
+    monkeypatch.setattr(settings, "PACKAGER_STREAM_ZIP", True)
+    options = JobOptions(language="es", produce_pdf=False, include_video=False)
+    open_job_store().create(make_state("job-1", JobInput(type="url", value="http://example.com"), options))
+    paths = JobPaths(storage_root(), "job-1")
+    paths.merged_dir.mkdir(parents=True)
+    paths.final_txt.write_text("hola mundo\n" * 500, encoding="utf-8")
+    paths.final_json.write_text(json.dumps([{"start": 0.0, "end": 1.0, "text": "hola mundo"}]), encoding="utf-8")
+    paths.final_vtt.write_text("WEBVTT\n", encoding="utf-8")
+    package_job("job-1")
+    assert open_job_store().load("job-1").status == "done"
+    return paths
+
+
+def test_streamed_download_serves_the_whole_zip(api, streamed_job):
+    r = api.get("/v1/transcriptions/jobs/job-1/download")
+    assert r.status_code == 200
+    assert r.headers["etag"].startswith('"') and r.headers["accept-ranges"] == "bytes"
+    assert int(r.headers["content-length"]) == len(r.content)
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
+        assert any(name.endswith(".txt") for name in zf.namelist())
+        assert zf.testzip() is None
+
+
+def test_streamed_download_honors_ranges_and_validators(api, streamed_job):
+    url = "/v1/transcriptions/jobs/job-1/download"
+    full = api.get(url)
+    etag, size = full.headers["etag"], len(full.content)
+
+    r = api.get(url, headers={"Range": "bytes=100-299"})
+    assert r.status_code == 206
+    assert r.headers["content-range"] == f"bytes 100-299/{size}"
+    assert r.content == full.content[100:300]
+
+    r = api.get(url, headers={"Range": "bytes=-50", "If-Range": etag})
+    assert r.status_code == 206 and r.content == full.content[-50:]
+
+    r = api.get(url, headers={"Range": "bytes=100-299", "If-Range": '"other"'})
+    assert r.status_code == 200 and r.content == full.content
+
+    r = api.get(url, headers={"If-None-Match": etag})
+    assert r.status_code == 304 and r.content == b""
+
+    r = api.get(url, headers={"Range": f"bytes={size}-"})
+    assert r.status_code == 416 and r.headers["content-range"] == f"bytes */{size}"
+
+
+def test_streamed_download_refuses_changed_sources(api, streamed_job):
+    streamed_job.final_txt.write_text("changed\n", encoding="utf-8")
+    r = api.get("/v1/transcriptions/jobs/job-1/download")
+    assert r.status_code == 409
@@ -0,0 +1,26 @@
+﻿import sys
+import threading
+import time
+
+import pytest
+
+from transcription_service.jobs.cancel import CancelWatcher, JobCanceled
+
+
+def test_cancel_watcher_kills_running_child():
+    watcher = CancelWatcher(None, "job-1")
+    timer = threading.Timer(0.3, watcher.trigger)
+    timer.start()
+
+    t0 = time.monotonic()
+    with pytest.raises(JobCanceled):
+        watcher.run([sys.executable, "-c", "import time; time.sleep(30)"])
+    assert time.monotonic() - t0 < 5
+    assert watcher.canceled
+
+
+def test_cancel_watcher_run_returns_output():
+    watcher = CancelWatcher(None, "job-2")
+    res = watcher.run([sys.executable, "-c", "print('ok')"], capture=True)
+    assert res.returncode == 0
+    assert res.stdout.strip() == "ok"
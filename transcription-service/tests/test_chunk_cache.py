@@ -0,0 +1,62 @@
+﻿import os
+
+import numpy as np
+
+from transcription_service.processing.chunk_cache import ChunkCache, chunk_cache_key
+
+
+PARAMS = {"model": "base", "compute_type": "int8", "beam_size": 5, "language": "es", "vad_filter": False}
+
+
+def test_key_depends_on_audio_and_params():
+    pcm = np.arange(1600, dtype=np.int16)
+    key = chunk_cache_key(pcm, PARAMS)
+    assert key == chunk_cache_key(pcm.copy(), dict(PARAMS))
+    assert key != chunk_cache_key(pcm[:-1], PARAMS)
+    assert key != chunk_cache_key(pcm, dict(PARAMS, language="en"))
+
+
+def test_hit_is_rebased_to_chunk_start(tmp_path):
+    cache = ChunkCache(tmp_path, max_bytes=1 << 20)
+    result = {"segments": [{"start": 12.0, "end": 14.5, "text": "hola"}], "text": "hola"}
+    cache.put("ab" * 32, result, chunk_start=10.0)
+
+    assert cache.get("cd" * 32, chunk_start=0.0) is None
+    hit = cache.get("ab" * 32, chunk_start=100.0)
+    assert hit == {"segments": [{"start": 102.0, "end": 104.5, "text": "hola"}], "text": "hola"}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_prune_evicts_least_recently_used(tmp_path):
+    result = {"segments": [{"start": 0.0, "end": 1.0, "text": "x" * 200}], "text": "x" * 200}
+    cache = ChunkCache(tmp_path, max_bytes=10_000)
+    keys = [f"{i:02d}" * 32 for i in range(3)]
+    for age, key in enumerate(keys):
+        cache.put(key, result, chunk_start=0.0)
+        path = cache._entry_path(key)
+        os.utime(path, (1000 + age, 1000 + age))
+
+    entry_size = cache._entry_path(keys[0]).stat().st_size
+    cache.get(keys[0], chunk_start=0.0)
+    cache.max_bytes = entry_size * 2
+
+    assert cache.prune() == 2
+    assert cache._entry_path(keys[0]).exists()
+    assert not cache._entry_path(keys[1]).exists()
+    assert not cache._entry_path(keys[2]).exists()
+
+
+def test_caches_in_one_process_share_the_size(tmp_path, monkeypatch):
+    result = {"segments": [{"start": 0.0, "end": 1.0, "text": "hola"}], "text": "hola"}
+    scans = []
+    scan = ChunkCache._scan_size
+
+    def counting_scan(self):
+        scans.append(self.root)
+        return scan(self)
+
+    monkeypatch.setattr(ChunkCache, "_scan_size", counting_scan)
+    for i in range(5):
+        # One cache per chunk job, as the fan-out transcriber opens them.
+        ChunkCache(tmp_path, max_bytes=1 << 20).put(f"{i:02d}" * 32, result, chunk_start=0.0)
+    assert scans == [tmp_path]
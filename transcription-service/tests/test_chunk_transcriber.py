@@ -0,0 +1,161 @@
+﻿import faster_whisper
+import numpy as np
+
+from transcription_service.processing import chunk_transcriber
+from transcription_service.processing.chunk_transcriber import FasterWhisperChunkTranscriber
+
+
+class DummyWhisperModel:
+    instances = 0
+
+    def __init__(self, model_size, *, device, compute_type, num_workers=1):
+        DummyWhisperModel.instances += 1
+        self.num_workers = num_workers
+
+
+def test_shared_model_is_loaded_once(monkeypatch):
+    monkeypatch.setattr(faster_whisper, "WhisperModel", DummyWhisperModel)
+    monkeypatch.setattr(chunk_transcriber, "_MODEL_CACHE", {})
+    DummyWhisperModel.instances = 0
+
+    def build():
+        return FasterWhisperChunkTranscriber(
+            model_size="tiny",
+            device="cpu",
+            compute_type="int8",
+            beam_size=1,
+            vad_filter=False,
+            shared_model=True,
+            num_workers=2,
+        )
+
+    first = build()
+    model = first._get_model()
+    assert first.model_warm is False
+    assert model.num_workers == 2
+
+    second = build()
+    assert second._get_model() is model
+    assert second.model_warm is True
+    assert "warm" in second.describe_model_usage()
+    assert DummyWhisperModel.instances == 1
+
+
+class DummySegment:
+    def __init__(self, start, end, text):
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+class DummyBatchedPipeline:
+    calls = []
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio, *, clip_timestamps, batch_size, **kwargs):
+        DummyBatchedPipeline.calls.append((audio.shape[0], clip_timestamps, batch_size))
+        segments = [DummySegment(clip["start"], clip["end"], f"clip {i}") for i, clip in enumerate(clip_timestamps)]
+        return iter(segments), None
+
+
+def test_split_windows_stays_under_limit():
+    audio = np.ones(75 * 16000, dtype=np.float32)
+    audio[28 * 16000:28 * 16000 + 1600] = 0.0
+    bounds = chunk_transcriber.split_windows(audio)
+    assert bounds[0] == (0, 28 * 16000 + 800)
+    assert bounds[-1][1] == audio.shape[0]
+    assert all(hi - lo <= 30 * 16000 for lo, hi in bounds)
+    assert all(a[1] == b[0] for a, b in zip(bounds, bounds[1:]))
+
+
+def test_transcribe_batch_maps_segments_back_to_chunks(monkeypatch):
+    monkeypatch.setattr(faster_whisper, "BatchedInferencePipeline", DummyBatchedPipeline)
+    monkeypatch.setattr(faster_whisper, "WhisperModel", DummyWhisperModel)
+    DummyBatchedPipeline.calls = []
+    transcriber = FasterWhisperChunkTranscriber(
+        model_size="tiny",
+        device="cpu",
+        compute_type="int8",
+        beam_size=1,
+        vad_filter=False,
+    )
+
+    chunks = [
+        (np.ones(10 * 16000, dtype=np.float32), 100.0),
+        (np.ones(45 * 16000, dtype=np.float32), 200.0),
+    ]
+    results = transcriber.transcribe_batch(chunks, language="es", batch_size=4)
+
+    assert len(DummyBatchedPipeline.calls) == 1
+    _samples, clips, batch_size = DummyBatchedPipeline.calls[0]
+    assert batch_size == 4
+    assert len(clips) == 3
+
+    assert [s["text"] for s in results[0]["segments"]] == ["clip 0"]
+    assert results[0]["segments"][0]["start"] == 100.0
+    assert results[0]["segments"][0]["end"] == 110.0
+
+    second = results[1]["segments"]
+    assert [s["text"] for s in second] == ["clip 1", "clip 2"]
+    assert second[0]["start"] == 200.0
+    assert second[0]["end"] == second[1]["start"]
+    assert abs(second[1]["end"] - 245.0) < 1e-6
+    assert results[1]["text"] == "clip 1 clip 2"
+
+
+def test_batched_job_loads_one_model(redis_client, storage, make_state, monkeypatch):
+    import json
+
+    from transcription_service.jobs.models import JobInput, JobOptions
+    from transcription_service.jobs.paths import JobPaths
+    from transcription_service.jobs.utils import open_job_store, storage_root
+    from transcription_service.processing.pcm import PcmWavWriter
+    from transcription_service.settings import settings
+    from transcription_service.workers.transcriber import transcribe_job
+
+    monkeypatch.setattr(faster_whisper, "BatchedInferencePipeline", DummyBatchedPipeline)
+    monkeypatch.setattr(faster_whisper, "WhisperModel", DummyWhisperModel)
+    monkeypatch.setattr(settings, "TRANSCRIPTION_FW_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "TRANSCRIBER_PRELOAD_MODEL", False)
+    monkeypatch.setattr(settings, "CHUNK_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "MERGE_INCREMENTAL", False)
+    DummyWhisperModel.instances = 0
+
+    options = JobOptions(language="es", max_parallel_chunks=4)
+    open_job_store().create(make_state("job-1", JobInput(type="url", value="http://example.com"), options))
+    paths = JobPaths(storage_root(), "job-1")
+    paths.input_dir.mkdir(parents=True)
+    wav = PcmWavWriter(paths.audio_wav)
+    wav.write(np.ones(180 * 16000, dtype="<i2").tobytes())
+    wav.close()
+    chunks = [{"index": i, "start": i * 30.0, "end": (i + 1) * 30.0} for i in range(6)]
+    paths.chunks_meta_path.write_text(json.dumps(chunks), encoding="utf-8")
+
+    transcribe_job("job-1")
+    assert open_job_store().load("job-1").progress.chunks_done == 6
+    assert DummyWhisperModel.instances == 1
+
+
+def test_worker_startup_reports_the_model_load(monkeypatch, capsys):
+    from transcription_service.settings import settings
+    from transcription_service.workers import transcriber
+
+    class DummyWorker:
+        def __init__(self, queues, connection):
+            pass
+
+        def work(self):
+            pass
+
+    monkeypatch.setattr(settings, "TRANSCRIBER_PRELOAD_MODEL", True)
+    monkeypatch.setattr(transcriber, "get_shared_model", lambda *args, **kwargs: (None, False, 1.5))
+    monkeypatch.setattr(transcriber, "get_redis", lambda: None)
+    monkeypatch.setattr(transcriber, "SimpleWorker", DummyWorker)
+    monkeypatch.setattr(transcriber.log, "handlers", [])
+    transcriber.main()
+
+    err = capsys.readouterr().err
+    assert f"preloaded whisper model {settings.TRANSCRIPTION_FW_MODEL} in 1.50s" in err
+    assert "model cache" in err
@@ -0,0 +1,99 @@
+﻿import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from transcription_service.processing.energy import EnergySilenceDetector, detect_silences_energy, parse_db
+from transcription_service.processing.pcm import PcmAudio
+from transcription_service.processing.segmenter import (
+    StreamingSegmenter,
+    pack_segments,
+    segment_audio_energy,
+    segment_from_silences,
+)
+
+
+def _signal() -> np.ndarray:
+    rate = 16000
+    t = np.arange(rate) / rate
+    tone = (8000 * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+    quiet = np.zeros(rate, dtype=np.int16)
+    short_gap = np.zeros(int(rate * 0.3), dtype=np.int16)
+    return np.concatenate([tone, quiet, tone, short_gap, tone, quiet])
+
+
+def test_parse_db():
+    assert parse_db("-35dB") == -35.0
+    assert parse_db("-42.5 db") == -42.5
+    with pytest.raises(ValueError):
+        parse_db("loud")
+
+
+def test_energy_detector_is_independent_of_block_size():
+    samples = _signal()
+    results = []
+    for block in (257, 4000, samples.shape[0]):
+        detector = EnergySilenceDetector(silence_db="-35dB", min_duration=0.6)
+        silences = []
+        for offset in range(0, samples.shape[0], block):
+            silences.extend(detector.feed(samples[offset:offset + block]))
+        silences.extend(detector.finish())
+        results.append(silences)
+
+    assert results[0] == results[1] == results[2]
+    assert results[0] == [(1.0, 2.0), (pytest.approx(4.3), pytest.approx(5.3))]
+
+
+def test_segment_audio_energy(tmp_path: Path):
+    wav_path = tmp_path / "audio.wav"
+    with wave.open(str(wav_path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(_signal().tobytes())
+
+    silences = detect_silences_energy(PcmAudio(wav_path), silence_db="-35dB", min_duration=0.6, block_seconds=0.5)
+    assert len(silences) == 2
+
+    result = segment_audio_energy(audio_path=wav_path, silence_db="-35dB", silence_min_duration=0.6, max_chunk_seconds=120)
+    assert [(s.start, s.end) for s in result.segments] == [(0.0, 1.0), (2.0, pytest.approx(4.3))]
+
+
+def test_streaming_segmenter_matches_batch_chunks():
+    rate = 16000
+    rng = np.random.default_rng(7)
+    pieces = []
+    for _ in range(60):
+        seconds = float(rng.uniform(0.1, 4.0))
+        n = int(rate * seconds)
+        if rng.random() < 0.5:
+            pieces.append((8000 * np.sin(2 * np.pi * 220 * np.arange(n) / rate)).astype(np.int16))
+        else:
+            pieces.append(np.zeros(n, dtype=np.int16))
+    samples = np.concatenate(pieces)
+    duration = samples.shape[0] / rate
+
+    detector = EnergySilenceDetector(silence_db="-35dB", min_duration=0.6)
+    silences = []
+    for offset in range(0, samples.shape[0], 4000):
+        silences.extend(detector.feed(samples[offset:offset + 4000]))
+    silences.extend(detector.finish())
+    batch = segment_from_silences(silences, duration, 3).segments
+
+    for target in (0.0, 2.5, 8.0):
+        expected = [(s.start, s.end) for s in pack_segments(batch, target)]
+        detector = EnergySilenceDetector(silence_db="-35dB", min_duration=0.6)
+        segmenter = StreamingSegmenter(max_chunk_seconds=3, target_seconds=target)
+        streamed = []
+        released_at = []
+        for offset in range(0, samples.shape[0], 3331):
+            out = segmenter.push(detector.feed(samples[offset:offset + 3331]), detector.settled)
+            streamed.extend(out)
+            released_at.extend([offset / rate] * len(out))
+        streamed.extend(segmenter.finish(detector.finish(), detector.position))
+
+        assert [(s.start, s.end) for s in streamed] == expected
+        assert [s.index for s in streamed] == list(range(1, len(expected) + 1))
+        # Chunks are released while the audio is still arriving, not at the end.
+        assert len(released_at) > len(expected) // 2
@@ -0,0 +1,137 @@
+﻿import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from transcription_service.infrastructure.downloader.http_ranged import DownloadError, download_ranged
+
+
+PAYLOAD = bytes(range(256)) * 1000
+
+
+class _Handler(BaseHTTPRequestHandler):
+    ranges = True
+    fail_after: int | None = None
+    served: list[str] = []
+    etag: str | None = '"v1"'
+    last_modified: str | None = None
+    if_ranges: list[str | None] = []
+
+    def log_message(self, *args):
+        pass
+
+    def _if_range_matches(self) -> bool:
+        # RFC 9110: a weak entity tag never matches, and anything else but the current validator fails.
+        value = self.headers.get("If-Range")
+        type(self).if_ranges.append(value)
+        if value is None:
+            return True
+        if value.startswith("W/"):
+            return False
+        return value in {self.etag, self.last_modified}
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        type(self).served.append(header or "")
+        if header and self.ranges and self._if_range_matches():
+            first, last = header.split("=", 1)[1].split("-")
+            start, end = int(first), int(last) + 1
+            if self.fail_after is not None and start >= self.fail_after:
+                self.send_response(500)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(PAYLOAD)}")
+            body = PAYLOAD[start:end]
+        else:
+            self.send_response(200)
+            body = PAYLOAD
+        if self.etag:
+            self.send_header("ETag", self.etag)
+        if self.last_modified:
+            self.send_header("Last-Modified", self.last_modified)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture()
+def server():
+    _Handler.ranges = True
+    _Handler.fail_after = None
+    _Handler.served = []
+    _Handler.etag = '"v1"'
+    _Handler.last_modified = None
+    _Handler.if_ranges = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/media.mp4"
+    httpd.shutdown()
+
+
+def test_ranged_download_resumes_from_sidecar(server, tmp_path: Path):
+    dest = tmp_path / "original.mp4"
+    _Handler.fail_after = 100_000
+
+    with pytest.raises(DownloadError):
+        download_ranged(server, dest, connections=1, part_size=50_000)
+    assert not dest.exists()
+    progress = json.loads((tmp_path / "original.mp4.part.json").read_text(encoding="utf-8"))
+    assert progress["done"] == [0, 1]
+
+    _Handler.fail_after = None
+    _Handler.served = []
+    stats = download_ranged(server, dest, connections=3, part_size=50_000)
+    assert dest.read_bytes() == PAYLOAD
+    assert stats.ranged and stats.parts == 6 and stats.resumed_parts == 2
+    assert "bytes=0-49999" not in _Handler.served
+    assert not (tmp_path / "original.mp4.part.json").exists()
+
+
+@pytest.mark.parametrize("last_modified", [None, "Wed, 21 Oct 2015 07:28:00 GMT"])
+def test_ranged_download_behind_a_weak_etag(server, tmp_path: Path, last_modified):
+    _Handler.etag = 'W/"v1"'
+    _Handler.last_modified = last_modified
+    stats = download_ranged(server, tmp_path / "original.mp4", connections=2, part_size=50_000)
+    assert stats.ranged and stats.parts == 6
+    assert (tmp_path / "original.mp4").read_bytes() == PAYLOAD
+    assert set(_Handler.if_ranges) == {None} | ({last_modified} if last_modified else set())
+
+
+def test_download_without_range_support(server, tmp_path: Path):
+    _Handler.ranges = False
+    stats = download_ranged(server, tmp_path / "original.mp4", part_size=50_000)
+    assert not stats.ranged
+    assert (tmp_path / "original.mp4").read_bytes() == PAYLOAD
+
+
+def test_ranged_download_stops_when_canceled(server, tmp_path: Path):
+    dest = tmp_path / "original.mp4"
+    checks = []
+
+    def check_canceled():
+        # Canceled once the first part is in: before part 1 starts.
+        checks.append(1)
+        if len(checks) > 2:
+            raise InterruptedError("job-1")
+
+    with pytest.raises(InterruptedError):
+        download_ranged(server, dest, connections=1, part_size=50_000, check_canceled=check_canceled)
+    assert not dest.exists()
+    progress = json.loads((tmp_path / "original.mp4.part.json").read_text(encoding="utf-8"))
+    assert progress["done"] == [0]
+    assert _Handler.served == ["bytes=0-0", "bytes=0-49999"]
+
+
+def test_whole_download_stops_when_canceled(server, tmp_path: Path):
+    _Handler.ranges = False
+
+    def check_canceled():
+        raise InterruptedError("job-1")
+
+    with pytest.raises(InterruptedError):
+        download_ranged(server, tmp_path / "original.mp4", check_canceled=check_canceled)
+    assert not (tmp_path / "original.mp4").exists()
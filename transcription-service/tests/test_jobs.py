@@ -1,7 +1,8 @@
 ﻿from datetime import datetime, timezone
 
+from transcription_service.jobs.dedupe import options_hash, url_fingerprint
 from transcription_service.jobs.models import JobInput, JobOptions, JobState, JobTimestamps
-from transcription_service.jobs.store import JobStore
+from transcription_service.jobs.store import JobStore, RedisHashJobStore, state_from_hash, state_to_hash
 
 
 def test_job_store_transitions(tmp_path):
@@ -36,3 +37,164 @@ def test_job_store_transitions(tmp_path):
     assert finished is not None
     assert finished.status == "done"
     assert finished.timestamps.finished_at is not None
+
+
+def test_job_state_hash_round_trip():
+    ts = datetime.now(timezone.utc).isoformat()
+    state = JobState(
+        job_id="job-2",
+        status="transcribing",
+        timestamps=JobTimestamps(created_at=ts, updated_at=ts, started_at=ts),
+        input=JobInput(type="upload", value="video.mp4"),
+        options=JobOptions(language="en", chunk_mode="energy"),
+        errors=["chunk 3: boom"],
+    )
+    state.progress.chunks_total = 8
+
+    fields = {k.encode(): v.encode() for k, v in state_to_hash(state).items()}
+    fields[b"chunks_done"] = b"2"
+    restored = state_from_hash(fields, [b"chunk 3: boom"])
+
+    assert restored.status == "transcribing"
+    assert restored.progress.chunks_done == 2
+    assert restored.progress.percent == 25
+    assert restored.timestamps.finished_at is None
+    assert restored.options.chunk_mode == "energy"
+    assert restored.errors == ["chunk 3: boom"]
+    assert restored.result is None
+
+
+def test_hash_store_updates_return_the_new_state(tmp_path, redis_client, make_state):
+    store = RedisHashJobStore(tmp_path, redis_client=redis_client)
+    store.create(make_state("job-4", JobInput(type="url", value="http://example.com"), status="transcribing"))
+
+    assert store.set_progress("job-4", chunks_total=4).progress.chunks_total == 4
+    assert store.incr_progress("job-4").progress.chunks_done == 1
+    assert store.add_error("job-4", "chunk 2: boom").errors == ["chunk 2: boom"]
+    assert store.incr_progress("missing") is None
+
+
+def test_legacy_state_migration_never_overwrites_the_hash(tmp_path, redis_client, monkeypatch):
+    ts = datetime.now(timezone.utc).isoformat()
+    JobStore(tmp_path).create(JobState(
+        job_id="job-3",
+        status="queued",
+        timestamps=JobTimestamps(created_at=ts, updated_at=ts),
+        input=JobInput(type="url", value="http://example.com"),
+        options=JobOptions(language="es"),
+        errors=["old"],
+    ))
+    store = RedisHashJobStore(tmp_path, redis_client=redis_client)
+    stale = JobStore(tmp_path).load("job-3")
+    store.set_status("job-3", "canceled")
+
+    # A second process read the legacy file and checked for the hash before the first one migrated.
+    monkeypatch.setattr(store.redis, "exists", lambda *keys: 0)
+    monkeypatch.setattr(JobStore, "load", lambda self, job_id: stale)
+    assert store._ensure_hash("job-3")
+    state = store.load("job-3")
+    assert state.status == "canceled"
+    assert state.errors == ["old"]
+
+
+def test_dedupe_fingerprints_ignore_runtime_options():
+    base = JobOptions(language="es", max_parallel_chunks=2)
+    assert options_hash(base) == options_hash(JobOptions(language="es", max_parallel_chunks=8, cookies_from_browser="firefox"))
+    assert options_hash(base) != options_hash(JobOptions(language="en"))
+    assert options_hash(base) != options_hash(JobOptions(language="es", produce_pdf=False))
+    assert options_hash(base) == options_hash(JobOptions(language="es", audio_only=True))
+    assert options_hash(base) != options_hash(JobOptions(language="es", include_video=False))
+
+    assert url_fingerprint("HTTPS://X.com/i/spaces/ID#t=1") == url_fingerprint("https://x.com/i/spaces/ID")
+    assert url_fingerprint("https://x.com/i/spaces/ID") != url_fingerprint("https://x.com/i/spaces/OTHER")
+
+
+def test_restarted_ingest_cuts_off_earlier_chunk_jobs(redis_client):
+    from transcription_service.jobs.barrier import ChunkBarrier
+
+    barrier = ChunkBarrier(redis_client, "job-1")
+    first = barrier.begin_generation()
+    assert barrier.start(0, first, lease_seconds=60)
+    assert barrier.start(1, first, lease_seconds=-1)
+
+    second = barrier.begin_generation()
+    assert not barrier.start(2, first, lease_seconds=60)
+    # Chunk 1's lease has run out, so only chunk 0 is still waited for.
+    assert barrier.running_before(second) == 1
+    assert barrier.start(0, second, lease_seconds=60)
+    barrier.finish(0, first)
+    assert barrier.running_before(second) == 0
+
+
+def test_stale_streamed_chunk_job_is_dropped(redis_client, storage, make_state):
+    from transcription_service.jobs.barrier import ChunkBarrier
+    from transcription_service.jobs.paths import JobPaths
+    from transcription_service.jobs.utils import open_job_store, storage_root
+    from transcription_service.workers.transcriber import transcribe_chunk_job
+
+    open_job_store().create(make_state("job-1", JobInput(type="url", value="http://example.com"), status="transcribing"))
+    barrier = ChunkBarrier(redis_client, "job-1")
+    stale = barrier.begin_generation()
+    barrier.begin_generation()
+    barrier.expect([0])
+
+    transcribe_chunk_job("job-1", 0, 0.0, 30.0, stale)
+    assert barrier.remaining() == 1
+    assert barrier.running_before(stale) == 0
+    log = (JobPaths(storage_root(), "job-1").logs_dir / "job.log").read_text(encoding="utf-8")
+    assert "chunk 0: dropped, its ingest was restarted" in log
+
+
+def test_resumed_ingest_requeues_only_missing_chunks_under_a_new_generation(redis_client, storage, make_state):
+    import json
+
+    from transcription_service.jobs.barrier import ChunkBarrier
+    from transcription_service.jobs.cancel import CancelWatcher
+    from transcription_service.jobs.logger import JobLogger
+    from transcription_service.jobs.paths import JobPaths
+    from transcription_service.jobs.queue import QUEUE_TRANSCRIBER, get_queue
+    from transcription_service.jobs.utils import open_job_store, storage_root
+    from transcription_service.processing.partials import PartialLog
+    from transcription_service.workers.splitter import _stream_ingest
+    from transcription_service.workers.transcriber import transcribe_chunk_job
+
+    store = open_job_store()
+    job = make_state("job-1", JobInput(type="url", value="http://example.com/live"), status="splitting")
+    store.create(job)
+    paths = JobPaths(storage_root(), "job-1")
+    paths.chunks_meta_path.parent.mkdir(parents=True, exist_ok=True)
+    paths.chunks_meta_path.write_text(
+        json.dumps([{"index": 1, "start": 0.0, "end": 30.0}, {"index": 2, "start": 30.0, "end": 60.0}]),
+        encoding="utf-8",
+    )
+    PartialLog(paths.partials_dir).append({"chunk_index": 1, "segments": []})
+    # The first attempt queued chunk 2 before the splitter died.
+    earlier = ChunkBarrier(redis_client, "job-1").begin_generation()
+
+    _stream_ingest(job, store, paths, JobLogger(paths.logs_dir / "job.log"), paths.logs_dir, CancelWatcher(redis_client, "job-1"))
+
+    queued = get_queue(QUEUE_TRANSCRIBER).jobs
+    assert [j.args[1] for j in queued] == [2]
+    current = queued[0].args[4]
+    assert current is not None and current != earlier
+
+    barrier = ChunkBarrier(redis_client, "job-1")
+    transcribe_chunk_job("job-1", 2, 30.0, 60.0, earlier)
+    assert barrier.remaining() == 1
+
+
+def test_redis_pool_stats_only_report_counters_the_pool_keeps(monkeypatch):
+    from redis import BlockingConnectionPool, ConnectionPool
+
+    from transcription_service.jobs import queue
+
+    monkeypatch.setattr(queue, "_POOL", BlockingConnectionPool(max_connections=3))
+    stats = queue.redis_pool_stats()
+    assert stats["max_connections"] == 3
+    assert (stats["created_connections"], stats["idle_connections"], stats["in_use_connections"]) == (0, 0, 0)
+
+    # A pool without the internals BlockingConnectionPool has still reports what is public.
+    monkeypatch.setattr(queue, "_POOL", ConnectionPool(max_connections=5))
+    stats = queue.redis_pool_stats()
+    assert stats["open"] and stats["max_connections"] == 5
+    assert "idle_connections" not in stats
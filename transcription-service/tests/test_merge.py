@@ -1,7 +1,25 @@
-﻿import json
+﻿import hashlib
+import json
+import time
+import zlib
 from pathlib import Path
 
-from transcription_service.processing.merge import merge_partials
+import pytest
+
+from transcription_service.jobs.models import JobInput
+from transcription_service.jobs.paths import JobPaths
+from transcription_service.jobs.queue import QUEUE_PACKAGER, get_queue
+from transcription_service.jobs.utils import open_job_store, storage_root
+from transcription_service.processing import merge
+from transcription_service.processing.merge import (
+    TranscriptWriter,
+    _normalize_segments,
+    advance_merge,
+    iter_json_segments,
+    merge_partials,
+    read_merged_text,
+)
+from transcription_service.processing.vtt import segments_to_vtt
 
 
 def test_merge_partials_creates_outputs(tmp_path: Path):
@@ -53,3 +71,174 @@ def test_merge_partials_creates_outputs(tmp_path: Path):
     assert "world" in text
     assert final_vtt.read_text(encoding="utf-8").startswith("WEBVTT")
     assert len(segments) >= 2
+
+
+def test_streaming_merge_matches_in_memory_output(tmp_path: Path):
+    partials = tmp_path / "partials"
+    partials.mkdir(parents=True, exist_ok=True)
+
+    chunks = [
+        [{"start": 0.0, "end": 2.0, "text": " hola "}, {"start": 1.5, "end": 3.0, "text": "que tal"}],
+        [{"start": 2.8, "end": 4.0, "text": "QUE TAL"}, {"start": 4.0, "end": 5.5, "text": "\"comillas\" y \\ barra"}],
+        [],
+        [{"start": 6.0, "end": 6.0, "text": "vacio"}, {"start": 6.0, "end": 7.25, "text": "fin"}],
+    ]
+    for idx, segs in enumerate(chunks, start=1):
+        (partials / f"{idx:04d}.json").write_text(json.dumps({"segments": segs}), encoding="utf-8")
+    (partials / "10000.json").write_text(
+        json.dumps({"segments": [{"start": 9000.0, "end": 9001.0, "text": "ultimo"}]}), encoding="utf-8"
+    )
+
+    merged_dir = tmp_path / "merged"
+    merged_dir.mkdir()
+    segments = merge_partials(
+        partials_dir=partials,
+        final_json=merged_dir / "final.json",
+        final_txt=merged_dir / "final.txt",
+        final_vtt=merged_dir / "final.vtt",
+    )
+
+    expected = _normalize_segments([seg for segs in chunks for seg in segs] + [{"start": 9000.0, "end": 9001.0, "text": "ultimo"}])
+    assert segments == expected
+    text = " ".join(s["text"] for s in expected)
+    assert (merged_dir / "final.txt").read_text(encoding="utf-8") == text + "\n"
+    assert (merged_dir / "final.json").read_text(encoding="utf-8") == json.dumps({"segments": expected, "text": text}, indent=2)
+    assert (merged_dir / "final.vtt").read_text(encoding="utf-8") == segments_to_vtt(expected)
+
+
+def test_streaming_merge_without_segments(tmp_path: Path):
+    partials = tmp_path / "partials"
+    partials.mkdir()
+    final_json = tmp_path / "final.json"
+    merge_partials(partials_dir=partials, final_json=final_json, final_txt=tmp_path / "final.txt", final_vtt=tmp_path / "final.vtt")
+
+    assert final_json.read_text(encoding="utf-8") == json.dumps({"segments": [], "text": ""}, indent=2)
+    assert (tmp_path / "final.vtt").read_text(encoding="utf-8") == segments_to_vtt([])
+
+
+def test_incremental_merge_matches_single_pass(tmp_path: Path):
+    chunks = {
+        1: {"segments": [{"start": 0.0, "end": 2.0, "text": "uno"}, {"start": 1.0, "end": 3.0, "text": "dos"}]},
+        2: {"segments": [{"start": 2.5, "end": 4.0, "text": "dos"}, {"start": 4.0, "end": 5.0, "text": "tres"}]},
+        3: {"segments": [{"start": 5.0, "end": 6.0, "text": "cuatro"}]},
+    }
+    landed: dict[int, dict] = {}
+    cursor_path = tmp_path / "cursor.json"
+    writers: list[TranscriptWriter] = []
+
+    def advance(finalize: bool = False) -> dict:
+        writer = TranscriptWriter(final_txt=tmp_path / "final.txt", final_json=tmp_path / "final.json", final_vtt=tmp_path / "final.vtt")
+        writers.append(writer)
+        return advance_merge(
+            cursor_path=cursor_path,
+            chunk_order=[1, 2, 3],
+            load_partial=landed.get,
+            writer=writer,
+            finalize=finalize,
+        )
+
+    landed[2] = chunks[2]
+    assert advance()["position"] == 0
+
+    landed[1] = chunks[1]
+    cursor = advance()
+    assert cursor["position"] == 2
+    # "tres" is still held back by the lookback.
+    assert read_merged_text(tmp_path / "final.txt", cursor) == "uno dos"
+
+    # Output written after the last checkpoint is discarded on resume.
+    with (tmp_path / "final.txt").open("a", encoding="utf-8") as f:
+        f.write(" basura")
+
+    landed[3] = chunks[3]
+    cursor = advance(finalize=True)
+    assert cursor["final"] and cursor["position"] == 3
+
+    expected = tmp_path / "expected"
+    partials = expected / "partials"
+    partials.mkdir(parents=True)
+    for idx, data in chunks.items():
+        (partials / f"{idx:04d}.json").write_text(json.dumps(data), encoding="utf-8")
+    merge_partials(
+        partials_dir=partials,
+        final_json=expected / "final.json",
+        final_txt=expected / "final.txt",
+        final_vtt=expected / "final.vtt",
+    )
+    for name in ("final.txt", "final.json", "final.vtt"):
+        assert (tmp_path / name).read_text(encoding="utf-8") == (expected / name).read_text(encoding="utf-8")
+    assert read_merged_text(tmp_path / "final.txt", cursor) == "uno dos tres cuatro"
+
+    # The reopened session re-reads its files, and the packager still needs both checksums.
+    for name in ("final.txt", "final.json", "final.vtt"):
+        data = (tmp_path / name).read_bytes()
+        assert writers[-1].digests[tmp_path / name] == {"sha256": hashlib.sha256(data).hexdigest(), "crc32": zlib.crc32(data)}
+
+
+def test_incremental_merge_follows_a_growing_chunk_order(tmp_path: Path):
+    # Streaming ingest appends chunks to the order while earlier ones are already merged.
+    landed = {
+        1: {"segments": [{"start": 0.0, "end": 2.0, "text": "uno"}]},
+        2: {"segments": [{"start": 2.0, "end": 4.0, "text": "dos"}]},
+        3: {"segments": [{"start": 4.0, "end": 6.0, "text": "tres"}]},
+    }
+    cursor_path = tmp_path / "cursor.json"
+
+    def advance(order: list[int], finalize: bool = False) -> dict:
+        writer = TranscriptWriter(final_txt=tmp_path / "final.txt")
+        return advance_merge(cursor_path=cursor_path, chunk_order=order, load_partial=landed.get, writer=writer, finalize=finalize)
+
+    assert advance([1, 2])["position"] == 2
+    cursor = advance([1, 2, 3])
+    assert cursor["position"] == 3
+    assert read_merged_text(tmp_path / "final.txt", cursor) == "uno dos"
+
+    # A different prefix invalidates the cursor.
+    cursor = advance([2, 1, 3], finalize=True)
+    assert read_merged_text(tmp_path / "final.txt", cursor) == "dos uno tres"
+
+
+def test_json_segments_are_read_lazily_in_order(tmp_path: Path):
+    segments = [{"start": float(i), "end": i + 0.5, "text": f"seg \"{i}\", ñ [x]"} for i in range(200)]
+    writer = TranscriptWriter(final_txt=tmp_path / "final.txt", final_json=tmp_path / "final.json")
+    with writer:
+        for seg in segments:
+            writer.write(seg)
+
+    # Tiny blocks force objects to straddle reads.
+    assert list(iter_json_segments(tmp_path / "final.json", block_size=7)) == segments
+    assert list(iter_json_segments(tmp_path / "final.json")) == segments
+
+    (tmp_path / "empty.json").write_text(json.dumps({"segments": [], "text": ""}, indent=2), encoding="utf-8")
+    assert list(iter_json_segments(tmp_path / "empty.json", block_size=3)) == []
+
+
+def test_final_merge_without_the_lock_does_not_package(redis_client, storage, make_state, monkeypatch):
+    from transcription_service.workers import merger
+
+    monkeypatch.setattr(merger, "_MERGE_LOCK_SECONDS", 0.2)
+    open_job_store().create(make_state("job-1", JobInput(type="url", value="http://example.com")))
+    redis_client.lock("transcription:job:job-1:merge", timeout=60).acquire()
+
+    with pytest.raises(merger.MergeLockTimeout):
+        merger.merge_job("job-1")
+    assert open_job_store().load("job-1").status == "failed"
+    assert get_queue(QUEUE_PACKAGER).count == 0
+
+
+def test_merge_lock_is_renewed_while_merging(redis_client, storage, make_state, monkeypatch):
+    from transcription_service.workers import merger
+
+    monkeypatch.setattr(merger, "_MERGE_LOCK_SECONDS", 0.3)
+    job = make_state("job-1", JobInput(type="url", value="http://example.com"))
+    held = []
+
+    def slow_merge(**kwargs):
+        time.sleep(0.9)
+        held.append(redis_client.exists("transcription:job:job-1:merge"))
+        return merge.advance_merge(**kwargs)
+
+    monkeypatch.setattr(merger, "advance_merge", slow_merge)
+    cursor = merger.merge_available(job, JobPaths(storage_root(), "job-1"), finalize=True)
+    assert held == [1]
+    assert cursor["final"]
@@ -0,0 +1,53 @@
+﻿import json
+from pathlib import Path
+
+from transcription_service.processing.merge import merge_partials
+from transcription_service.processing.partials import PartialLog
+
+
+def _payload(index: int, start: float, texts: list[str]) -> dict:
+    segments = [{"start": start + i, "end": start + i + 1.0, "text": t} for i, t in enumerate(texts)]
+    return {
+        "chunk_index": index,
+        "chunk_start": start,
+        "chunk_end": start + len(texts),
+        "segments": segments,
+        "text": " ".join(texts),
+    }
+
+
+def test_log_round_trip_and_legacy_partials(tmp_path: Path):
+    log = PartialLog(tmp_path)
+    log.append(_payload(3, 20.0, ["tres"]))
+    log.append(_payload(1, 0.0, ["uno", "dos"]))
+    log.append(_payload(3, 20.0, ["repetido"]))
+    (tmp_path / "0002.json").write_text(json.dumps(_payload(2, 10.0, ["legacy"]), indent=2), encoding="utf-8")
+
+    reader = PartialLog(tmp_path)
+    assert reader.indices() == {1, 2, 3}
+    assert 2 in reader and 4 not in reader
+    assert reader.load(1) == _payload(1, 0.0, ["uno", "dos"])
+    assert reader.load(3)["text"] == "tres"
+    assert [p["chunk_index"] for p in reader.iter_chunks()] == [1, 2, 3]
+
+    merged = merge_partials(
+        partials_dir=tmp_path,
+        final_json=tmp_path / "final.json",
+        final_txt=tmp_path / "final.txt",
+        final_vtt=None,
+        produce_vtt=False,
+    )
+    assert [s["text"] for s in merged] == ["uno", "dos", "legacy", "tres"]
+
+
+def test_log_is_recovered_without_index(tmp_path: Path):
+    log = PartialLog(tmp_path)
+    log.append(_payload(1, 0.0, ["uno"]))
+    log.append(_payload(2, 5.0, ["dos"]))
+    (tmp_path / "segments.idx").unlink()
+    with (tmp_path / "segments.jsonl").open("ab") as f:
+        f.write(b'{"i":3,"s":9')
+
+    reader = PartialLog(tmp_path)
+    assert reader.indices() == {1, 2}
+    assert reader.load(2)["segments"][0]["text"] == "dos"
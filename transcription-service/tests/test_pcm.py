@@ -0,0 +1,59 @@
+﻿import wave
+from pathlib import Path
+
+import numpy as np
+
+from transcription_service.processing.pcm import PcmAudio, PcmWavWriter, open_pcm_audio, read_pcm_wav_info
+
+
+def _write_wav(path: Path, samples: np.ndarray, *, rate: int = 16000) -> None:
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.astype("<i2").tobytes())
+
+
+def test_pcm_audio_slices_without_chunk_files(tmp_path: Path):
+    samples = (np.arange(16000 * 3) % 2000 - 1000).astype(np.int16)
+    wav_path = tmp_path / "audio.wav"
+    _write_wav(wav_path, samples)
+
+    info = read_pcm_wav_info(wav_path)
+    assert info is not None and info.is_normalized
+    assert info.duration == 3.0
+
+    audio = PcmAudio(wav_path)
+    view = audio.slice_int16(1.0, 2.0)
+    assert np.array_equal(view, samples[16000:32000])
+    chunk = audio.slice_float32(1.0, 2.5)
+    assert chunk.dtype == np.float32
+    assert chunk.shape[0] == 24000
+    assert np.allclose(chunk, samples[16000:40000] / 32768.0)
+    assert audio.slice_float32(2.5, 10.0).shape[0] == 8000
+
+
+def test_open_pcm_audio_rejects_other_formats(tmp_path: Path):
+    wav_path = tmp_path / "audio.wav"
+    _write_wav(wav_path, np.zeros(800, dtype=np.int16), rate=8000)
+    assert open_pcm_audio(wav_path) is None
+    assert open_pcm_audio(tmp_path / "missing.wav") is None
+
+
+def test_pcm_wav_writer_is_readable_while_growing(tmp_path: Path):
+    samples = (np.arange(16000 * 2) % 2000 - 1000).astype(np.int16)
+    wav_path = tmp_path / "audio.wav"
+    writer = PcmWavWriter(wav_path)
+    writer.write(samples[:16000].tobytes())
+    writer.flush()
+
+    audio = PcmAudio(wav_path)
+    assert audio.duration == 1.0
+    assert np.array_equal(audio.slice_int16(0.5, 1.0), samples[8000:16000])
+
+    writer.write(samples[16000:].tobytes())
+    writer.close()
+    with wave.open(str(wav_path), "rb") as w:
+        assert w.getnframes() == samples.shape[0]
+        assert w.readframes(w.getnframes()) == samples.tobytes()
+    assert read_pcm_wav_info(wav_path).duration == 2.0
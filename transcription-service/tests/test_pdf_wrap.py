@@ -0,0 +1,88 @@
+﻿import random
+
+from reportlab.pdfgen import canvas
+
+from transcription_service.infrastructure.pdf.reportlab_adapter import ReportLabPdfWriterAdapter, _wrap_text
+
+
+def _wrap_by_joining(c, text: str, max_width: float) -> list[str]:
+    lines: list[str] = []
+    cur: list[str] = []
+    for w in text.split():
+        if c.stringWidth(" ".join(cur + [w])) <= max_width or not cur:
+            cur.append(w)
+        else:
+            lines.append(" ".join(cur))
+            cur = [w]
+    if cur:
+        lines.append(" ".join(cur))
+    return lines
+
+
+def test_wrap_matches_measuring_whole_lines(tmp_path):
+    c = canvas.Canvas(str(tmp_path / "t.pdf"))
+    rng = random.Random(3)
+    vocab = ["hola", "mundo", "transcripcion", "a", "WWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWWW", "año", "ok,"]
+    text = " ".join(rng.choice(vocab) for _ in range(3000))
+
+    for font, size in (("Helvetica", 10), ("Helvetica-Bold", 13)):
+        c.setFont(font, size)
+        assert _wrap_text(c, text, 512) == _wrap_by_joining(c, text, 512)
+
+    assert _wrap_text(c, "   ", 512) == [""]
+
+
+def test_segments_pdf_consumes_an_iterator(tmp_path):
+    consumed = []
+
+    def segments():
+        for i in range(2000):
+            consumed.append(i)
+            yield {"start": i * 37.0, "end": i * 37.0 + 30.0, "text": "palabra " * (i % 40 + 1)}
+
+    pdf = ReportLabPdfWriterAdapter().write_segments_pdf(
+        tmp_path / "t.pdf",
+        title="t",
+        source_url=None,
+        segments=segments(),
+    )
+    data = pdf.read_bytes()
+    assert data.startswith(b"%PDF") and data.count(b"/Type /Page\n") > 50
+    assert len(consumed) == 2000
+
+
+def test_segments_pdf_header_carries_the_duration(tmp_path, monkeypatch):
+    from transcription_service.infrastructure.pdf import reportlab_adapter
+
+    headers = []
+    draw = reportlab_adapter._draw_header_and_sponsor
+
+    def capture(c, **kwargs):
+        headers.append(list(kwargs["transcript_lines"]))
+        return draw(c, **kwargs)
+
+    monkeypatch.setattr(reportlab_adapter, "_draw_header_and_sponsor", capture)
+    segments = [{"start": 0.0, "end": 4.0, "text": "hola"}, {"start": 3700.0, "end": 3725.5, "text": "adios"}]
+    writer = ReportLabPdfWriterAdapter()
+    writer.write_segments_pdf(tmp_path / "a.pdf", title="t", source_url=None, segments=segments)
+    writer.write_segments_pdf(tmp_path / "b.pdf", title="t", source_url=None, segments=iter(segments), duration=3725.5)
+    assert headers == [["Duration: 62:05"], ["Duration: 62:05"]]
+
+
+def test_default_segments_pdf_formats_lines_like_the_adapter(tmp_path):
+    from transcription_service.domain.ports.pdf_writer_port import PdfWriterPort
+
+    class Capture(PdfWriterPort):
+        def write_pdf(self, pdf_path, *, title, source_url, transcript_lines, sponsor_text):
+            self.lines = list(transcript_lines)
+            return pdf_path
+
+    writer = Capture()
+    writer.write_segments_pdf(
+        tmp_path / "t.pdf",
+        title="t",
+        source_url=None,
+        segments=iter([{"start": 3661.9, "end": 3700.0, "text": "hola"}]),
+        sponsor_text="",
+    )
+    assert writer.lines == ["Duration: 61:40", "[01:01:01] hola"]
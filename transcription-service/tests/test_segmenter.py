@@ -1,4 +1,15 @@
-﻿from transcription_service.processing.segmenter import parse_silencedetect_output, segments_from_silence
+﻿import wave
+from pathlib import Path
+
+from transcription_service.processing.segmenter import (
+    Segment,
+    audio_duration_seconds,
+    pack_segments,
+    packing_target_seconds,
+    parse_silencedetect_output,
+    segment_from_silences,
+    segments_from_silence,
+)
 
 
 def test_segmenter_silence_parsing():
@@ -21,3 +32,48 @@ def test_segmenter_splits_long_segments():
     silences = []
     segments = segments_from_silence(silences, duration=5.0, max_chunk_seconds=2)
     assert segments == [(0.0, 2.0), (2.0, 4.0), (4.0, 5.0)]
+
+
+def test_segment_from_silences_uses_wav_header_duration(tmp_path: Path):
+    wav_path = tmp_path / "audio.wav"
+    with wave.open(str(wav_path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\x00\x00" * 16000 * 5)
+
+    duration = audio_duration_seconds(tmp_path / "no-ffprobe", wav_path)
+    assert duration == 5.0
+
+    result = segment_from_silences([(1.0, 2.0)], duration, max_chunk_seconds=120)
+    assert [(s.index, s.start, s.end) for s in result.segments] == [(1, 0.0, 1.0), (2, 2.0, 5.0)]
+
+
+def test_pack_segments_merges_up_to_target():
+    segments = [Segment(index=i + 1, start=s, end=e) for i, (s, e) in enumerate(
+        [(0.0, 2.0), (2.5, 4.0), (4.6, 9.0), (9.5, 11.0), (12.0, 30.0), (31.0, 32.0)]
+    )]
+    packed = pack_segments(segments, target_seconds=10.0)
+    assert [(s.index, s.start, s.end) for s in packed] == [
+        (1, 0.0, 9.0),
+        (2, 9.5, 11.0),
+        (3, 12.0, 30.0),
+        (4, 31.0, 32.0),
+    ]
+
+
+def test_packing_target_follows_parallelism():
+    assert packing_target_seconds(3600, parallelism=10, max_chunk_seconds=120, min_target_seconds=30) == 90.0
+    assert packing_target_seconds(3600, parallelism=1, max_chunk_seconds=120, min_target_seconds=30) == 120.0
+    assert packing_target_seconds(60, parallelism=8, max_chunk_seconds=120, min_target_seconds=30) == 30.0
+
+
+def test_configured_packing_target_is_capped_by_max_chunk(monkeypatch):
+    from transcription_service.settings import settings
+    from transcription_service.workers import splitter
+
+    monkeypatch.setattr(settings, "CHUNK_TARGET_SECONDS", 600.0)
+    monkeypatch.setattr(settings, "MAX_CHUNK_SECONDS", 120)
+    assert splitter._fixed_target_seconds() == 120.0
+    monkeypatch.setattr(settings, "MAX_CHUNK_SECONDS", 0)
+    assert splitter._fixed_target_seconds() == 600.0
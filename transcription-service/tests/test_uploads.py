@@ -0,0 +1,67 @@
+﻿from pathlib import Path
+
+import pytest
+
+from transcription_service.jobs.paths import JobPaths
+from transcription_service.jobs.uploads import PartConflict, UploadSession, add_range, received_offset
+
+
+def test_ranges_coalesce_into_a_contiguous_offset():
+    ranges: list[list[int]] = []
+    ranges = add_range(ranges, 10, 20)
+    assert received_offset(ranges) == 0
+    ranges = add_range(ranges, 30, 40)
+    ranges = add_range(ranges, 0, 10)
+    assert ranges == [[0, 20], [30, 40]]
+    assert received_offset(ranges) == 20
+    ranges = add_range(ranges, 15, 35)
+    assert ranges == [[0, 40]]
+    assert received_offset(add_range(ranges, 5, 8)) == 40
+
+
+def test_session_writes_parts_in_any_order(tmp_path: Path):
+    data = bytes(range(256)) * 40
+    session = UploadSession(JobPaths(tmp_path, "job-1"))
+    session.create(size=len(data), filename="v.mp4", options=None, sha256=None, created_at="t")
+
+    for start in (4096, 0, 8192):
+        end = min(start + 4096, len(data))
+        token = session.reserve(start, end)
+        with session.data_path.open("r+b") as f:
+            f.seek(start)
+            f.write(data[start:end])
+        meta = session.record(token)
+
+    assert received_offset(meta["ranges"]) == len(data)
+    assert meta["inflight"] == []
+    with session.exclusive():
+        session.seal(sha256="s", crc32=0)
+    assert session.paths.original_mp4.read_bytes() == data
+    assert session.load()["sealed"] is True
+    assert session.load()["completed"] is False
+
+
+def test_session_refuses_parts_over_received_or_reserved_bytes(tmp_path: Path, monkeypatch):
+    from transcription_service.jobs import uploads
+
+    session = UploadSession(JobPaths(tmp_path, "job-1"))
+    session.create(size=100, filename="v.mp4", options=None, sha256=None, created_at="t")
+    session.record(session.reserve(0, 50))
+
+    with pytest.raises(PartConflict):
+        session.reserve(40, 60)
+    token = session.reserve(50, 80)
+    with pytest.raises(PartConflict):
+        session.reserve(70, 100)
+
+    # A failed part gives its range back.
+    session.release(token)
+    token = session.reserve(70, 100)
+    assert session.load()["inflight"][0]["start"] == 70
+
+    # So does a reservation whose request never finished.
+    monkeypatch.setattr(uploads, "_RESERVATION_SECONDS", -1)
+    session.reserve(50, 70)
+    session.reserve(50, 70)
+    with pytest.raises(PartConflict):
+        session.reserve(70, 100)
@@ -0,0 +1,143 @@
+﻿import json
+import subprocess
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from transcription_service.infrastructure.downloader import yt_dlp_adapter
+from transcription_service.infrastructure.downloader.yt_dlp_adapter import YtDlpDownloaderAdapter
+from transcription_service.jobs.cancel import CancelWatcher, JobCanceled
+from transcription_service.jobs.logger import JobLogger
+from transcription_service.jobs.models import JobInput, JobOptions
+from transcription_service.jobs.paths import JobPaths
+from transcription_service.jobs.queue import QUEUE_SPLITTER, QUEUE_VIDEO, get_queue
+from transcription_service.jobs.utils import open_job_store, storage_root
+from transcription_service.settings import settings
+from transcription_service.workers import packager, splitter, video
+
+URL = "https://x.com/i/spaces/ABC"
+
+
+class FakeYtDlp:
+    # Stands in for the cancel watcher's runner: writes what yt-dlp would have downloaded.
+    def __init__(self):
+        self.commands: list[list[str]] = []
+
+    def raise_if_canceled(self) -> None:
+        pass
+
+    def run(self, cmd, *, check=True, capture=False, cwd=None):
+        self.commands.append(cmd)
+        if "-J" in cmd:
+            return subprocess.CompletedProcess(cmd, 0, stdout=json.dumps({"title": "Space"}), stderr="")
+        if "bestaudio/best" in cmd:
+            (Path(cwd) / "audio_ABC.m4a.part").write_bytes(b"partial")
+            (Path(cwd) / "audio_ABC.m4a").write_bytes(b"audio")
+        else:
+            (Path(cwd) / "Space_ABC.mp4").write_bytes(b"video")
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+
+@pytest.fixture(autouse=True)
+def fake_tools(monkeypatch):
+    monkeypatch.setattr(yt_dlp_adapter, "which", lambda cmd: cmd)
+    monkeypatch.setattr(video, "ensure_ffmpeg", lambda tools_dir: (Path("ffmpeg"), Path("ffprobe")))
+
+
+def _job(make_state, **options):
+    job = make_state("job-1", JobInput(type="url", value=URL), JobOptions(language="es", **options))
+    open_job_store().create(job)
+    paths = JobPaths(storage_root(), job.job_id)
+    paths.input_dir.mkdir(parents=True)
+    return job, paths, JobLogger(paths.logs_dir / "job.log")
+
+
+def test_download_audio_skips_partial_files(tmp_path):
+    ytdlp = FakeYtDlp()
+    audio = YtDlpDownloaderAdapter(ffmpeg=Path("ffmpeg"), runner=ytdlp.run).download_audio(URL, tmp_path)
+    assert audio.name == "audio_ABC.m4a"
+    assert "bestaudio/best" in ytdlp.commands[0]
+
+
+def test_audio_only_source_leaves_the_video_to_the_video_queue(redis_client, storage, make_state, monkeypatch):
+    monkeypatch.setattr(settings, "VIDEO_FETCH_MODE", "parallel")
+    job, paths, logger = _job(make_state, audio_only=True)
+    ytdlp = FakeYtDlp()
+
+    source = splitter._ensure_source(job, paths, logger, Path("ffmpeg"), runner=ytdlp.run)
+    assert source == paths.input_dir / "source_audio.m4a"
+    assert source.read_bytes() == b"audio"
+    assert not paths.original_mp4.exists()
+    assert not (paths.input_dir / "ytdlp_audio").exists()
+    assert get_queue(QUEUE_VIDEO).count == 1
+    assert get_queue(QUEUE_SPLITTER).count == 0
+
+    # A retried splitter reuses the audio it already has.
+    assert splitter._ensure_source(job, paths, logger, Path("ffmpeg"), runner=ytdlp.run) == source
+    assert len(ytdlp.commands) == 1
+
+
+def test_ensure_video_downloads_once_through_the_watcher(redis_client, storage, make_state):
+    job, paths, logger = _job(make_state, audio_only=True)
+    ytdlp = FakeYtDlp()
+
+    assert video.needs_video(job, paths)
+    assert video.ensure_video(job, paths, logger, ytdlp).read_bytes() == b"video"
+    assert video.ensure_video(job, paths, logger, ytdlp) == paths.original_mp4
+    assert not video.needs_video(job, paths)
+    assert sum("bv*+ba/best" in cmd for cmd in ytdlp.commands) == 1
+    assert list(paths.input_dir.glob("video_*")) == []
+
+
+def test_ensure_video_stops_when_the_job_is_canceled(redis_client, storage, make_state):
+    job, paths, logger = _job(make_state, audio_only=True)
+    watcher = CancelWatcher(redis_client, job.job_id)
+    watcher.trigger()
+
+    with pytest.raises(JobCanceled):
+        video.ensure_video(job, paths, logger, watcher)
+    assert not paths.original_mp4.exists()
+
+
+def test_direct_video_download_renews_its_lock_and_can_be_canceled(redis_client, storage, make_state, monkeypatch):
+    job = make_state("job-1", JobInput(type="url", value="https://example.com/talk.mp4"), JobOptions(language="es"))
+    open_job_store().create(job)
+    paths = JobPaths(storage_root(), job.job_id)
+    watcher = CancelWatcher(redis_client, job.job_id)
+    monkeypatch.setattr(video, "_VIDEO_LOCK_SECONDS", 0.3)
+    held = []
+
+    def slow_download(url, dest, *, check_canceled, **kwargs):
+        time.sleep(0.9)
+        held.append(redis_client.exists("transcription:job:job-1:video"))
+        watcher.trigger()
+        check_canceled()
+
+    monkeypatch.setattr(video, "download_ranged", slow_download)
+    with pytest.raises(JobCanceled):
+        video.ensure_video(job, paths, JobLogger(paths.logs_dir / "job.log"), watcher)
+    assert held == [1]
+    assert not redis_client.exists("transcription:job:job-1:video")
+
+
+def test_packager_delivers_the_transcript_when_the_video_fails(redis_client, storage, make_state, monkeypatch):
+    job, paths, _ = _job(make_state, audio_only=True, produce_pdf=False)
+    paths.merged_dir.mkdir(parents=True)
+    paths.final_txt.write_text("hola\n", encoding="utf-8")
+    paths.final_json.write_text("[]", encoding="utf-8")
+    paths.final_vtt.write_text("WEBVTT\n", encoding="utf-8")
+
+    def fail(*args):
+        raise RuntimeError("yt-dlp exited with 1")
+
+    monkeypatch.setattr(packager, "ensure_video", fail)
+    monkeypatch.setattr(settings, "PACKAGER_STREAM_ZIP", False)
+    packager.package_job(job.job_id)
+
+    state = open_job_store().load(job.job_id)
+    assert state.status == "done"
+    assert state.errors == ["video.mp4 left out of the package: yt-dlp exited with 1"]
+    with zipfile.ZipFile(state.result.zip_path) as zf:
+        assert not any(name.endswith("video.mp4") for name in zf.namelist())
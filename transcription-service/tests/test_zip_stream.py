@@ -0,0 +1,114 @@
+﻿import hashlib
+import io
+import zipfile
+from pathlib import Path
+
+from transcription_service.infrastructure.packaging import zip_stream
+from transcription_service.infrastructure.packaging.zip_stream import (
+    DEFLATED,
+    STORED,
+    HashingWriter,
+    StoredSource,
+    StoredZipLayout,
+    ZipStreamWriter,
+    compression_for,
+    deflate_file,
+    file_checksums,
+)
+
+
+def _write_sources(tmp_path: Path) -> tuple[Path, Path]:
+    video = tmp_path / "original.mp4"
+    video.write_bytes(bytes(range(256)) * 4096)
+    text = tmp_path / "final.txt"
+    text.write_text("hola mundo " * 5000, encoding="utf-8")
+    return video, text
+
+
+def test_written_zip_reads_back_with_zipfile(tmp_path: Path):
+    video, text = _write_sources(tmp_path)
+    assert compression_for("video.mp4") == STORED
+    assert compression_for("transcript.txt") == DEFLATED
+
+    buf = io.BytesIO()
+    writer = ZipStreamWriter(buf)
+    writer.add_file("video.mp4", video)
+    deflated = deflate_file(text)
+    writer.add_deflated("transcript.txt", deflated, mtime=text.stat().st_mtime)
+    writer.close()
+
+    assert len(deflated.data) < deflated.size / 10
+    with zipfile.ZipFile(io.BytesIO(buf.getvalue())) as zf:
+        assert zf.testzip() is None
+        assert [i.compress_type for i in zf.infolist()] == [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+        assert zf.read("video.mp4") == video.read_bytes()
+        assert zf.read("transcript.txt") == text.read_bytes()
+
+
+def test_zip64_records_are_readable(tmp_path: Path, monkeypatch):
+    video, text = _write_sources(tmp_path)
+    # Lower the limit so every size and offset takes the ZIP64 path.
+    monkeypatch.setattr(zip_stream, "_ZIP64_LIMIT", 1000)
+
+    buf = io.BytesIO()
+    writer = ZipStreamWriter(buf)
+    writer.add_deflated("transcript.txt", deflate_file(text), mtime=text.stat().st_mtime)
+    writer.add_file("video.mp4", video)
+    writer.close()
+
+    raw = buf.getvalue()
+    assert b"PK\x06\x06" in raw
+    with zipfile.ZipFile(io.BytesIO(raw)) as zf:
+        assert zf.read("video.mp4") == video.read_bytes()
+        assert zf.read("transcript.txt") == text.read_bytes()
+
+
+def test_entries_and_archive_are_hashed_while_writing(tmp_path: Path):
+    video, text = _write_sources(tmp_path)
+
+    buf = io.BytesIO()
+    out = HashingWriter(buf)
+    writer = ZipStreamWriter(out)
+    stored = writer.add_file("video.mp4", video)
+    deflated = writer.add_deflated("transcript.txt", deflate_file(text), mtime=text.stat().st_mtime)
+    skipped = writer.add_file("again.mp4", video, sha256=False)
+    writer.close()
+
+    assert stored.sha256 == hashlib.sha256(video.read_bytes()).hexdigest()
+    assert deflated.sha256 == hashlib.sha256(text.read_bytes()).hexdigest()
+    assert skipped.sha256 is None
+    assert out.hexdigest() == hashlib.sha256(buf.getvalue()).hexdigest()
+    assert out.size == len(buf.getvalue())
+
+
+def _layout(paths: list[tuple[Path, str]]) -> StoredZipLayout:
+    sources = []
+    for path, name in paths:
+        st = path.stat()
+        crc, _ = file_checksums(path, sha256=False)
+        sources.append(StoredSource(name=name, path=path, size=st.st_size, crc=crc, mtime_ns=st.st_mtime_ns))
+    return StoredZipLayout(sources)
+
+
+def test_stored_layout_streams_any_byte_range(tmp_path: Path):
+    video, text = _write_sources(tmp_path)
+    layout = _layout([(video, "video.mp4"), (text, "transcript.txt")])
+
+    raw = b"".join(layout.iter_bytes())
+    assert len(raw) == layout.size
+    with zipfile.ZipFile(io.BytesIO(raw)) as zf:
+        assert zf.testzip() is None
+        assert zf.read("video.mp4") == video.read_bytes()
+        assert zf.read("transcript.txt") == text.read_bytes()
+
+    cuts = [0, 7, 30, 1024 * 1024 + 3, layout.size - 22, layout.size]
+    pieces = [b"".join(layout.iter_bytes(a, b)) for a, b in zip(cuts, cuts[1:])]
+    assert b"".join(pieces) == raw
+
+    again = StoredZipLayout.from_dict(layout.to_dict(tmp_path), tmp_path)
+    assert again.etag == layout.etag
+    assert b"".join(again.iter_bytes()) == raw
+
+    assert not layout.stale()
+    text.write_text("changed", encoding="utf-8")
+    assert layout.stale()
@@ -2,7 +2,9 @@
 
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Mapping
+
+from ...shared.time__shared_util import duration_header, last_segment_end, segment_timestamp
 
 
 class PdfWriterPort(ABC):
@@ -17,3 +19,27 @@ class PdfWriterPort(ABC):
         sponsor_text: str,
     ) -> Path:
         raise NotImplementedError
+
+    def write_segments_pdf(
+        self,
+        pdf_path: Path,
+        *,
+        title: str | None,
+        source_url: str | None,
+        segments: Iterable[Mapping],
+        sponsor_text: str,
+        duration: float | None = None,
+    ) -> Path:
+        segments = list(segments)
+        if duration is None:
+            duration = last_segment_end(segments)
+        lines = duration_header(duration)
+        for seg in segments:
+            lines.append(f"{segment_timestamp(float(seg['start']))} {seg['text']}")
+        return self.write_pdf(
+            pdf_path,
+            title=title,
+            source_url=source_url,
+            transcript_lines=lines,
+            sponsor_text=sponsor_text,
+        )
@@ -0,0 +1,196 @@
+﻿from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+_BLOCK = 1024 * 1024
+_RETRIES = 3
+
+
+def _never_canceled() -> None:
+    pass
+
+
+class DownloadError(RuntimeError):
+    pass
+
+
+@dataclass
+class DownloadStats:
+    size: int
+    parts: int
+    resumed_parts: int
+    ranged: bool
+
+
+def _range_validator(headers) -> str | None:
+    # If-Range only accepts a strong ETag: a server must ignore the range for a weak one (W/"...") and
+    # send the whole entity, so those fall back to Last-Modified, or to no If-Range at all.
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _probe(session: requests.Session, url: str, timeout: float) -> tuple[int | None, bool, str | None]:
+    # A one-byte range request tells whether the server honors ranges and how big the entity is.
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        validator = _range_validator(r.headers)
+        content_range = r.headers.get("Content-Range", "")
+        if r.status_code == 206 and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            if total.isdigit():
+                return int(total), True, validator
+        length = r.headers.get("Content-Length")
+        return (int(length) if length and length.isdigit() else None), False, validator
+
+
+class _Progress:
+    # Sidecar JSON listing the finished parts; it is only trusted for the same URL, size and validator.
+    def __init__(self, path: Path, identity: dict):
+        self.path = path
+        self.identity = identity
+        self._lock = threading.Lock()
+        self.done: set[int] = set()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = None
+        if data and data.get("identity") == identity:
+            self.done = set(data.get("done", []))
+
+    def mark(self, index: int) -> None:
+        with self._lock:
+            self.done.add(index)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps({"identity": self.identity, "done": sorted(self.done)}), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def _fetch_part(
+    session: requests.Session,
+    url: str,
+    part_path: Path,
+    start: int,
+    end: int,
+    validator: str | None,
+    timeout: float,
+    check_canceled: Callable[[], None],
+) -> None:
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    if validator:
+        headers["If-Range"] = validator
+    last_error: Exception | None = None
+    for _ in range(_RETRIES):
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+                r.raise_for_status()
+                if r.status_code != 206:
+                    # If-Range failed: the remote file changed under us, so earlier parts are unusable.
+                    raise DownloadError(f"server ignored the range request for {url} (status {r.status_code})")
+                written = 0
+                with part_path.open("r+b") as f:
+                    f.seek(start)
+                    for block in r.iter_content(chunk_size=_BLOCK):
+                        check_canceled()
+                        written += len(block)
+                        if written > end - start:
+                            raise DownloadError(f"range {start}-{end - 1} returned too many bytes")
+                        f.write(block)
+            if written != end - start:
+                raise requests.ConnectionError(f"range {start}-{end - 1} ended after {written} bytes")
+            return
+        except DownloadError:
+            raise
+        except requests.RequestException as exc:
+            last_error = exc
+    raise DownloadError(f"range {start}-{end - 1} failed after {_RETRIES} attempts: {last_error}")
+
+
+def _fetch_whole(
+    session: requests.Session,
+    url: str,
+    part_path: Path,
+    expected: int | None,
+    timeout: float,
+    check_canceled: Callable[[], None],
+) -> int:
+    written = 0
+    with session.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        with part_path.open("wb") as f:
+            for block in r.iter_content(chunk_size=_BLOCK):
+                check_canceled()
+                written += len(block)
+                f.write(block)
+    if expected is not None and written != expected:
+        raise DownloadError(f"download ended after {written} of {expected} bytes")
+    return written
+
+
+def download_ranged(
+    url: str,
+    dest: Path,
+    *,
+    connections: int = 4,
+    part_size: int = 16 * 1024 * 1024,
+    timeout: float = 60.0,
+    session: requests.Session | None = None,
+    check_canceled: Callable[[], None] | None = None,
+) -> DownloadStats:
+    # dest only appears once every byte is there: data goes to <dest>.part and finished parts are
+    # recorded in <dest>.part.json, so a restarted worker continues instead of starting over.
+    # check_canceled runs between blocks and stops the download by raising; finished parts stay recorded.
+    check_canceled = check_canceled or _never_canceled
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part_path = dest.with_name(dest.name + ".part")
+    progress_path = dest.with_name(dest.name + ".part.json")
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=max(1, int(connections)))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    size, ranged, validator = _probe(session, url, timeout)
+    if not ranged or not size:
+        size = _fetch_whole(session, url, part_path, size, timeout, check_canceled)
+        os.replace(part_path, dest)
+        progress_path.unlink(missing_ok=True)
+        return DownloadStats(size=size, parts=1, resumed_parts=0, ranged=False)
+
+    progress = _Progress(progress_path, {"url": url, "size": size, "validator": validator, "part_size": part_size})
+    if not part_path.exists() or part_path.stat().st_size != size:
+        progress.done.clear()
+        with part_path.open("wb") as f:
+            f.truncate(size)
+
+    bounds = [(i, start, min(start + part_size, size)) for i, start in enumerate(range(0, size, part_size))]
+    resumed = len(progress.done)
+    todo = [b for b in bounds if b[0] not in progress.done]
+
+    def _run(bound: tuple[int, int, int]) -> None:
+        index, start, end = bound
+        check_canceled()
+        _fetch_part(session, url, part_path, start, end, validator, timeout, check_canceled)
+        progress.mark(index)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(connections))) as pool:
+        for _ in pool.map(_run, todo):
+            pass
+
+    if len(progress.done) != len(bounds) or part_path.stat().st_size != size:
+        raise DownloadError(f"download incomplete: {len(progress.done)}/{len(bounds)} parts")
+    os.replace(part_path, dest)
+    progress_path.unlink(missing_ok=True)
+    return DownloadStats(size=size, parts=len(bounds), resumed_parts=resumed, ranged=True)
@@ -2,8 +2,10 @@
 
 import json
 import re
+import subprocess
 from datetime import datetime
 from pathlib import Path
+from typing import Callable
 
 from ...domain.ports.downloader_port import DownloaderPort
 from ...domain.ports.bulk_downloader_port import BulkDownloaderPort
@@ -11,8 +13,9 @@ from ...shared.fs__shared_util import ensure_directory, run, safe_path_component
 
 
 class YtDlpDownloaderAdapter(DownloaderPort, BulkDownloaderPort):
-    def __init__(self, *, ffmpeg: Path):
+    def __init__(self, *, ffmpeg: Path, runner: Callable[..., subprocess.CompletedProcess] | None = None):
         self.ffmpeg = ffmpeg
+        self._run = runner or run
 
     def _extract_space_id(self, url: str) -> str:
         m = re.search(r"/i/spaces/([A-Za-z0-9]+)", url or "")
@@ -27,7 +30,7 @@ class YtDlpDownloaderAdapter(DownloaderPort, BulkDownloaderPort):
         if cookies_from_browser:
             cmd.extend(["--cookies-from-browser", cookies_from_browser])
 
-        res = run(cmd, capture=True, check=True)
+        res = self._run(cmd, capture=True, check=True)
         data = json.loads(res.stdout or "{}")
 
         title = data.get("title") or ""
@@ -54,7 +57,7 @@ class YtDlpDownloaderAdapter(DownloaderPort, BulkDownloaderPort):
             "-b:a", "192k",
             str(mp4_path),
         ]
-        run(cmd, check=True)
+        self._run(cmd, check=True)
         return mp4_path
 
     def download(self, url: str, out_dir: Path, *, cookies_from_browser: str | None = None) -> Path:
@@ -92,7 +95,7 @@ class YtDlpDownloaderAdapter(DownloaderPort, BulkDownloaderPort):
         if cookies_from_browser:
             cmd.extend(["--cookies-from-browser", cookies_from_browser])
 
-        run(cmd, check=True, cwd=item_dir)
+        self._run(cmd, check=True, cwd=item_dir)
 
         media_files = list(item_dir.glob("*.mp4"))
         if not media_files:
@@ -107,6 +110,61 @@ class YtDlpDownloaderAdapter(DownloaderPort, BulkDownloaderPort):
         media_path = media_files[0]
         return self._ensure_mp4(media_path, item_dir)
 
+    def download_audio(self, url: str, out_dir: Path, *, cookies_from_browser: str | None = None) -> Path:
+        # Only the best audio stream, as delivered (no video, no remux): enough to transcribe.
+        ytdlp = which("yt-dlp")
+        if not ytdlp:
+            raise RuntimeError("yt-dlp not found. Install: pip install -U yt-dlp")
+
+        item_dir = ensure_directory(out_dir)
+        cmd = [
+            ytdlp,
+            "--no-playlist",
+            "-N",
+            "8",
+            "--concurrent-fragments",
+            "8",
+            "-f",
+            "bestaudio/best",
+            "--restrict-filenames",
+            "-o",
+            "audio_%(id)s.%(ext)s",
+            url,
+        ]
+        if cookies_from_browser:
+            cmd.extend(["--cookies-from-browser", cookies_from_browser])
+
+        self._run(cmd, check=True, cwd=item_dir)
+
+        media_files = [p for p in item_dir.glob("audio_*") if p.suffix not in {".part", ".ytdl"}]
+        if not media_files:
+            raise RuntimeError(f"Audio not found in {item_dir}")
+        media_files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        return media_files[0]
+
+    def stream_audio_command(self, url: str, *, cookies_from_browser: str | None = None) -> list[str]:
+        # Best audio written to stdout as it is downloaded, for a consumer that decodes progressively.
+        ytdlp = which("yt-dlp")
+        if not ytdlp:
+            raise RuntimeError("yt-dlp not found. Install: pip install -U yt-dlp")
+
+        cmd = [
+            ytdlp,
+            "--no-playlist",
+            "--quiet",
+            "--no-part",
+            "--ffmpeg-location",
+            str(self.ffmpeg),
+            "-f",
+            "bestaudio/best",
+            "-o",
+            "-",
+            url,
+        ]
+        if cookies_from_browser:
+            cmd.extend(["--cookies-from-browser", cookies_from_browser])
+        return cmd
+
     def download_all_audio(
         self,
         url: str,
@@ -141,4 +199,4 @@ class YtDlpDownloaderAdapter(DownloaderPort, BulkDownloaderPort):
         if cookies_from_browser:
             cmd.extend(["--cookies-from-browser", cookies_from_browser])
 
-        run(cmd, check=True, cwd=input_dir)
+        self._run(cmd, check=True, cwd=input_dir)
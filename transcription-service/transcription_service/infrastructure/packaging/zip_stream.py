@@ -0,0 +1,373 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+from ...shared.fs__shared_util import file_checksums
+
+
+STORED = 0
+DEFLATED = 8
+
+# Already-compressed containers gain nothing from deflate and cost the most CPU.
+MEDIA_SUFFIXES = {
+    ".mp4", ".m4a", ".m4v", ".mov", ".mkv", ".webm", ".mp3", ".aac", ".ogg", ".opus",
+    ".flac", ".zip", ".gz", ".jpg", ".jpeg", ".png", ".webp",
+}
+
+_BLOCK = 1024 * 1024
+_MAX32 = 0xFFFFFFFF
+_ZIP64_LIMIT = _MAX32
+_FLAG_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+
+def compression_for(name: str) -> int:
+    return STORED if Path(name).suffix.lower() in MEDIA_SUFFIXES else DEFLATED
+
+
+def _dos_datetime(mtime: float) -> tuple[int, int]:
+    t = time.localtime(mtime)
+    year = max(t.tm_year, 1980)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+@dataclass
+class DeflatedData:
+    data: bytes
+    crc: int
+    size: int
+    sha256: str | None
+
+
+def deflate_file(path: Path, *, level: int = 6, sha256: bool = True) -> DeflatedData:
+    # zlib and hashlib release the GIL on large buffers, so several of these can run on threads.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    digest = hashlib.sha256() if sha256 else None
+    parts: list[bytes] = []
+    crc = 0
+    size = 0
+    with Path(path).open("rb") as f:
+        while block := f.read(_BLOCK):
+            crc = zlib.crc32(block, crc)
+            if digest is not None:
+                digest.update(block)
+            size += len(block)
+            parts.append(compressor.compress(block))
+    parts.append(compressor.flush())
+    return DeflatedData(
+        data=b"".join(parts),
+        crc=crc,
+        size=size,
+        sha256=digest.hexdigest() if digest is not None else None,
+    )
+
+
+def deflate_bytes(data: bytes, *, level: int = 6) -> DeflatedData:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    return DeflatedData(data=compressed, crc=zlib.crc32(data), size=len(data), sha256=hashlib.sha256(data).hexdigest())
+
+
+class HashingWriter:
+    def __init__(self, out: BinaryIO):
+        self._out = out
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._digest.update(data)
+        self.size += len(data)
+        return self._out.write(data)
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    method: int
+    mtime: float
+    offset: int
+    size: int = 0
+    compressed_size: int = 0
+    crc: int = 0
+    descriptor: bool = False
+    sha256: str | None = None
+
+    @property
+    def zip64(self) -> bool:
+        return self.size >= _ZIP64_LIMIT or self.compressed_size >= _ZIP64_LIMIT
+
+
+def _local_header(entry: ZipEntry) -> bytes:
+    name = entry.name.encode("utf-8")
+    dos_time, dos_date = _dos_datetime(entry.mtime)
+    flags = _FLAG_UTF8 | (_FLAG_DESCRIPTOR if entry.descriptor else 0)
+    extra = b""
+    crc = 0 if entry.descriptor else entry.crc
+    if entry.zip64:
+        extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, entry.compressed_size)
+        sizes = (_MAX32, _MAX32)
+    else:
+        sizes = (entry.compressed_size, entry.size)
+    return struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034B50,
+        45 if entry.zip64 else 20,
+        flags,
+        entry.method,
+        dos_time,
+        dos_date,
+        crc,
+        sizes[0],
+        sizes[1],
+        len(name),
+        len(extra),
+    ) + name + extra
+
+
+def _data_descriptor(entry: ZipEntry) -> bytes:
+    if entry.zip64:
+        return struct.pack("<IIQQ", 0x08074B50, entry.crc, entry.compressed_size, entry.size)
+    return struct.pack("<IIII", 0x08074B50, entry.crc, entry.compressed_size, entry.size)
+
+
+def _central_header(entry: ZipEntry) -> bytes:
+    name = entry.name.encode("utf-8")
+    dos_time, dos_date = _dos_datetime(entry.mtime)
+    flags = _FLAG_UTF8 | (_FLAG_DESCRIPTOR if entry.descriptor else 0)
+    extra_fields: list[int] = []
+    size, csize, offset = entry.size, entry.compressed_size, entry.offset
+    if size >= _ZIP64_LIMIT:
+        extra_fields.append(size)
+        size = _MAX32
+    if csize >= _ZIP64_LIMIT:
+        extra_fields.append(csize)
+        csize = _MAX32
+    if offset >= _ZIP64_LIMIT:
+        extra_fields.append(offset)
+        offset = _MAX32
+    extra = b""
+    if extra_fields:
+        extra = struct.pack("<HH", 0x0001, 8 * len(extra_fields)) + struct.pack(f"<{len(extra_fields)}Q", *extra_fields)
+    version = 45 if extra_fields else 20
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50,
+        (3 << 8) | version,
+        version,
+        flags,
+        entry.method,
+        dos_time,
+        dos_date,
+        entry.crc,
+        csize,
+        size,
+        len(name),
+        len(extra),
+        0,
+        0,
+        0,
+        0o100644 << 16,
+        offset,
+    ) + name + extra
+
+
+def _end_records(entries: list[ZipEntry], cd_offset: int, cd_size: int) -> bytes:
+    count = len(entries)
+    out = b""
+    if count >= 0xFFFF or cd_offset >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        out += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, (3 << 8) | 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        out += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+        count = min(count, 0xFFFF)
+        cd_size = _MAX32 if cd_size >= _ZIP64_LIMIT else cd_size
+        cd_offset = _MAX32 if cd_offset >= _ZIP64_LIMIT else cd_offset
+    out += struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0)
+    return out
+
+
+class ZipStreamWriter:
+    # Writes strictly front to back (no seeking), so the output can be a pipe or be hashed as it goes.
+    def __init__(self, out: BinaryIO):
+        self._out = out
+        self.offset = 0
+        self.entries: list[ZipEntry] = []
+
+    def _write(self, data: bytes) -> None:
+        self._out.write(data)
+        self.offset += len(data)
+
+    def add_file(self, name: str, path: Path, *, sha256: bool = True) -> ZipEntry:
+        path = Path(path)
+        st = path.stat()
+        entry = ZipEntry(
+            name=name,
+            method=STORED,
+            mtime=st.st_mtime,
+            offset=self.offset,
+            size=st.st_size,
+            compressed_size=st.st_size,
+            descriptor=True,
+        )
+        self._write(_local_header(entry))
+        digest = hashlib.sha256() if sha256 else None
+        crc = 0
+        written = 0
+        with path.open("rb") as f:
+            while block := f.read(_BLOCK):
+                crc = zlib.crc32(block, crc)
+                if digest is not None:
+                    digest.update(block)
+                written += len(block)
+                self._write(block)
+        if written != entry.size:
+            raise RuntimeError(f"{path} changed size while packaging")
+        entry.crc = crc
+        entry.sha256 = digest.hexdigest() if digest is not None else None
+        self._write(_data_descriptor(entry))
+        self.entries.append(entry)
+        return entry
+
+    def add_deflated(self, name: str, deflated: DeflatedData, *, mtime: float) -> ZipEntry:
+        entry = ZipEntry(
+            name=name,
+            method=DEFLATED,
+            mtime=mtime,
+            offset=self.offset,
+            size=deflated.size,
+            compressed_size=len(deflated.data),
+            crc=deflated.crc,
+            sha256=deflated.sha256,
+        )
+        self._write(_local_header(entry))
+        self._write(deflated.data)
+        self.entries.append(entry)
+        return entry
+
+    def close(self) -> None:
+        cd_offset = self.offset
+        for entry in self.entries:
+            self._write(_central_header(entry))
+        self._write(_end_records(self.entries, cd_offset, self.offset - cd_offset))
+
+
+@dataclass
+class StoredSource:
+    name: str
+    path: Path
+    size: int
+    crc: int
+    mtime_ns: int
+
+    @property
+    def mtime(self) -> float:
+        return self.mtime_ns / 1e9
+
+
+class StoredZipLayout:
+    # Stored entries whose CRCs are known up front: every header is computed before any data is read,
+    # so the archive has a fixed size and identity and any byte range of it can be produced on its own.
+    def __init__(self, sources: list[StoredSource]):
+        self.sources = sources
+        self.entries: list[ZipEntry] = []
+        self._parts: list[tuple[int, bytes | StoredSource]] = []
+        offset = 0
+        for src in sources:
+            entry = ZipEntry(
+                name=src.name,
+                method=STORED,
+                mtime=src.mtime,
+                offset=offset,
+                size=src.size,
+                compressed_size=src.size,
+                crc=src.crc,
+            )
+            header = _local_header(entry)
+            self._parts.append((offset, header))
+            offset += len(header)
+            self._parts.append((offset, src))
+            offset += src.size
+            self.entries.append(entry)
+        central = b"".join(_central_header(e) for e in self.entries)
+        self._parts.append((offset, central + _end_records(self.entries, offset, len(central))))
+        self.size = offset + len(self._parts[-1][1])
+
+    @property
+    def etag(self) -> str:
+        identity = [[s.name, s.size, s.crc, s.mtime_ns] for s in self.sources]
+        return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()
+
+    def stale(self) -> bool:
+        for src in self.sources:
+            try:
+                st = src.path.stat()
+            except OSError:
+                return True
+            if st.st_size != src.size or st.st_mtime_ns != src.mtime_ns:
+                return True
+        return False
+
+    def iter_bytes(self, start: int = 0, end: int | None = None) -> Iterator[bytes]:
+        end = self.size if end is None else min(end, self.size)
+        for part_start, part in self._parts:
+            length = len(part) if isinstance(part, bytes) else part.size
+            lo = max(start - part_start, 0)
+            hi = min(end - part_start, length)
+            if lo >= hi:
+                continue
+            if isinstance(part, bytes):
+                yield part[lo:hi]
+            else:
+                yield from _read_range(part.path, lo, hi)
+
+    def to_dict(self, root: Path) -> dict:
+        return {
+            "size": self.size,
+            "etag": self.etag,
+            "entries": [
+                {
+                    "name": s.name,
+                    "path": s.path.relative_to(root).as_posix(),
+                    "size": s.size,
+                    "crc32": s.crc,
+                    "mtime_ns": s.mtime_ns,
+                }
+                for s in self.sources
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, root: Path) -> "StoredZipLayout":
+        return cls([
+            StoredSource(
+                name=e["name"],
+                path=Path(root) / e["path"],
+                size=int(e["size"]),
+                crc=int(e["crc32"]),
+                mtime_ns=int(e["mtime_ns"]),
+            )
+            for e in data["entries"]
+        ])
+
+
+def _read_range(path: Path, start: int, end: int) -> Iterator[bytes]:
+    with Path(path).open("rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(remaining, _BLOCK))
+            if not block:
+                raise RuntimeError(f"{path} is shorter than its packaged size")
+            remaining -= len(block)
+            yield block
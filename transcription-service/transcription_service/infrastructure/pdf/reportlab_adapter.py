@@ -2,31 +2,58 @@
 
 import re
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Mapping, Sequence
 
 from ...domain.ports.pdf_writer_port import PdfWriterPort
+from ...shared.time__shared_util import duration_header, last_segment_end, segment_timestamp
 
 DEFAULT_SPONSOR_TEXT = "Esta transcripcion fue patrocinada por mi Deus Raed, Akuuuuum"
 
 
+# Word widths per (font, size). Standard fonts have no kerning, so a line is as wide as its words plus
+# its spaces and every word only has to be measured once.
+_WIDTH_CACHES: dict[tuple[str, float], dict[str, float]] = {}
+_WIDTH_CACHE_MAX_WORDS = 200_000
+
+
+def _font_widths(c) -> dict[str, float]:
+    key = (c._fontname, float(c._fontsize))
+    widths = _WIDTH_CACHES.get(key)
+    if widths is None or len(widths) > _WIDTH_CACHE_MAX_WORDS:
+        widths = _WIDTH_CACHES[key] = {}
+    return widths
+
+
 def _wrap_text(c, text: str, max_width: float) -> list[str]:
     words = (text or "").split()
     if not words:
         return [""]
 
+    widths = _font_widths(c)
+    space = widths.get(" ")
+    if space is None:
+        space = widths[" "] = c.stringWidth(" ")
+
     lines: list[str] = []
     cur: list[str] = []
+    cur_width = 0.0
 
     for w in words:
-        test = (" ".join(cur + [w])).strip()
-        if c.stringWidth(test) <= max_width or not cur:
+        width = widths.get(w)
+        if width is None:
+            width = widths[w] = c.stringWidth(w)
+        if not cur:
+            cur = [w]
+            cur_width = width
+        elif cur_width + space + width <= max_width:
             cur.append(w)
+            cur_width += space + width
         else:
             lines.append(" ".join(cur))
             cur = [w]
+            cur_width = width
 
-    if cur:
-        lines.append(" ".join(cur))
+    lines.append(" ".join(cur))
     return lines
 
 
@@ -115,6 +142,54 @@ def _draw_header_and_sponsor(
     return y
 
 
+class _PdfBody:
+    # Page geometry shared by both writers; the canvas only ever holds the page being drawn.
+    body_font = "Helvetica"
+    body_size = 10
+    leading = 14
+    margin_x = 50
+    bottom_y = 50
+
+    def __init__(self, pdf_path: Path, *, title, source_url, header_lines: Iterable[str], sponsor_text: str):
+        from reportlab.lib.pagesizes import LETTER
+        from reportlab.pdfgen import canvas
+
+        self.c = canvas.Canvas(str(pdf_path), pagesize=LETTER, pageCompression=1)
+        page_w, page_h = LETTER
+        self.max_width = page_w - 2 * self.margin_x
+        self.top_y = page_h - 60
+
+        y = _draw_header_and_sponsor(
+            self.c,
+            letter_pagesize=LETTER,
+            x=self.margin_x,
+            y_top=page_h - 50,
+            max_width=self.max_width,
+            title=title,
+            source_url=source_url,
+            transcript_lines=header_lines,
+            sponsor_text=sponsor_text,
+        )
+        self.c.setFont(self.body_font, self.body_size)
+        self.y = min(y, self.top_y)
+
+    def next_page(self) -> None:
+        self.c.showPage()
+        self.c.setFont(self.body_font, self.body_size)
+        self.y = self.top_y
+
+    def gap(self, height: float) -> None:
+        self.y -= height
+        if self.y < self.bottom_y:
+            self.next_page()
+
+    def draw(self, x: float, text: str) -> None:
+        if self.y < self.bottom_y:
+            self.next_page()
+        self.c.drawString(x, self.y, text)
+        self.y -= self.leading
+
+
 class ReportLabPdfWriterAdapter(PdfWriterPort):
     def write_pdf(
         self,
@@ -125,60 +200,66 @@ class ReportLabPdfWriterAdapter(PdfWriterPort):
         transcript_lines: Iterable[str],
         sponsor_text: str = DEFAULT_SPONSOR_TEXT,
     ) -> Path:
-        from reportlab.lib.pagesizes import LETTER
-        from reportlab.pdfgen import canvas
-
         pdf_path = Path(pdf_path)
-
-        c = canvas.Canvas(str(pdf_path), pagesize=LETTER)
-        page_w, page_h = LETTER
-
-        margin_x = 50
-        max_width = page_w - 2 * margin_x
-
-        body_font = "Helvetica"
-        body_size = 10
-        leading = 14
-
-        top_y_default = page_h - 60
-        bottom_y = 50
-
-        y = page_h - 50
-        y = _draw_header_and_sponsor(
-            c,
-            letter_pagesize=LETTER,
-            x=margin_x,
-            y_top=y,
-            max_width=max_width,
+        transcript_lines = list(transcript_lines)
+        body = _PdfBody(
+            pdf_path,
             title=title,
             source_url=source_url,
-            transcript_lines=transcript_lines,
+            header_lines=transcript_lines,
             sponsor_text=sponsor_text,
         )
 
-        c.setFont(body_font, body_size)
-        y = min(y, top_y_default)
-
-        def next_page():
-            nonlocal y
-            c.showPage()
-            c.setFont(body_font, body_size)
-            y = top_y_default
-
         for raw in _iter_clean_transcript_lines(transcript_lines):
             line = (raw or "")
             if line == "":
-                y -= 8
-                if y < bottom_y:
-                    next_page()
+                body.gap(8)
                 continue
 
-            wrapped = _wrap_text(c, line, max_width=max_width)
-            for wl in wrapped:
-                if y < bottom_y:
-                    next_page()
-                c.drawString(margin_x, y, wl)
-                y -= leading
+            for wl in _wrap_text(body.c, line, max_width=body.max_width):
+                body.draw(body.margin_x, wl)
+
+        body.c.save()
+        return pdf_path
+
+    def write_segments_pdf(
+        self,
+        pdf_path: Path,
+        *,
+        title: str | None,
+        source_url: str | None,
+        segments: Iterable[Mapping],
+        sponsor_text: str = DEFAULT_SPONSOR_TEXT,
+        duration: float | None = None,
+    ) -> Path:
+        # Segments are consumed one at a time (the packager reads them lazily from the merged
+        # output), so the transcript is never held in memory as a whole. The header is drawn first,
+        # so a lazy caller passes the duration (the last segment's end) up front.
+        pdf_path = Path(pdf_path)
+        if duration is None and isinstance(segments, Sequence):
+            duration = last_segment_end(segments)
+        body = _PdfBody(
+            pdf_path,
+            title=title,
+            source_url=source_url,
+            header_lines=duration_header(duration),
+            sponsor_text=sponsor_text,
+        )
 
-        c.save()
+        indent_for: dict[int, float] = {}
+        for seg in segments:
+            text = (seg.get("text") or "").strip()
+            if not text:
+                continue
+            stamp = segment_timestamp(float(seg.get("start", 0.0) or 0.0))
+            # Helvetica digits share one width, so the hanging indent only depends on the stamp length.
+            indent = indent_for.get(len(stamp))
+            if indent is None:
+                indent = indent_for[len(stamp)] = body.c.stringWidth(stamp + " ")
+            wrapped = _wrap_text(body.c, text, max_width=body.max_width - indent)
+            body.draw(body.margin_x, f"{stamp} {wrapped[0]}")
+            for wl in wrapped[1:]:
+                body.draw(body.margin_x + indent, wl)
+
+        body.c.save()
         return pdf_path
@@ -0,0 +1,100 @@
+﻿from __future__ import annotations
+
+import time
+from typing import Iterable
+from uuid import uuid4
+
+from redis import Redis
+
+
+_FIRE_IF_DRAINED = """
+if redis.call('SCARD', KEYS[1]) == 0 and redis.call('GET', KEYS[2]) == '1' then
+  if redis.call('SETNX', KEYS[3], '1') == 1 then
+    redis.call('EXPIRE', KEYS[3], ARGV[1])
+    return 1
+  end
+end
+return 0
+"""
+
+_ARRIVE = """
+redis.call('SREM', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[4], ARGV[1])
+redis.call('EXPIRE', KEYS[4], ARGV[2])
+""" + _FIRE_IF_DRAINED.replace("ARGV[1]", "ARGV[2]")
+
+# A chunk job only starts if its ingest generation is still current; it is then counted as running
+# until it finishes or its lease runs out.
+_START = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+  return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1] .. ':' .. ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+_SEAL = """
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[1])
+""" + _FIRE_IF_DRAINED
+
+
+class ChunkBarrier:
+    def __init__(self, redis: Redis, job_id: str, *, ttl_seconds: int = 7 * 24 * 3600):
+        self.redis = redis
+        self.job_id = job_id
+        self.ttl_seconds = int(ttl_seconds)
+        self._arrive = redis.register_script(_ARRIVE)
+        self._seal = redis.register_script(_SEAL)
+        self._start = redis.register_script(_START)
+
+    def _key(self, name: str) -> str:
+        return f"transcription:job:{self.job_id}:barrier:{name}"
+
+    @property
+    def _keys(self) -> list[str]:
+        return [self._key("pending"), self._key("sealed"), self._key("fired"), self._key("done")]
+
+    def reset(self) -> None:
+        self.redis.delete(*self._keys)
+
+    def begin_generation(self) -> str:
+        # Chunk jobs queued by an earlier ingest carry its generation and are refused from now on.
+        generation = uuid4().hex
+        self.redis.set(self._key("generation"), generation, ex=self.ttl_seconds)
+        return generation
+
+    def start(self, index: int, generation: str, *, lease_seconds: float) -> bool:
+        deadline = time.time() + lease_seconds
+        keys = [self._key("generation"), self._key("running")]
+        return bool(self._start(keys=keys, args=[generation, int(index), deadline, self.ttl_seconds]))
+
+    def finish(self, index: int, generation: str) -> None:
+        self.redis.zrem(self._key("running"), f"{generation}:{int(index)}")
+
+    def running_before(self, generation: str) -> int:
+        # Chunk jobs of earlier generations that started and have neither finished nor outlived their lease.
+        live = self.redis.zrangebyscore(self._key("running"), time.time(), "+inf")
+        prefix = f"{generation}:"
+        return sum(1 for m in live if not (m.decode() if isinstance(m, bytes) else m).startswith(prefix))
+
+    def expect(self, indices: Iterable[int]) -> None:
+        values = [int(i) for i in indices]
+        if not values:
+            return
+        pipe = self.redis.pipeline()
+        pipe.sadd(self._key("pending"), *values)
+        pipe.expire(self._key("pending"), self.ttl_seconds)
+        pipe.execute()
+
+    def seal(self) -> bool:
+        return bool(self._seal(keys=self._keys, args=[self.ttl_seconds]))
+
+    def arrive(self, index: int) -> bool:
+        return bool(self._arrive(keys=self._keys, args=[int(index), self.ttl_seconds]))
+
+    def remaining(self) -> int:
+        return int(self.redis.scard(self._key("pending")))
+
+    def done(self) -> int:
+        return int(self.redis.scard(self._key("done")))
@@ -0,0 +1,168 @@
+﻿from __future__ import annotations
+
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from redis import Redis
+
+
+CANCEL_CHANNEL = "transcription:cancel"
+CANCEL_TTL_SECONDS = 7 * 24 * 3600
+
+
+class JobCanceled(InterruptedError):
+    pass
+
+
+def cancel_key(job_id: str) -> str:
+    return f"transcription:job:{job_id}:cancel"
+
+
+def request_cancel(redis: Redis, job_id: str) -> None:
+    pipe = redis.pipeline()
+    pipe.set(cancel_key(job_id), "1", ex=CANCEL_TTL_SECONDS)
+    pipe.publish(CANCEL_CHANNEL, job_id)
+    pipe.execute()
+
+
+def is_canceled(redis: Redis, job_id: str) -> bool:
+    return bool(redis.exists(cancel_key(job_id)))
+
+
+def _kill(proc: subprocess.Popen) -> None:
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+class CancelWatcher:
+    def __init__(self, redis: Redis, job_id: str, *, poll_interval: float = 0.5, recheck_seconds: float = 5.0):
+        self.redis = redis
+        self.job_id = job_id
+        self.poll_interval = poll_interval
+        self.recheck_seconds = recheck_seconds
+        self.event = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._procs: set[subprocess.Popen] = set()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def canceled(self) -> bool:
+        return self.event.is_set()
+
+    def raise_if_canceled(self) -> None:
+        if self.event.is_set():
+            raise JobCanceled(self.job_id)
+
+    def trigger(self) -> None:
+        self.event.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            _kill(proc)
+
+    def _listen(self) -> None:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(CANCEL_CHANNEL)
+            # A cancel issued before the subscription was active is only visible through the key.
+            if is_canceled(self.redis, self.job_id):
+                self.trigger()
+                return
+            last_check = time.monotonic()
+            while not self._stop.is_set():
+                message = pubsub.get_message(timeout=self.poll_interval)
+                if message and message.get("data") in (self.job_id, self.job_id.encode()):
+                    self.trigger()
+                    return
+                if time.monotonic() - last_check >= self.recheck_seconds:
+                    last_check = time.monotonic()
+                    if is_canceled(self.redis, self.job_id):
+                        self.trigger()
+                        return
+        except Exception:
+            # Lost pub/sub connection: fall back to polling the key.
+            while not self._stop.wait(self.recheck_seconds):
+                try:
+                    if is_canceled(self.redis, self.job_id):
+                        self.trigger()
+                        return
+                except Exception:
+                    continue
+        finally:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+    def start(self) -> "CancelWatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen, name=f"cancel-{self.job_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval * 2)
+            self._thread = None
+
+    def __enter__(self) -> "CancelWatcher":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.stop()
+
+    @contextmanager
+    def spawn(self, cmd: list[str], **kwargs) -> Iterator[subprocess.Popen]:
+        # For processes the caller talks to through pipes; it is killed on cancel and on any error.
+        self.raise_if_canceled()
+        if os.name != "nt":
+            kwargs["start_new_session"] = True
+        proc = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._procs.add(proc)
+        try:
+            if self.event.is_set():
+                _kill(proc)
+            yield proc
+        finally:
+            _kill(proc)
+            proc.wait()
+            with self._lock:
+                self._procs.discard(proc)
+
+    def run(self, cmd: list[str], *, check: bool = True, capture: bool = False, cwd: Path | None = None):
+        self.raise_if_canceled()
+        kwargs = {"cwd": str(cwd) if cwd else None}
+        if capture:
+            kwargs.update(stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+        if os.name != "nt":
+            kwargs["start_new_session"] = True
+        proc = subprocess.Popen(cmd, **kwargs)
+        with self._lock:
+            self._procs.add(proc)
+        try:
+            if self.event.is_set():
+                _kill(proc)
+            stdout, stderr = proc.communicate()
+        finally:
+            with self._lock:
+                self._procs.discard(proc)
+        self.raise_if_canceled()
+        if check and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output=stdout, stderr=stderr)
+        return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
@@ -0,0 +1,83 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+from redis import Redis
+
+from .models import JobOptions
+
+
+# Options that change how a job runs but not what it produces.
+_RUNTIME_OPTIONS = {"max_parallel_chunks", "cookies_from_browser", "audio_only"}
+
+_REPLACE_IF = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+  return 1
+end
+return 0
+"""
+
+_DELETE_IF = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def url_fingerprint(url: str) -> str:
+    parts = urlsplit(url.strip())
+    normalized = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ""))
+    return "url:" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def path_fingerprint(path: Path) -> str:
+    # Hashing a local file here would block the request; identity plus size and mtime is enough.
+    p = Path(path).resolve()
+    st = p.stat()
+    raw = f"{p}:{st.st_size}:{st.st_mtime_ns}"
+    return "path:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def upload_fingerprint(sha256: str) -> str:
+    return "sha256:" + sha256
+
+
+def options_hash(options: JobOptions) -> str:
+    data = options.model_dump(mode="json", exclude=_RUNTIME_OPTIONS)
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class JobDedupeIndex:
+    def __init__(self, redis: Redis, *, ttl_seconds: int = 7 * 24 * 3600):
+        self.redis = redis
+        self.ttl_seconds = int(ttl_seconds)
+        self._replace = redis.register_script(_REPLACE_IF)
+        self._delete = redis.register_script(_DELETE_IF)
+
+    @staticmethod
+    def key(fingerprint: str, opts_hash: str) -> str:
+        return f"transcription:dedupe:{fingerprint}:{opts_hash}"
+
+    def lookup(self, fingerprint: str, opts_hash: str) -> str | None:
+        value = self.redis.get(self.key(fingerprint, opts_hash))
+        if value is None:
+            return None
+        return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+    def claim(self, fingerprint: str, opts_hash: str, job_id: str) -> str:
+        key = self.key(fingerprint, opts_hash)
+        if self.redis.set(key, job_id, nx=True, ex=self.ttl_seconds):
+            return job_id
+        return self.lookup(fingerprint, opts_hash) or self.claim(fingerprint, opts_hash, job_id)
+
+    def replace(self, fingerprint: str, opts_hash: str, old_job_id: str, job_id: str) -> bool:
+        keys = [self.key(fingerprint, opts_hash)]
+        return bool(self._replace(keys=keys, args=[old_job_id, job_id, self.ttl_seconds]))
+
+    def release(self, fingerprint: str, opts_hash: str, job_id: str) -> bool:
+        return bool(self._delete(keys=[self.key(fingerprint, opts_hash)], args=[job_id]))
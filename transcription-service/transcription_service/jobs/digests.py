@@ -0,0 +1,52 @@
+﻿from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from .paths import JobPaths
+
+
+_LOCK = threading.Lock()
+
+
+def load_digests(paths: JobPaths) -> dict[str, dict]:
+    try:
+        return json.loads(paths.digests_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def record_digest(paths: JobPaths, path: Path, sha256: str, *, crc32: int | None = None) -> None:
+    # Size and mtime are kept so a file rewritten after it was hashed is not trusted.
+    st = Path(path).stat()
+    rel = Path(path).relative_to(paths.job_dir).as_posix()
+    with _LOCK:
+        digests = load_digests(paths)
+        digests[rel] = {"sha256": sha256, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if crc32 is not None:
+            digests[rel]["crc32"] = crc32
+        paths.job_dir.mkdir(parents=True, exist_ok=True)
+        tmp = paths.digests_path.with_name(paths.digests_path.name + ".tmp")
+        tmp.write_text(json.dumps(digests, indent=2), encoding="utf-8")
+        os.replace(tmp, paths.digests_path)
+
+
+def known_entry(digests: dict[str, dict], paths: JobPaths, path: Path) -> dict | None:
+    rel = Path(path).relative_to(paths.job_dir).as_posix()
+    entry = digests.get(rel)
+    if not entry:
+        return None
+    try:
+        st = Path(path).stat()
+    except OSError:
+        return None
+    if st.st_size != entry.get("size") or st.st_mtime_ns != entry.get("mtime_ns"):
+        return None
+    return entry
+
+
+def known_digest(digests: dict[str, dict], paths: JobPaths, path: Path) -> str | None:
+    entry = known_entry(digests, paths, path)
+    return entry.get("sha256") if entry else None
@@ -0,0 +1,30 @@
+﻿from __future__ import annotations
+
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+from redis.exceptions import LockError
+from redis.lock import Lock
+
+
+@contextmanager
+def keep_alive(lock: Lock) -> Iterator[None]:
+    # Renews a held lock every third of its timeout while the block runs. The lock must be created with
+    # thread_local=False, or the renewing thread cannot see its token.
+    stop = threading.Event()
+
+    def renew() -> None:
+        while not stop.wait(lock.timeout / 3):
+            try:
+                lock.reacquire()
+            except LockError:
+                return
+
+    thread = threading.Thread(target=renew, name=f"lock-{lock.name}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
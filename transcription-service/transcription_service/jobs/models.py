@@ -7,16 +7,19 @@ from pydantic import BaseModel, Field
 class JobInput(BaseModel):
     type: Literal["url", "path", "upload"]
     value: str
+    sha256: str | None = None
 
 
 class JobOptions(BaseModel):
     language: str
-    chunk_mode: Literal["silence", "vad"] = "silence"
+    chunk_mode: Literal["silence", "vad", "energy"] = "silence"
     max_parallel_chunks: int = 2
     produce_vtt: bool = True
     produce_json: bool = True
     produce_pdf: bool = True
     cookies_from_browser: str | None = None
+    audio_only: bool = False
+    include_video: bool = True
 
 
 class JobProgress(BaseModel):
@@ -35,6 +38,9 @@ class JobTimestamps(BaseModel):
 class JobResult(BaseModel):
     zip_path: str | None = None
     download_name: str | None = None
+    zip_sha256: str | None = None
+    zip_size: int | None = None
+    zip_etag: str | None = None
 
 
 class JobState(BaseModel):
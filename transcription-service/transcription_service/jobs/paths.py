@@ -18,7 +18,10 @@ class JobPaths:
 
         self.state_path = self.job_dir / "job_state.json"
         self.chunks_meta_path = self.job_dir / "chunks.json"
+        self.chunks_stream_path = self.job_dir / "chunks.stream.jsonl"
+        self.silences_path = self.job_dir / "silences.json"
         self.manifest_path = self.job_dir / "manifest.json"
+        self.digests_path = self.job_dir / "digests.json"
 
     @property
     def original_mp4(self) -> Path:
@@ -40,6 +43,10 @@ class JobPaths:
     def final_vtt(self) -> Path:
         return self.merged_dir / "final.vtt"
 
+    @property
+    def merge_cursor_path(self) -> Path:
+        return self.merged_dir / "cursor.json"
+
     def chunk_path(self, index: int) -> Path:
         return self.chunks_dir / f"{index:04d}.wav"
 
@@ -51,3 +58,10 @@ class JobPaths:
 
     def output_pdf(self) -> Path:
         return self.output_dir / "transcript.pdf"
+
+    def package_plan(self) -> Path:
+        return self.output_dir / "package.json"
+
+    @property
+    def output_logs_dir(self) -> Path:
+        return self.output_dir / "logs"
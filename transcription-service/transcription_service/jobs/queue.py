@@ -1,10 +1,10 @@
 ﻿from __future__ import annotations
 
+import threading
 from typing import Iterable
 
-from redis import Redis
-from rq import Queue
-from rq.retry import Retry
+from redis import BlockingConnectionPool, Redis
+from rq import Queue, Retry
 
 from ..settings import settings
 
@@ -13,10 +13,62 @@ QUEUE_SPLITTER = "transcription-splitter"
 QUEUE_TRANSCRIBER = "transcription-transcriber"
 QUEUE_MERGER = "transcription-merger"
 QUEUE_PACKAGER = "transcription-packager"
+QUEUE_VIDEO = "transcription-video"
+
+
+_POOL: BlockingConnectionPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_redis_pool() -> BlockingConnectionPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = BlockingConnectionPool.from_url(
+                settings.REDIS_URL,
+                max_connections=settings.REDIS_POOL_MAX_CONNECTIONS,
+                timeout=settings.REDIS_POOL_TIMEOUT,
+                health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            )
+        return _POOL
+
+
+def close_redis_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.disconnect()
+            _POOL = None
+
+
+def redis_pool_stats() -> dict:
+    pool = _POOL
+    if pool is None:
+        return {"open": False}
+    stats = {
+        "open": True,
+        "max_connections": pool.max_connections,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    # redis-py has no public pool counters. They are only reported while BlockingConnectionPool still
+    # keeps its connections in _connections and its idle slots in pool.queue; otherwise they are left out.
+    connections = getattr(pool, "_connections", None)
+    slots = getattr(getattr(pool, "pool", None), "queue", None)
+    try:
+        created = len(connections)
+        idle = sum(1 for conn in list(slots) if conn is not None)
+    except TypeError:
+        return stats
+    stats.update(
+        created_connections=created,
+        idle_connections=idle,
+        in_use_connections=max(created - idle, 0),
+    )
+    return stats
 
 
 def get_redis() -> Redis:
-    return Redis.from_url(settings.REDIS_URL)
+    return Redis(connection_pool=get_redis_pool())
 
 
 def get_queue(name: str) -> Queue:
@@ -54,4 +106,4 @@ def enqueue(queue_name: str, func, *args, **kwargs):
 
 
 def queue_names() -> Iterable[str]:
-    return [QUEUE_SPLITTER, QUEUE_TRANSCRIBER, QUEUE_MERGER, QUEUE_PACKAGER]
+    return [QUEUE_SPLITTER, QUEUE_TRANSCRIBER, QUEUE_MERGER, QUEUE_PACKAGER, QUEUE_VIDEO]
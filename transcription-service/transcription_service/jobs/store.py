@@ -1,6 +1,9 @@
 ﻿from __future__ import annotations
 
 import json
+import os
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -32,7 +35,9 @@ class JobStore:
     def _write_file(self, job_id: str, payload: dict) -> None:
         path = self._state_path(job_id)
         path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        tmp.replace(path)
 
     def _read_file(self, job_id: str) -> dict | None:
         path = self._state_path(job_id)
@@ -113,6 +118,12 @@ class JobStore:
         self.save(state)
         return state
 
+    def incr_progress(self, job_id: str, amount: int = 1) -> JobState | None:
+        state = self.load(job_id)
+        if not state:
+            return None
+        return self.set_progress(job_id, chunks_done=state.progress.chunks_done + int(amount))
+
     def add_error(self, job_id: str, message: str) -> JobState | None:
         state = self.load(job_id)
         if not state:
@@ -123,3 +134,229 @@ class JobStore:
         state = JobState.model_validate(data)
         self.save(state)
         return state
+
+
+_ACTIVE_STATUSES = {"splitting", "transcribing", "merging", "packaging"}
+_TERMINAL_STATUSES = {"done", "failed", "canceled"}
+_JSON_FIELDS = ("input", "options", "result")
+
+# Returns -1 when the hash is missing, 0 when the transition is refused and 1 when applied.
+# Canceled and done are sticky so a late worker cannot resurrect a job.
+_SET_STATUS = """
+local cur = redis.call('HGET', KEYS[1], 'status')
+if not cur then
+  return -1
+end
+if cur ~= ARGV[1] and (cur == 'canceled' or cur == 'done') then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1], 'updated_at', ARGV[2])
+if ARGV[3] == '1' then
+  local started = redis.call('HGET', KEYS[1], 'started_at')
+  if not started or started == '' then
+    redis.call('HSET', KEYS[1], 'started_at', ARGV[2])
+  end
+end
+if ARGV[4] == '1' then
+  redis.call('HSET', KEYS[1], 'finished_at', ARGV[2])
+end
+return 1
+"""
+
+
+# Copies a legacy job_state.json into the hash only if nothing created the hash meanwhile, so a
+# concurrent migration or a status set through _SET_STATUS is never overwritten.
+_MIGRATE = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+local n = tonumber(ARGV[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 2, n + 1))
+redis.call('DEL', KEYS[2])
+if #ARGV > n + 1 then
+  redis.call('RPUSH', KEYS[2], unpack(ARGV, n + 2, #ARGV))
+end
+return 1
+"""
+
+
+def _text(value) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    return "" if value is None else str(value)
+
+
+def state_to_hash(state: JobState) -> dict[str, str]:
+    data = state.model_dump(mode="json")
+    fields = {
+        "job_id": data["job_id"],
+        "status": data["status"],
+        "chunks_total": str(data["progress"]["chunks_total"]),
+        "chunks_done": str(data["progress"]["chunks_done"]),
+    }
+    for key, value in data["timestamps"].items():
+        fields[key] = _text(value)
+    for key in _JSON_FIELDS:
+        fields[key] = json.dumps(data[key]) if data[key] is not None else ""
+    return fields
+
+
+def state_from_hash(raw: dict, errors: list) -> JobState:
+    fields = {_text(k): _text(v) for k, v in raw.items()}
+    total = int(fields.get("chunks_total") or 0)
+    done = int(fields.get("chunks_done") or 0)
+    payload = {
+        "job_id": fields["job_id"],
+        "status": fields["status"],
+        "progress": {
+            "chunks_total": total,
+            "chunks_done": done,
+            "percent": int((done / total) * 100) if total > 0 else 0,
+        },
+        "timestamps": {
+            key: (fields.get(key) or None)
+            for key in ("created_at", "updated_at", "started_at", "finished_at")
+        },
+        "errors": [_text(e) for e in errors],
+    }
+    for key in _JSON_FIELDS:
+        payload[key] = json.loads(fields[key]) if fields.get(key) else None
+    return JobState.model_validate(payload)
+
+
+class RedisHashJobStore(JobStore):
+    def __init__(
+        self,
+        storage_root: Path,
+        *,
+        redis_url: str | None = None,
+        redis_client: Redis | None = None,
+        snapshot_interval: float = 5.0,
+    ):
+        super().__init__(storage_root, redis_url=redis_url, redis_client=redis_client)
+        if self.redis is None:
+            raise ValueError("RedisHashJobStore requires a Redis connection")
+        self.snapshot_interval = float(snapshot_interval)
+        self._set_status = self.redis.register_script(_SET_STATUS)
+        self._migrate = self.redis.register_script(_MIGRATE)
+
+    def _hash_key(self, job_id: str) -> str:
+        return f"transcription:job:{job_id}:state"
+
+    def _errors_key(self, job_id: str) -> str:
+        return f"transcription:job:{job_id}:errors"
+
+    def _snapshot(self, job_id: str, *, force: bool = False, last: bytes | str | None = None) -> None:
+        now = time.time()
+        if not force and last and now - float(_text(last)) < self.snapshot_interval:
+            return
+        state = self.load(job_id)
+        if state is None:
+            return
+        self.redis.hset(self._hash_key(job_id), "snapshot_at", str(now))
+        self._write_file(job_id, state.model_dump())
+
+    def _write_hash(self, state: JobState) -> None:
+        pipe = self.redis.pipeline()
+        pipe.delete(self._hash_key(state.job_id), self._errors_key(state.job_id))
+        pipe.hset(self._hash_key(state.job_id), mapping=state_to_hash(state))
+        if state.errors:
+            pipe.rpush(self._errors_key(state.job_id), *state.errors)
+        pipe.execute()
+
+    def _ensure_hash(self, job_id: str) -> bool:
+        if self.redis.exists(self._hash_key(job_id)):
+            return True
+        legacy = super().load(job_id)
+        if legacy is None:
+            return False
+        fields = [item for pair in state_to_hash(legacy).items() for item in pair]
+        self._migrate(
+            keys=[self._hash_key(job_id), self._errors_key(job_id)],
+            args=[len(fields), *fields, *legacy.errors],
+        )
+        return True
+
+    def create(self, state: JobState) -> None:
+        self._write_hash(state)
+        self._write_file(state.job_id, state.model_dump())
+
+    def save(self, state: JobState) -> None:
+        self.create(state)
+
+    def load(self, job_id: str) -> JobState | None:
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self._hash_key(job_id))
+        pipe.lrange(self._errors_key(job_id), 0, -1)
+        raw, errors = pipe.execute()
+        if not raw:
+            return super().load(job_id)
+        return state_from_hash(raw, errors)
+
+    def update(self, job_id: str, **updates) -> JobState | None:
+        if not self._ensure_hash(job_id):
+            return None
+        if "status" in updates:
+            self.set_status(job_id, updates.pop("status"))
+        fields: dict[str, str] = {}
+        for key, value in updates.items():
+            if key in _JSON_FIELDS:
+                fields[key] = json.dumps(value) if value is not None else ""
+            elif key == "progress":
+                fields["chunks_total"] = str(int(value.get("chunks_total", 0)))
+                fields["chunks_done"] = str(int(value.get("chunks_done", 0)))
+        fields["updated_at"] = now_iso()
+        self.redis.hset(self._hash_key(job_id), mapping=fields)
+        self._snapshot(job_id, force=True)
+        return self.load(job_id)
+
+    def set_status(self, job_id: str, status: str) -> JobState | None:
+        if not self._ensure_hash(job_id):
+            return None
+        self._set_status(
+            keys=[self._hash_key(job_id)],
+            args=[
+                status,
+                now_iso(),
+                "1" if status in _ACTIVE_STATUSES else "0",
+                "1" if status in _TERMINAL_STATUSES else "0",
+            ],
+        )
+        self._snapshot(job_id, force=True)
+        return self.load(job_id)
+
+    def set_progress(self, job_id: str, *, chunks_total: int | None = None, chunks_done: int | None = None) -> JobState | None:
+        if not self._ensure_hash(job_id):
+            return None
+        fields = {"updated_at": now_iso()}
+        if chunks_total is not None:
+            fields["chunks_total"] = str(int(chunks_total))
+        if chunks_done is not None:
+            fields["chunks_done"] = str(int(chunks_done))
+        pipe = self.redis.pipeline()
+        pipe.hset(self._hash_key(job_id), mapping=fields)
+        pipe.hget(self._hash_key(job_id), "snapshot_at")
+        _, last = pipe.execute()
+        self._snapshot(job_id, last=last)
+        return self.load(job_id)
+
+    def incr_progress(self, job_id: str, amount: int = 1) -> JobState | None:
+        if not self._ensure_hash(job_id):
+            return None
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self._hash_key(job_id), "chunks_done", int(amount))
+        pipe.hset(self._hash_key(job_id), "updated_at", now_iso())
+        pipe.hget(self._hash_key(job_id), "snapshot_at")
+        _, _, last = pipe.execute()
+        self._snapshot(job_id, last=last)
+        return self.load(job_id)
+
+    def add_error(self, job_id: str, message: str) -> JobState | None:
+        if not self._ensure_hash(job_id):
+            return None
+        pipe = self.redis.pipeline()
+        pipe.rpush(self._errors_key(job_id), message)
+        pipe.hset(self._hash_key(job_id), "updated_at", now_iso())
+        pipe.execute()
+        self._snapshot(job_id, force=True)
+        return self.load(job_id)
@@ -0,0 +1,164 @@
+﻿from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .paths import JobPaths
+
+
+_LOCK = threading.Lock()
+# A reservation whose request died with its process stops blocking the range after this long.
+_RESERVATION_SECONDS = 3600
+
+
+def add_range(ranges: list[list[int]], start: int, end: int) -> list[list[int]]:
+    # Half-open [start, end) byte ranges, kept sorted and coalesced.
+    merged: list[list[int]] = []
+    for lo, hi in sorted(ranges + [[start, end]]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+
+def received_offset(ranges: list[list[int]]) -> int:
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def covers(ranges: list[list[int]], start: int, end: int) -> bool:
+    return any(lo <= start and end <= hi for lo, hi in ranges)
+
+
+def overlaps(ranges: list[list[int]], start: int, end: int) -> bool:
+    return any(lo < end and start < hi for lo, hi in ranges)
+
+
+class PartConflict(Exception):
+    pass
+
+
+class UploadSession:
+    # A resumable upload writes into a preallocated file under the job's input dir. Parts may arrive in
+    # any order and in parallel, each written straight at its offset; a part first reserves its range,
+    # so no two writers (and no writer and verified bytes) ever share one. upload.json records the
+    # verified ranges and the reservations in flight.
+    def __init__(self, paths: JobPaths):
+        self.paths = paths
+        self.meta_path = paths.input_dir / "upload.json"
+        self.data_path = paths.input_dir / "original.mp4.part"
+
+    def create(self, *, size: int, filename: str, options: dict | None, sha256: str | None, created_at: str) -> dict:
+        self.paths.input_dir.mkdir(parents=True, exist_ok=True)
+        with self.data_path.open("wb") as f:
+            f.truncate(size)
+        meta = {
+            "upload_id": self.paths.job_id,
+            "size": size,
+            "filename": filename,
+            "options": options,
+            "sha256": sha256,
+            "created_at": created_at,
+            "ranges": [],
+            "inflight": [],
+            "sealed": False,
+            "completed": False,
+        }
+        self._save(meta)
+        return meta
+
+    def load(self) -> dict | None:
+        try:
+            return json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, meta: dict) -> None:
+        tmp = self.meta_path.with_name(self.meta_path.name + ".tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.meta_path)
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        # Serializes changes to one upload across threads and API processes. flock already excludes
+        # other threads (each opens its own descriptor); the process lock is only a fallback.
+        with (self.paths.input_dir / "upload.lock").open("a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                yield
+            else:
+                with _LOCK:
+                    yield
+
+    def _load_required(self) -> dict:
+        meta = self.load()
+        if meta is None:
+            raise FileNotFoundError(self.meta_path)
+        return meta
+
+    def reserve(self, start: int, end: int) -> str:
+        # Parts that overlap verified bytes or another part in flight are refused.
+        with self.exclusive():
+            meta = self._load_required()
+            if meta.get("sealed"):
+                raise PartConflict("upload already completed")
+            now = time.time()
+            inflight = [r for r in meta.get("inflight", []) if r["expires"] > now]
+            busy = [[r["start"], r["end"]] for r in inflight]
+            if overlaps(meta["ranges"], start, end) or overlaps(busy, start, end):
+                raise PartConflict("part overlaps bytes that were already received or are being received")
+            token = uuid4().hex
+            inflight.append({"token": token, "start": start, "end": end, "expires": now + _RESERVATION_SECONDS})
+            meta["inflight"] = inflight
+            self._save(meta)
+            return token
+
+    def _take_reservation(self, meta: dict, token: str) -> dict | None:
+        for reservation in meta.get("inflight", []):
+            if reservation["token"] == token:
+                meta["inflight"].remove(reservation)
+                return reservation
+        return None
+
+    def record(self, token: str) -> dict:
+        with self.exclusive():
+            meta = self._load_required()
+            reservation = self._take_reservation(meta, token)
+            if reservation is None:
+                raise PartConflict("part reservation expired")
+            meta["ranges"] = add_range(meta["ranges"], reservation["start"], reservation["end"])
+            self._save(meta)
+            return meta
+
+    def release(self, token: str) -> None:
+        with self.exclusive():
+            meta = self.load()
+            if meta is not None and self._take_reservation(meta, token) is not None:
+                self._save(meta)
+
+    def seal(self, *, sha256: str, crc32: int) -> dict:
+        # The caller holds exclusive(). After this no part is accepted; completed is only set once the
+        # job exists, so a failed submission can be retried.
+        meta = self._load_required()
+        os.replace(self.data_path, self.paths.original_mp4)
+        meta.update(sealed=True, sha256=sha256, crc32=crc32, inflight=[])
+        self._save(meta)
+        return meta
+
+    def mark_completed(self) -> None:
+        # The caller holds exclusive(). A deduplicated upload has already been removed.
+        meta = self.load()
+        if meta is not None:
+            meta["completed"] = True
+            self._save(meta)
@@ -3,6 +3,8 @@
 from pathlib import Path
 
 from ..settings import settings
+from .queue import get_redis
+from .store import JobStore, RedisHashJobStore
 
 
 def _find_repo_root(start: Path) -> Path:
@@ -23,3 +25,13 @@ def resolve_path(path_value: str) -> Path:
 
 def storage_root() -> Path:
     return resolve_path(settings.STORAGE_ROOT)
+
+
+def open_job_store() -> JobStore:
+    if settings.JOB_STORE_BACKEND == "hash":
+        return RedisHashJobStore(
+            storage_root(),
+            redis_client=get_redis(),
+            snapshot_interval=settings.JOB_STATE_SNAPSHOT_SECONDS,
+        )
+    return JobStore(storage_root(), redis_client=get_redis())
@@ -1,25 +1,62 @@
 ﻿from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
 import shutil
+import time
+import zlib
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Literal
-from uuid import uuid4
+from typing import BinaryIO, Literal
+from uuid import UUID, uuid4
 
-from fastapi import Body, FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
 
 from .settings import settings
 from .jobs.models import JobInput, JobOptions, JobState, JobTimestamps
 from .jobs.paths import JobPaths
-from .jobs.queue import QUEUE_SPLITTER, enqueue
+from .jobs.cancel import request_cancel
+from .jobs.dedupe import JobDedupeIndex, options_hash, path_fingerprint, upload_fingerprint, url_fingerprint
+from .jobs.digests import record_digest
+from .jobs.queue import QUEUE_SPLITTER, close_redis_pool, enqueue, get_redis, get_redis_pool, redis_pool_stats
 from .jobs.store import JobStore
-from .jobs.utils import storage_root
+from .jobs.uploads import PartConflict, UploadSession, covers, overlaps, received_offset
+from .jobs.utils import open_job_store, resolve_path, storage_root
+from .infrastructure.packaging.zip_stream import StoredZipLayout, file_checksums
+from .processing.merge import load_merge_cursor, read_merged_text
 from .workers.splitter import split_job
 
-app = FastAPI(title="Transcription Service Jobs")
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    get_redis_pool()
+    try:
+        yield
+    finally:
+        close_redis_pool()
+
+
+app = FastAPI(title="Transcription Service Jobs", lifespan=lifespan)
+_default_openapi = app.openapi
+
+
+def _openapi() -> dict:
+    # No route takes JobCreateRequest as a parameter, so its schema is added for create_job's body.
+    if app.openapi_schema is None:
+        schema = _default_openapi()
+        request_schema = JobCreateRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+        components = schema.setdefault("components", {}).setdefault("schemas", {})
+        components.update(request_schema.pop("$defs", {}))
+        components["JobCreateRequest"] = request_schema
+    return app.openapi_schema
+
+
+app.openapi = _openapi
 
 
 def _now_iso() -> str:
@@ -28,12 +65,14 @@ def _now_iso() -> str:
 
 class JobCreateOptions(BaseModel):
     language: str | None = None
-    chunk_mode: Literal["silence", "vad"] | None = None
+    chunk_mode: Literal["silence", "vad", "energy"] | None = None
     max_parallel_chunks: int | None = None
     produce_vtt: bool | None = True
     produce_json: bool | None = True
     produce_pdf: bool | None = True
     cookies_from_browser: str | None = None
+    audio_only: bool | None = None
+    include_video: bool | None = True
 
 
 class JobCreateInput(BaseModel):
@@ -46,11 +85,19 @@ class JobCreateRequest(BaseModel):
     options: JobCreateOptions | None = None
 
 
+class UploadCreateRequest(BaseModel):
+    size: int = Field(gt=0)
+    filename: str | None = None
+    sha256: str | None = None
+    options: JobCreateOptions | None = None
+
+
 class JobCreateResponse(BaseModel):
     job_id: str
     status: str
     status_url: str
     result_url: str
+    deduplicated: bool = False
 
 
 def _build_options(opts: JobCreateOptions | None) -> JobOptions:
@@ -66,45 +113,160 @@ def _build_options(opts: JobCreateOptions | None) -> JobOptions:
         produce_json=(opts.produce_json if opts and opts.produce_json is not None else True),
         produce_pdf=(opts.produce_pdf if opts and opts.produce_pdf is not None else True),
         cookies_from_browser=(opts.cookies_from_browser if opts else None),
+        audio_only=(opts.audio_only if opts and opts.audio_only is not None else settings.URL_AUDIO_ONLY),
+        include_video=(opts.include_video if opts and opts.include_video is not None else True),
     )
 
 
 def _parse_multipart_options(raw: str | None) -> JobCreateOptions | None:
     if not raw:
         return None
-    data = json.loads(raw)
-    return JobCreateOptions.model_validate(data)
-
-
-@app.post("/v1/transcriptions/jobs", response_model=JobCreateResponse, status_code=202)
-async def create_job(
-    payload: JobCreateRequest | None = Body(None),
-    input_type: str | None = Form(None),
-    input_value: str | None = Form(None),
-    options: str | None = Form(None),
-    file: UploadFile | None = File(None),
-):
-    if payload is None and file is None:
-        raise HTTPException(status_code=422, detail="payload or file is required")
-
-    if file is not None:
-        input_kind = "upload"
-        input_val = file.filename or "upload"
-        opts = _parse_multipart_options(options)
-    else:
-        input_kind = payload.input.type
-        input_val = payload.input.value
-        opts = payload.options
+    try:
+        return JobCreateOptions.model_validate(json.loads(raw))
+    except (ValueError, ValidationError) as exc:
+        raise HTTPException(status_code=422, detail=f"invalid options: {exc}")
+
+
+_UPLOAD_BUFFER = 8 * 1024 * 1024
+
+
+def _write_block(f, digest, block: bytes, crc: int) -> int:
+    digest.update(block)
+    f.write(block)
+    return zlib.crc32(block, crc)
+
+
+def _save_upload(file: UploadFile, dest: Path) -> tuple[str, int]:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    crc = 0
+    with dest.open("wb") as f:
+        while True:
+            block = file.file.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block)
+            crc = zlib.crc32(block, crc)
+            f.write(block)
+    return digest.hexdigest(), crc
+
+
+async def _receive_body(request: Request, f: BinaryIO, *, limit: int | None = None) -> tuple[str, int, int]:
+    # Receive stays on the event loop; hashing and disk writes run on the threadpool in large blocks,
+    # overlapping with receiving the next block.
+    digest = hashlib.sha256()
+    crc = 0
+    size = 0
+    pending = bytearray()
+    writing: asyncio.Future | None = None
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if limit is not None and size > limit:
+                raise HTTPException(status_code=400, detail="body is longer than its Content-Range")
+            pending += chunk
+            if len(pending) >= _UPLOAD_BUFFER:
+                if writing is not None:
+                    crc = await writing
+                writing = asyncio.ensure_future(run_in_threadpool(_write_block, f, digest, bytes(pending), crc))
+                pending.clear()
+        if writing is not None:
+            crc = await writing
+        if pending:
+            crc = await run_in_threadpool(_write_block, f, digest, bytes(pending), crc)
+    finally:
+        if writing is not None and not writing.done():
+            await asyncio.wait([writing])
+    return digest.hexdigest(), crc, size
+
+
+async def _stream_upload(request: Request, dest: Path) -> tuple[str, int, int]:
+    # The request body goes straight into input/original.mp4, with no spooled temp copy.
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    f = await run_in_threadpool(dest.open, "wb")
+    try:
+        return await _receive_body(request, f)
+    finally:
+        await run_in_threadpool(f.close)
+
+
+def _source_fingerprint(job_input: JobInput) -> str | None:
+    if job_input.type == "upload":
+        return upload_fingerprint(job_input.sha256) if job_input.sha256 else None
+    if job_input.type == "url":
+        return url_fingerprint(job_input.value)
+    try:
+        return path_fingerprint(resolve_path(job_input.value))
+    except OSError:
+        return None
 
-    if input_kind in {"url", "path"} and not input_val:
-        raise HTTPException(status_code=422, detail="input value is required")
 
-    job_id = str(uuid4())
-    ts = _now_iso()
+def _reusable(job: JobState | None) -> bool:
+    if job is None or job.status in {"failed", "canceled"}:
+        return False
+    if job.status == "done":
+        if not job.result:
+            return False
+        if job.result.zip_path:
+            return Path(job.result.zip_path).exists()
+        return JobPaths(storage_root(), job.job_id).package_plan().exists()
+    return True
 
-    job_input = JobInput(type=input_kind, value=input_val or "")
-    job_options = _build_options(opts)
 
+_OWNER_GRACE_SECONDS = 5.0
+
+
+def _load_owner(store: JobStore, owner: str) -> JobState | None:
+    # A new owner claims the slot just before it writes its state, so a missing state is only taken
+    # as expired once the grace period has passed.
+    deadline = time.monotonic() + _OWNER_GRACE_SECONDS
+    while True:
+        existing = store.load(owner)
+        if existing is not None or time.monotonic() >= deadline:
+            return existing
+        time.sleep(0.05)
+
+
+def _find_duplicate(store: JobStore, job_input: JobInput, job_options: JobOptions, job_id: str) -> JobState | None:
+    fingerprint = _source_fingerprint(job_input)
+    if not settings.JOB_DEDUPE_ENABLED or fingerprint is None:
+        return None
+    index = JobDedupeIndex(get_redis(), ttl_seconds=settings.JOB_DEDUPE_TTL_SECONDS)
+    opts_hash = options_hash(job_options)
+    for _ in range(3):
+        owner = index.claim(fingerprint, opts_hash, job_id)
+        if owner == job_id:
+            return None
+        existing = _load_owner(store, owner)
+        if _reusable(existing):
+            return existing
+        # Failed, canceled or expired owners hand the slot to the new job.
+        if index.replace(fingerprint, opts_hash, owner, job_id):
+            return None
+    return None
+
+
+def _create_response(job_id: str, status: str, *, deduplicated: bool = False) -> JobCreateResponse:
+    return JobCreateResponse(
+        job_id=job_id,
+        status=status,
+        status_url=f"/v1/transcriptions/jobs/{job_id}",
+        result_url=f"/v1/transcriptions/jobs/{job_id}/result",
+        deduplicated=deduplicated,
+    )
+
+
+def _submit_job(response: Response, paths: JobPaths, job_input: JobInput, job_options: JobOptions) -> JobCreateResponse:
+    job_id = paths.job_id
+    store = open_job_store()
+    existing = _find_duplicate(store, job_input, job_options, job_id)
+    if existing is not None:
+        shutil.rmtree(paths.job_dir, ignore_errors=True)
+        if existing.status == "done":
+            response.status_code = 200
+        return _create_response(existing.job_id, existing.status, deduplicated=True)
+
+    ts = _now_iso()
     state = JobState(
         job_id=job_id,
         status="queued",
@@ -113,28 +275,258 @@ async def create_job(
         options=job_options,
     )
 
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
     store.create(state)
 
+    enqueue(QUEUE_SPLITTER, split_job, job_id)
+
+    return _create_response(job_id, "queued")
+
+
+_BINARY_BODY = {"schema": {"type": "string", "format": "binary"}}
+
+# create_job reads the body itself, so its three accepted shapes are declared here for the schema.
+_CREATE_JOB_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"$ref": "#/components/schemas/JobCreateRequest"}},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "options": {"type": "string", "description": "JobCreateOptions as JSON"},
+                    },
+                }
+            },
+            "application/octet-stream": _BINARY_BODY,
+            "video/*": _BINARY_BODY,
+        },
+    },
+    "parameters": [
+        {
+            "name": "filename",
+            "in": "query",
+            "required": False,
+            "schema": {"type": "string"},
+            "description": "Raw bodies only: the uploaded file's name",
+        },
+        {
+            "name": "options",
+            "in": "query",
+            "required": False,
+            "schema": {"type": "string"},
+            "description": "Raw bodies only: JobCreateOptions as JSON",
+        },
+    ],
+}
+
+
+@app.post(
+    "/v1/transcriptions/jobs",
+    response_model=JobCreateResponse,
+    status_code=202,
+    openapi_extra=_CREATE_JOB_OPENAPI,
+)
+async def create_job(request: Request, response: Response):
+    # JSON creates url/path jobs, multipart uploads a file field, and any other body (video/*,
+    # application/octet-stream) is the media itself, streamed with options/filename as query params.
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    job_id = str(uuid4())
     paths = JobPaths(storage_root(), job_id)
-    if file is not None:
-        paths.input_dir.mkdir(parents=True, exist_ok=True)
-        with paths.original_mp4.open("wb") as f:
-            shutil.copyfileobj(file.file, f)
+    upload: UploadFile | None = None
+    streamed = False
+
+    if content_type == "application/json":
+        try:
+            payload = JobCreateRequest.model_validate_json(await request.body())
+        except ValidationError as exc:
+            raise HTTPException(status_code=422, detail=exc.errors(include_url=False))
+        if payload.input.type == "upload":
+            raise HTTPException(status_code=422, detail="upload jobs need a multipart file, a raw body or an upload session")
+        input_kind = payload.input.type
+        input_val = payload.input.value
+        opts = payload.options
+    elif content_type in {"multipart/form-data", "application/x-www-form-urlencoded"}:
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=422, detail="payload or file is required")
+        input_kind = "upload"
+        input_val = upload.filename or "upload"
+        opts = _parse_multipart_options(form.get("options"))
+    else:
+        input_kind = "upload"
+        input_val = request.query_params.get("filename") or "upload"
+        opts = _parse_multipart_options(request.query_params.get("options"))
+        streamed = True
 
-    enqueue(QUEUE_SPLITTER, split_job, job_id)
+    if input_kind in {"url", "path"} and not input_val:
+        raise HTTPException(status_code=422, detail="input value is required")
 
-    return JobCreateResponse(
-        job_id=job_id,
-        status="queued",
-        status_url=f"/v1/transcriptions/jobs/{job_id}",
-        result_url=f"/v1/transcriptions/jobs/{job_id}/result",
+    job_input = JobInput(type=input_kind, value=input_val or "")
+    job_options = _build_options(opts)
+
+    if input_kind == "upload":
+        try:
+            if streamed:
+                job_input.sha256, crc, size = await _stream_upload(request, paths.original_mp4)
+                if size == 0:
+                    raise HTTPException(status_code=422, detail="payload or file is required")
+            else:
+                job_input.sha256, crc = await run_in_threadpool(_save_upload, upload, paths.original_mp4)
+        except BaseException:
+            shutil.rmtree(paths.job_dir, ignore_errors=True)
+            raise
+        await run_in_threadpool(record_digest, paths, paths.original_mp4, job_input.sha256, crc32=crc)
+
+    return await run_in_threadpool(_submit_job, response, paths, job_input, job_options)
+
+
+def _upload_session(upload_id: str) -> tuple[UploadSession, dict]:
+    try:
+        UUID(upload_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="upload_id not found")
+    session = UploadSession(JobPaths(storage_root(), upload_id))
+    meta = session.load()
+    if meta is None:
+        raise HTTPException(status_code=404, detail="upload_id not found")
+    return session, meta
+
+
+def _upload_status(meta: dict) -> dict:
+    upload_id = meta["upload_id"]
+    return {
+        "upload_id": upload_id,
+        "size": meta["size"],
+        "offset": received_offset(meta["ranges"]),
+        "received": sum(end - start for start, end in meta["ranges"]),
+        "ranges": meta["ranges"],
+        "completed": meta["completed"],
+        "upload_url": f"/v1/transcriptions/uploads/{upload_id}",
+        "complete_url": f"/v1/transcriptions/uploads/{upload_id}/complete",
+    }
+
+
+def _content_range(header: str | None, size: int) -> tuple[int, int]:
+    # "bytes <first>-<last>/<total>", inclusive, as in a response Content-Range.
+    try:
+        unit, _, spec = (header or "").partition(" ")
+        span, _, total = spec.partition("/")
+        first, _, last = span.partition("-")
+        start, end = int(first), int(last) + 1
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Content-Range: bytes <first>-<last>/<total> is required")
+    if unit != "bytes" or total not in {"*", str(size)} or not 0 <= start < end <= size:
+        raise HTTPException(status_code=416, detail=f"range must lie within 0-{size - 1}")
+    return start, end
+
+
+@app.post("/v1/transcriptions/uploads", status_code=201)
+async def create_upload(payload: UploadCreateRequest):
+    paths = JobPaths(storage_root(), str(uuid4()))
+    session = UploadSession(paths)
+    meta = await run_in_threadpool(
+        session.create,
+        size=payload.size,
+        filename=payload.filename or "upload",
+        options=payload.options.model_dump(mode="json") if payload.options else None,
+        sha256=payload.sha256.lower() if payload.sha256 else None,
+        created_at=_now_iso(),
     )
+    return _upload_status(meta)
+
+
+@app.get("/v1/transcriptions/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    _, meta = _upload_session(upload_id)
+    return _upload_status(meta)
+
+
+@app.put("/v1/transcriptions/uploads/{upload_id}")
+async def upload_part(upload_id: str, request: Request):
+    session, meta = _upload_session(upload_id)
+    if meta.get("sealed"):
+        raise HTTPException(status_code=409, detail="upload already completed")
+    start, end = _content_range(request.headers.get("content-range"), meta["size"])
+    expected = (request.headers.get("x-part-sha256") or "").strip().lower()
+    if not expected:
+        raise HTTPException(status_code=400, detail="X-Part-SHA256 header is required")
+    if covers(meta["ranges"], start, end):
+        return _upload_status(meta)
+    if overlaps(meta["ranges"], start, end):
+        raise HTTPException(status_code=409, detail="part overlaps bytes that were already received")
+
+    # Parts are written straight into the upload at their offset, several at once; the reservation keeps
+    # every other writer out of the range until its checksum is known.
+    try:
+        token = await run_in_threadpool(session.reserve, start, end)
+    except PartConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="upload_id not found")
+    try:
+        f = await run_in_threadpool(session.data_path.open, "r+b")
+        try:
+            await run_in_threadpool(f.seek, start)
+            sha256, _, size = await _receive_body(request, f, limit=end - start)
+        finally:
+            await run_in_threadpool(f.close)
+        if size != end - start:
+            raise HTTPException(status_code=400, detail="body is shorter than its Content-Range")
+        if sha256 != expected:
+            raise HTTPException(status_code=400, detail="part checksum mismatch")
+        meta = await run_in_threadpool(session.record, token)
+    except PartConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="upload_id not found")
+    except BaseException:
+        await run_in_threadpool(session.release, token)
+        raise
+    return _upload_status(meta)
+
+
+def _complete_upload(session: UploadSession, response: Response) -> JobCreateResponse:
+    # Held under the upload's lock from the checksum to the job's creation: a concurrent /complete
+    # waits and then finds the job, and one retried after a failed submission submits again.
+    paths = session.paths
+    with session.exclusive():
+        meta = session.load()
+        if meta is None:
+            raise HTTPException(status_code=404, detail="upload_id not found")
+        if meta["completed"]:
+            job = open_job_store().load(paths.job_id)
+            return _create_response(paths.job_id, job.status if job else "queued")
+        if received_offset(meta["ranges"]) < meta["size"]:
+            raise HTTPException(status_code=409, detail=_upload_status(meta))
+
+        if not meta.get("sealed"):
+            # Parts may have arrived in any order, so the whole-file digest needs one pass at the end.
+            crc, sha256 = file_checksums(session.data_path)
+            if meta["sha256"] and meta["sha256"] != sha256:
+                raise HTTPException(status_code=422, detail="file checksum mismatch")
+            meta = session.seal(sha256=sha256, crc32=crc)
+        record_digest(paths, paths.original_mp4, meta["sha256"], crc32=meta["crc32"])
+
+        job_input = JobInput(type="upload", value=meta["filename"], sha256=meta["sha256"])
+        opts = JobCreateOptions.model_validate(meta["options"]) if meta["options"] else None
+        created = _submit_job(response, paths, job_input, _build_options(opts))
+        session.mark_completed()
+        return created
+
+
+@app.post("/v1/transcriptions/uploads/{upload_id}/complete", response_model=JobCreateResponse, status_code=202)
+async def complete_upload(upload_id: str, response: Response):
+    session, _ = _upload_session(upload_id)
+    return await run_in_threadpool(_complete_upload, session, response)
 
 
 @app.get("/v1/transcriptions/jobs/{job_id}")
 async def get_job(job_id: str):
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job_id not found")
@@ -143,7 +535,7 @@ async def get_job(job_id: str):
 
 @app.get("/v1/transcriptions/jobs/{job_id}/result")
 async def get_result(job_id: str):
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job_id not found")
@@ -158,17 +550,97 @@ async def get_result(job_id: str):
     }
 
 
+@app.get("/v1/transcriptions/jobs/{job_id}/partial")
+async def get_partial_transcript(job_id: str):
+    store = open_job_store()
+    job = store.load(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="job_id not found")
+
+    paths = JobPaths(storage_root(), job_id)
+    cursor = load_merge_cursor(paths.merge_cursor_path)
+    return {
+        "job_id": job_id,
+        "status": job.status,
+        "chunks_total": job.progress.chunks_total,
+        "chunks_merged": int(cursor.get("position", 0)) if cursor else 0,
+        "merged_until": float(cursor.get("emitted_end", 0.0)) if cursor else 0.0,
+        "final": bool(cursor and cursor.get("final")),
+        "text": read_merged_text(paths.final_txt, cursor),
+    }
+
+
+def _byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    # Only a single range is honored; anything else gets the full body, which HTTP allows.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start = max(size - int(last), 0)
+            end = size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size)
+
+
+def _stream_zip(request: Request, paths: JobPaths, download_name: str) -> Response:
+    try:
+        plan = json.loads(paths.package_plan().read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        raise HTTPException(status_code=404, detail="zip not found")
+    layout = StoredZipLayout.from_dict(plan, paths.job_dir)
+    if layout.stale():
+        raise HTTPException(status_code=409, detail="packaged files changed; package the job again")
+
+    etag = f'"{layout.etag}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{download_name}"',
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if request.headers.get("if-range", etag) == etag:
+        byte_range = _byte_range(request.headers.get("range"), layout.size)
+    if byte_range is None:
+        headers["Content-Length"] = str(layout.size)
+        return StreamingResponse(layout.iter_bytes(), media_type="application/zip", headers=headers)
+
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start)
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{layout.size}"
+    return StreamingResponse(
+        layout.iter_bytes(start, end),
+        status_code=206,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
 @app.get("/v1/transcriptions/jobs/{job_id}/download")
-async def download_result(job_id: str):
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+async def download_result(job_id: str, request: Request):
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job_id not found")
     if job.status != "done":
         raise HTTPException(status_code=409, detail={"status": job.status})
-    if not job.result or not job.result.zip_path:
+    if not job.result or not job.result.download_name:
         raise HTTPException(status_code=404, detail="result not found")
 
+    paths = JobPaths(storage_root(), job_id)
+    if not job.result.zip_path:
+        # PACKAGER_STREAM_ZIP: the archive is assembled from the job directory on every request.
+        return _stream_zip(request, paths, job.result.download_name)
+
     zip_path = Path(job.result.zip_path)
     if not zip_path.exists():
         raise HTTPException(status_code=404, detail="zip not found")
@@ -178,11 +650,17 @@ async def download_result(job_id: str):
 
 @app.post("/v1/transcriptions/jobs/{job_id}/cancel")
 async def cancel_job(job_id: str):
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="job_id not found")
     if job.status in {"done", "failed", "canceled"}:
         return job.model_dump()
     store.set_status(job_id, "canceled")
+    request_cancel(get_redis(), job_id)
     return store.load(job_id).model_dump()
+
+
+@app.get("/v1/transcriptions/metrics")
+async def get_metrics():
+    return {"redis_pool": redis_pool_stats()}
@@ -0,0 +1,124 @@
+﻿from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+CACHE_FORMAT = 1
+
+# Cache size per root, shared by every ChunkCache in the process: each chunk job opens its own cache,
+# and rescanning the directory for each of them would walk every entry once per chunk.
+_SIZES: dict[Path, int] = {}
+_SIZES_LOCK = threading.Lock()
+
+
+def chunk_cache_key(pcm: np.ndarray | bytes, params: dict) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps(dict(params, format=CACHE_FORMAT), sort_keys=True).encode("utf-8"))
+    if isinstance(pcm, np.ndarray):
+        h.update(memoryview(np.ascontiguousarray(pcm, dtype="<i2")).cast("B"))
+    else:
+        h.update(pcm)
+    return h.hexdigest()
+
+
+class ChunkCache:
+    def __init__(self, root: Path, *, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str, *, chunk_start: float) -> dict | None:
+        path = self._entry_path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # mtime doubles as the LRU clock.
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        segments = [
+            {"start": s["start"] + chunk_start, "end": s["end"] + chunk_start, "text": s["text"]}
+            for s in entry.get("segments", [])
+        ]
+        return {"segments": segments, "text": entry.get("text", "")}
+
+    def put(self, key: str, result: dict, *, chunk_start: float) -> None:
+        # Segments are stored relative to the chunk so the same audio hits at any offset.
+        entry = {
+            "format": CACHE_FORMAT,
+            "segments": [
+                {"start": s["start"] - chunk_start, "end": s["end"] - chunk_start, "text": s["text"]}
+                for s in result.get("segments", [])
+            ],
+            "text": result.get("text", ""),
+        }
+        path = self._entry_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        data = json.dumps(entry).encode("utf-8")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        with _SIZES_LOCK:
+            size = _SIZES.get(self.root)
+            size = self._scan_size() if size is None else size + len(data)
+            _SIZES[self.root] = size
+            over = size > self.max_bytes
+        if over:
+            self.prune()
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries: list[tuple[float, int, Path]] = []
+        if not self.root.exists():
+            return entries
+        for path in self.root.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _mtime, size, _path in self._entries())
+
+    def prune(self) -> int:
+        # Other workers share the directory, so eviction works from a fresh scan, oldest first,
+        # down to 90% of the budget to avoid pruning on every write.
+        entries = sorted(self._entries())
+        total = sum(size for _mtime, size, _path in entries)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _mtime, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with _SIZES_LOCK:
+            _SIZES[self.root] = total
+        return removed
+
+    def describe(self) -> str:
+        with self._lock:
+            return f"chunk cache: {self.hits} hits, {self.misses} misses"
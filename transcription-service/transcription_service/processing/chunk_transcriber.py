@@ -1,9 +1,74 @@
 ﻿from __future__ import annotations
 
+import bisect
 import threading
+import time
 from pathlib import Path
+from typing import Callable
+
+import numpy as np
 
 from ..shared.fs__shared_util import remove_diacritics_to_ascii
+from .pcm import SAMPLE_RATE
+
+
+_MODEL_CACHE: dict[tuple[str, str, str], object] = {}
+_MODEL_LOCK = threading.RLock()
+_MODEL_STATS = {"loads": 0, "load_seconds": 0.0, "warm_hits": 0, "cold_hits": 0}
+
+
+def _load_model(model_size: str, device: str, compute_type: str, *, num_workers: int = 1):
+    from faster_whisper import WhisperModel
+
+    t0 = time.perf_counter()
+    model = WhisperModel(model_size, device=device, compute_type=compute_type, num_workers=max(int(num_workers), 1))
+    elapsed = time.perf_counter() - t0
+    with _MODEL_LOCK:
+        _MODEL_STATS["loads"] += 1
+        _MODEL_STATS["load_seconds"] += elapsed
+    return model, elapsed
+
+
+def get_shared_model(model_size: str, device: str, compute_type: str, *, num_workers: int = 1) -> tuple[object, bool, float]:
+    key = (model_size, device, compute_type)
+    with _MODEL_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is not None:
+            _MODEL_STATS["warm_hits"] += 1
+            return model, True, 0.0
+        model, elapsed = _load_model(model_size, device, compute_type, num_workers=num_workers)
+        _MODEL_CACHE[key] = model
+        _MODEL_STATS["cold_hits"] += 1
+        return model, False, elapsed
+
+
+def split_windows(audio: np.ndarray, *, max_seconds: float = 30.0, search_seconds: float = 5.0) -> list[tuple[int, int]]:
+    # Batched decoding only sees the first 30 s of a clip, so long chunks are cut at the quietest
+    # 100 ms frame near the limit instead of at a fixed offset.
+    total = int(audio.shape[0])
+    max_len = int(max_seconds * SAMPLE_RATE)
+    search = min(int(search_seconds * SAMPLE_RATE), max_len)
+    frame = SAMPLE_RATE // 10
+    bounds: list[tuple[int, int]] = []
+    start = 0
+    while total - start > max_len:
+        lo = start + max_len - search
+        region = audio[lo:lo + (search // frame) * frame].astype(np.float32)
+        if region.shape[0] >= frame:
+            energy = np.mean(np.square(region.reshape(-1, frame)), axis=1)
+            cut = lo + int(np.argmin(energy)) * frame + frame // 2
+        else:
+            cut = start + max_len
+        bounds.append((start, cut))
+        start = cut
+    if total > start or not bounds:
+        bounds.append((start, total))
+    return bounds
+
+
+def model_cache_stats() -> dict:
+    with _MODEL_LOCK:
+        return dict(_MODEL_STATS, cached_models=len(_MODEL_CACHE))
 
 
 class FasterWhisperChunkTranscriber:
@@ -15,28 +80,145 @@ class FasterWhisperChunkTranscriber:
         compute_type: str,
         beam_size: int,
         vad_filter: bool,
+        shared_model: bool = False,
+        num_workers: int = 1,
     ):
         self.model_size = model_size
         self.device = device
         self.compute_type = compute_type
         self.beam_size = beam_size
         self.vad_filter = vad_filter
+        self.shared_model = shared_model
+        self.num_workers = num_workers
+        self.model_warm: bool | None = None
+        self.model_load_seconds = 0.0
         self._local = threading.local()
+        self._lock = threading.Lock()
 
     def _get_model(self):
+        if self.shared_model:
+            model, warm, elapsed = get_shared_model(
+                self.model_size,
+                self.device,
+                self.compute_type,
+                num_workers=self.num_workers,
+            )
+            with self._lock:
+                if self.model_warm is None:
+                    self.model_warm = warm
+                self.model_load_seconds += elapsed
+            return model
+
         model = getattr(self._local, "model", None)
         if model is None:
-            from faster_whisper import WhisperModel
-
-            model = WhisperModel(self.model_size, device=self.device, compute_type=self.compute_type)
+            model, elapsed = _load_model(self.model_size, self.device, self.compute_type)
             self._local.model = model
+            with self._lock:
+                self.model_warm = False
+                self.model_load_seconds += elapsed
         return model
 
-    def transcribe_chunk(self, chunk_path: Path, *, chunk_start: float, language: str) -> dict:
+    def cache_params(self, language: str, *, batched: bool = False) -> dict:
+        return {
+            "model": self.model_size,
+            "compute_type": self.compute_type,
+            "beam_size": self.beam_size,
+            "language": language,
+            "vad_filter": bool(self.vad_filter) and not batched,
+            "batched": batched,
+        }
+
+    def describe_model_usage(self) -> str:
+        if self.model_warm is None:
+            return f"whisper model {self.model_size}: unused"
+        state = "warm" if self.model_warm else "cold"
+        return f"whisper model {self.model_size}: {state}, load {self.model_load_seconds:.2f}s"
+
+    @staticmethod
+    def _clean_segment(seg, offset: float, *, limit: float | None = None) -> dict | None:
+        text = remove_diacritics_to_ascii(getattr(seg, "text", "") or "")
+        if not text:
+            return None
+        start = float(getattr(seg, "start", 0.0) or 0.0)
+        end = float(getattr(seg, "end", 0.0) or 0.0)
+        if limit is not None:
+            end = min(end, limit)
+        start += offset
+        end += offset
+        if end <= start:
+            return None
+        return {"start": start, "end": end, "text": text}
+
+    def transcribe_batch(
+        self,
+        chunks: list[tuple[np.ndarray, float]],
+        *,
+        language: str,
+        batch_size: int,
+        should_stop: Callable[[], bool] | None = None,
+    ) -> list[dict]:
+        from faster_whisper import BatchedInferencePipeline
+
+        # All windows of the group are laid end to end so one call can fill every batch slot.
+        pieces: list[np.ndarray] = []
+        clips: list[dict] = []
+        window_offsets: list[float] = []
+        window_meta: list[tuple[int, float, float]] = []
+        cursor = 0
+        for chunk_idx, (audio, chunk_start) in enumerate(chunks):
+            for lo, hi in split_windows(audio):
+                if hi <= lo:
+                    continue
+                pieces.append(np.asarray(audio[lo:hi], dtype=np.float32))
+                begin = cursor / SAMPLE_RATE
+                finish = (cursor + hi - lo) / SAMPLE_RATE
+                clips.append({"start": begin, "end": finish})
+                window_offsets.append(begin)
+                window_meta.append((chunk_idx, chunk_start + lo / SAMPLE_RATE - begin, finish))
+                cursor += hi - lo
+
+        results: list[dict] = [{"segments": [], "text": ""} for _ in chunks]
+        if not clips:
+            return results
+
+        pipeline = BatchedInferencePipeline(model=self._get_model())
+        segments, _info = pipeline.transcribe(
+            np.concatenate(pieces),
+            language=language,
+            beam_size=self.beam_size,
+            batch_size=max(int(batch_size), 1),
+            clip_timestamps=clips,
+            vad_filter=False,
+            without_timestamps=False,
+        )
+
+        for seg in segments:
+            if should_stop is not None and should_stop():
+                raise InterruptedError("transcription interrupted")
+            # Segment times are rounded to the millisecond, so nudge before locating the window.
+            seg_start = float(getattr(seg, "start", 0.0) or 0.0) + 0.001
+            window = max(bisect.bisect_right(window_offsets, seg_start) - 1, 0)
+            chunk_idx, shift, window_end = window_meta[window]
+            out = self._clean_segment(seg, shift, limit=window_end)
+            if out is not None:
+                results[chunk_idx]["segments"].append(out)
+
+        for result in results:
+            result["text"] = " ".join(s["text"] for s in result["segments"]).strip()
+        return results
+
+    def transcribe_chunk(
+        self,
+        chunk: Path | np.ndarray,
+        *,
+        chunk_start: float,
+        language: str,
+        should_stop: Callable[[], bool] | None = None,
+    ) -> dict:
         model = self._get_model()
 
         segments, _info = model.transcribe(
-            str(chunk_path),
+            chunk if isinstance(chunk, np.ndarray) else str(chunk),
             language=language,
             beam_size=self.beam_size,
             vad_filter=self.vad_filter,
@@ -46,15 +228,14 @@ class FasterWhisperChunkTranscriber:
         texts: list[str] = []
 
         for seg in segments:
-            text = remove_diacritics_to_ascii(getattr(seg, "text", "") or "")
-            if not text:
-                continue
-            start = float(getattr(seg, "start", 0.0) or 0.0) + chunk_start
-            end = float(getattr(seg, "end", 0.0) or 0.0) + chunk_start
-            if end <= start:
+            # Segments are decoded lazily, so stopping here abandons the rest of the chunk's inference.
+            if should_stop is not None and should_stop():
+                raise InterruptedError("transcription interrupted")
+            out = self._clean_segment(seg, chunk_start)
+            if out is None:
                 continue
-            out_segments.append({"start": start, "end": end, "text": text})
-            texts.append(text)
+            out_segments.append(out)
+            texts.append(out["text"])
 
         return {
             "segments": out_segments,
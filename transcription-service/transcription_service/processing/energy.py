@@ -0,0 +1,132 @@
+﻿from __future__ import annotations
+
+import re
+
+import numpy as np
+
+from .pcm import SAMPLE_RATE, PcmAudio
+
+_DB_VALUE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*(?:db)?\s*$", re.IGNORECASE)
+_EPS = 1e-10
+
+
+def parse_db(value: str | float) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    m = _DB_VALUE.match(value or "")
+    if not m:
+        raise ValueError(f"invalid dB value: {value!r}")
+    return float(m.group(1))
+
+
+class EnergySilenceDetector:
+    def __init__(
+        self,
+        *,
+        silence_db: str | float,
+        min_duration: float,
+        sample_rate: int = SAMPLE_RATE,
+        frame_ms: int = 20,
+        hysteresis_db: float = 3.0,
+    ):
+        self.enter_db = parse_db(silence_db)
+        self.exit_db = self.enter_db + max(float(hysteresis_db), 0.0)
+        self.min_duration = float(min_duration)
+        self.sample_rate = int(sample_rate)
+        self.frame_size = max(int(self.sample_rate * frame_ms / 1000), 1)
+
+        self._carry = np.zeros(0, dtype=np.int16)
+        self._frames_seen = 0
+        self._silent = False
+        self._run_start: int | None = None
+
+    @property
+    def position(self) -> float:
+        return (self._frames_seen * self.frame_size + self._carry.shape[0]) / float(self.sample_rate)
+
+    @property
+    def settled(self) -> float:
+        # No silence reported later can start before this point: either the open silent run or the
+        # first frame not classified yet.
+        if self._silent and self._run_start is not None:
+            return self._frame_time(self._run_start)
+        return self._frame_time(self._frames_seen)
+
+    def _frame_time(self, frame: int) -> float:
+        return frame * self.frame_size / float(self.sample_rate)
+
+    def _frame_levels(self, samples: np.ndarray) -> np.ndarray:
+        frames = samples.reshape(-1, self.frame_size).astype(np.float32) / 32768.0
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        return 20.0 * np.log10(rms + _EPS)
+
+    def _close_run(self, end_frame: int, out: list[tuple[float, float]]) -> None:
+        start_frame = self._run_start
+        self._run_start = None
+        if start_frame is None:
+            return
+        start = self._frame_time(start_frame)
+        end = self._frame_time(end_frame)
+        if end - start >= self.min_duration:
+            out.append((start, end))
+
+    def feed(self, samples: np.ndarray) -> list[tuple[float, float]]:
+        if self._carry.shape[0]:
+            samples = np.concatenate([self._carry, samples])
+        usable = (samples.shape[0] // self.frame_size) * self.frame_size
+        self._carry = np.array(samples[usable:], dtype=np.int16)
+        closed: list[tuple[float, float]] = []
+        if usable == 0:
+            return closed
+
+        levels = self._frame_levels(samples[:usable])
+        count = levels.shape[0]
+
+        # Hysteresis: below enter_db is silence, above exit_db is sound, in between keeps the previous state.
+        labels = np.full(count, -1, dtype=np.int8)
+        labels[levels < self.enter_db] = 1
+        labels[levels >= self.exit_db] = 0
+        decided = np.where(labels >= 0, np.arange(count), -1)
+        np.maximum.accumulate(decided, out=decided)
+        silent = np.where(decided >= 0, labels[np.maximum(decided, 0)], 1 if self._silent else 0).astype(np.int8)
+
+        edges = np.diff(np.concatenate([[1 if self._silent else 0], silent]))
+        base = self._frames_seen
+        for pos in np.flatnonzero(edges):
+            frame = base + int(pos)
+            if edges[pos] > 0:
+                self._run_start = frame
+            else:
+                self._close_run(frame, closed)
+
+        self._silent = bool(silent[-1])
+        self._frames_seen += count
+        return closed
+
+    def finish(self) -> list[tuple[float, float]]:
+        closed: list[tuple[float, float]] = []
+        if self._silent and self._run_start is not None:
+            start = self._frame_time(self._run_start)
+            end = self.position
+            self._run_start = None
+            if end - start >= self.min_duration:
+                closed.append((start, end))
+        self._silent = False
+        return closed
+
+
+def detect_silences_energy(
+    audio: PcmAudio,
+    *,
+    silence_db: str | float,
+    min_duration: float,
+    block_seconds: float = 60.0,
+) -> list[tuple[float, float]]:
+    detector = EnergySilenceDetector(silence_db=silence_db, min_duration=min_duration)
+    block = max(int(block_seconds * SAMPLE_RATE) // detector.frame_size, 1) * detector.frame_size
+    silences: list[tuple[float, float]] = []
+    total = int(audio.samples.shape[0])
+    for offset in range(0, total, block):
+        silences.extend(detector.feed(audio.samples[offset:offset + block]))
+    silences.extend(detector.finish())
+    return silences
@@ -1,37 +1,371 @@
 ﻿from __future__ import annotations
 
+import hashlib
 import json
+import os
+import re
+import zlib
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
 
-from .vtt import segments_to_vtt
+from ..shared.fs__shared_util import file_checksums
+from .partials import PartialLog
+from .vtt import format_timestamp
 
 
-def _normalize_segments(segments: list[dict]) -> list[dict]:
-    segments = sorted(segments, key=lambda s: (float(s.get("start", 0.0)), float(s.get("end", 0.0))))
-    merged: list[dict] = []
-    for seg in segments:
+class SegmentMerger:
+    # Segments arrive in time order, so overlap trimming and duplicate removal only ever need the
+    # previous segment: it is held back until the next one decides its end.
+    def __init__(self, pending: dict | None = None):
+        self.pending = pending
+
+    def push(self, seg: dict) -> dict | None:
         text = (seg.get("text") or "").strip()
         if not text:
-            continue
+            return None
         start = float(seg.get("start", 0.0) or 0.0)
         end = float(seg.get("end", 0.0) or 0.0)
         if end <= start:
-            continue
+            return None
         seg = {"start": start, "end": end, "text": text}
 
-        if merged:
-            prev = merged[-1]
-            if start < prev["end"]:
-                if start > prev["start"]:
-                    prev["end"] = start
-                    if prev["end"] <= prev["start"]:
-                        merged.pop()
-                if text.lower() == prev.get("text", "").lower():
-                    continue
-        merged.append(seg)
+        prev = self.pending
+        if prev is not None and start < prev["end"]:
+            if start > prev["start"]:
+                prev["end"] = start
+            if text.lower() == prev.get("text", "").lower():
+                return None
+        self.pending = seg
+        return prev
+
+    def flush(self) -> dict | None:
+        prev = self.pending
+        self.pending = None
+        return prev
+
+
+def _normalize_segments(segments: list[dict]) -> list[dict]:
+    segments = sorted(segments, key=lambda s: (float(s.get("start", 0.0)), float(s.get("end", 0.0))))
+    merger = SegmentMerger()
+    merged: list[dict] = []
+    for seg in segments:
+        out = merger.push(seg)
+        if out is not None:
+            merged.append(out)
+    last = merger.flush()
+    if last is not None:
+        merged.append(last)
     return merged
 
 
+def _json_segment(seg: dict) -> str:
+    body = json.dumps(seg, indent=2)
+    return "\n".join("    " + line for line in body.splitlines())
+
+
+class _HashedText:
+    def __init__(self, handle, *, hashed: bool):
+        self.handle = handle
+        self.digest = hashlib.sha256() if hashed else None
+        self.crc = 0
+
+    def write(self, data: str) -> None:
+        self.handle.write(data)
+        if self.digest is not None:
+            raw = data.encode("utf-8")
+            self.digest.update(raw)
+            self.crc = zlib.crc32(raw, self.crc)
+
+    def flush(self) -> None:
+        self.handle.flush()
+
+    def fileno(self) -> int:
+        return self.handle.fileno()
+
+    def close(self) -> None:
+        self.handle.close()
+
+
+class TranscriptWriter:
+    # Writes final.txt, final.json and final.vtt as segments arrive. The output is byte-for-byte what
+    # building the whole transcript in memory and dumping it would produce.
+    def __init__(self, *, final_txt: Path, final_json: Path | None = None, final_vtt: Path | None = None):
+        self.final_txt = final_txt
+        self.final_json = final_json
+        self.final_vtt = final_vtt
+        self.count = 0
+        self.text_chars = 0
+        self.digests: dict[Path, dict] = {}
+        self._txt = None
+        self._json = None
+        self._vtt = None
+
+    def open(self, resume: dict | None = None) -> "TranscriptWriter":
+        if resume is not None:
+            return self._reopen(resume)
+        def _create(path: Path) -> _HashedText:
+            return _HashedText(path.open("w", encoding="utf-8", newline=""), hashed=True)
+
+        self._txt = _create(self.final_txt)
+        if self.final_json is not None:
+            self._json = _create(self.final_json)
+            self._json.write('{\n  "segments": [')
+        if self.final_vtt is not None:
+            self._vtt = _create(self.final_vtt)
+            self._vtt.write("WEBVTT\n")
+        return self
+
+    def _reopen(self, state: dict) -> "TranscriptWriter":
+        # Anything written after the last checkpoint is cut off, so a crash between writing and
+        # checkpointing never duplicates output.
+        def _append(path: Path, size: int) -> _HashedText:
+            with path.open("r+b") as f:
+                f.truncate(size)
+            # Earlier sessions wrote the prefix, so this one cannot hash the file inline.
+            return _HashedText(path.open("a", encoding="utf-8", newline=""), hashed=False)
+
+        self.count = int(state["count"])
+        self.text_chars = int(state["text_chars"])
+        self._txt = _append(self.final_txt, int(state["txt"]))
+        if self.final_json is not None:
+            self._json = _append(self.final_json, int(state["json"]))
+        if self.final_vtt is not None:
+            self._vtt = _append(self.final_vtt, int(state["vtt"]))
+        return self
+
+    def checkpoint(self) -> dict:
+        state = {"count": self.count, "text_chars": self.text_chars}
+        for name, handle in (("txt", self._txt), ("json", self._json), ("vtt", self._vtt)):
+            if handle is not None:
+                handle.flush()
+                state[name] = os.fstat(handle.fileno()).st_size
+        return state
+
+    def suspend(self) -> None:
+        for handle in (self._txt, self._json, self._vtt):
+            if handle is not None:
+                handle.close()
+        self._txt = self._json = self._vtt = None
+
+    def write(self, seg: dict) -> None:
+        first = self.count == 0
+        self.count += 1
+        piece = seg["text"] if first else " " + seg["text"]
+        self._txt.write(piece)
+        self.text_chars += len(piece)
+        if self._json is not None:
+            self._json.write(("\n" if first else ",\n") + _json_segment(seg))
+        if self._vtt is not None:
+            start = format_timestamp(seg["start"])
+            end = format_timestamp(seg["end"])
+            self._vtt.write(f"\n{self.count}\n{start} --> {end}\n{seg['text']}\n")
+
+    def _write_json_text(self) -> None:
+        # The full text is copied back from final.txt in blocks rather than held in memory.
+        self._json.write("\n  ]," if self.count else "],")
+        self._json.write('\n  "text": "')
+        remaining = self.text_chars
+        with self.final_txt.open("r", encoding="utf-8", newline="") as f:
+            while remaining > 0:
+                block = f.read(min(remaining, 64 * 1024))
+                if not block:
+                    break
+                remaining -= len(block)
+                self._json.write(json.dumps(block)[1:-1])
+        self._json.write('"\n}')
+
+    def _finish(self, path: Path, handle: _HashedText) -> None:
+        handle.close()
+        if handle.digest is not None:
+            self.digests[path] = {"sha256": handle.digest.hexdigest(), "crc32": handle.crc}
+        else:
+            # Appended across sessions: one read gives the packager both checksums.
+            crc, sha256 = file_checksums(path)
+            self.digests[path] = {"sha256": sha256, "crc32": crc}
+
+    def close(self) -> None:
+        if self._txt is not None:
+            self._txt.write("\n")
+            self._finish(self.final_txt, self._txt)
+            self._txt = None
+        if self._json is not None:
+            self._write_json_text()
+            self._finish(self.final_json, self._json)
+            self._json = None
+        if self._vtt is not None:
+            self._finish(self.final_vtt, self._vtt)
+            self._vtt = None
+
+    def __enter__(self) -> "TranscriptWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+def iter_partials(partials_dir: Path) -> Iterator[dict]:
+    return PartialLog(partials_dir).iter_chunks()
+
+
+def iter_partial_segments(partials: Iterable[dict]) -> Iterator[dict]:
+    for data in partials:
+        yield from sorted(
+            data.get("segments", []),
+            key=lambda s: (float(s.get("start", 0.0) or 0.0), float(s.get("end", 0.0) or 0.0)),
+        )
+
+
+def merge_segments(segments: Iterable[dict]) -> Iterator[dict]:
+    merger = SegmentMerger()
+    for seg in segments:
+        out = merger.push(seg)
+        if out is not None:
+            yield out
+    last = merger.flush()
+    if last is not None:
+        yield last
+
+
+def stream_merge(
+    segments: Iterable[dict],
+    writer: TranscriptWriter,
+    *,
+    on_segment: Callable[[dict], None] | None = None,
+) -> int:
+    with writer:
+        for out in merge_segments(segments):
+            writer.write(out)
+            if on_segment is not None:
+                on_segment(out)
+    return writer.count
+
+
+_ARRAY_SEPARATOR = re.compile(r"[\s,]*")
+
+
+def iter_json_segments(final_json: Path, *, block_size: int = 64 * 1024) -> Iterator[dict]:
+    # Decodes the "segments" array of final.json one object at a time, so the file is never loaded whole.
+    decoder = json.JSONDecoder()
+    with final_json.open("r", encoding="utf-8") as f:
+        buf = ""
+        while True:
+            key = buf.find('"segments"')
+            start = buf.find("[", key) if key >= 0 else -1
+            if start >= 0:
+                break
+            block = f.read(block_size)
+            if not block:
+                return
+            buf += block
+        pos = start + 1
+        while True:
+            pos = _ARRAY_SEPARATOR.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                seg, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                block = f.read(block_size)
+                if not block:
+                    raise
+                buf = buf[pos:] + block
+                pos = 0
+                continue
+            yield seg
+
+
+def _chunks_digest(chunk_order: list[int]) -> str:
+    return hashlib.sha256(json.dumps(chunk_order).encode("utf-8")).hexdigest()
+
+
+def load_merge_cursor(cursor_path: Path) -> dict | None:
+    try:
+        return json.loads(cursor_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _save_merge_cursor(cursor_path: Path, cursor: dict) -> None:
+    tmp = cursor_path.with_name(cursor_path.name + ".tmp")
+    tmp.write_text(json.dumps(cursor), encoding="utf-8")
+    os.replace(tmp, cursor_path)
+
+
+def advance_merge(
+    *,
+    cursor_path: Path,
+    chunk_order: list[int],
+    load_partial: Callable[[int], dict | None],
+    writer: TranscriptWriter,
+    finalize: bool = False,
+) -> dict:
+    # The cursor covers the contiguous prefix of finished chunks. Each call merges whatever extends
+    # that prefix and appends to the outputs; finalize merges the rest (skipping chunks that never
+    # produced a partial) and closes the files. Only the merged prefix of chunk_order is pinned, so the
+    # order may keep growing at the end (streaming ingest) without starting over.
+    cursor = load_merge_cursor(cursor_path)
+    if cursor is None or cursor.get("chunks") != _chunks_digest(chunk_order[:int(cursor.get("position", 0))]):
+        cursor = {"chunks": None, "position": 0, "pending": None, "writer": None, "emitted_end": 0.0, "final": False}
+    if cursor["final"]:
+        return cursor
+
+    position = int(cursor["position"])
+    merger = SegmentMerger(cursor["pending"])
+    emitted_end = float(cursor["emitted_end"])
+    writer.open(resume=cursor["writer"])
+    try:
+        while position < len(chunk_order):
+            data = load_partial(chunk_order[position])
+            if data is None:
+                if not finalize:
+                    break
+                position += 1
+                continue
+            for seg in iter_partial_segments([data]):
+                out = merger.push(seg)
+                if out is not None:
+                    writer.write(out)
+                    emitted_end = out["end"]
+            position += 1
+
+        if finalize:
+            last = merger.flush()
+            if last is not None:
+                writer.write(last)
+                emitted_end = last["end"]
+            writer.close()
+            state = None
+        else:
+            state = writer.checkpoint()
+    finally:
+        writer.suspend()
+
+    cursor.update(
+        chunks=_chunks_digest(chunk_order[:position]),
+        position=position,
+        pending=merger.pending,
+        writer=state,
+        emitted_end=emitted_end,
+        final=finalize,
+    )
+    if finalize:
+        cursor["text_chars"] = writer.text_chars
+        cursor["count"] = writer.count
+    _save_merge_cursor(cursor_path, cursor)
+    return cursor
+
+
+def read_merged_text(final_txt: Path, cursor: dict | None) -> str:
+    if cursor is None or not final_txt.exists():
+        return ""
+    if cursor.get("final"):
+        return final_txt.read_text(encoding="utf-8").strip()
+    # Bytes past the checkpoint may belong to a merge that is still running.
+    size = int((cursor.get("writer") or {}).get("txt", 0))
+    with final_txt.open("rb") as f:
+        return f.read(size).decode("utf-8", errors="replace")
+
+
 def merge_partials(
     *,
     partials_dir: Path,
@@ -41,22 +375,17 @@ def merge_partials(
     produce_json: bool = True,
     produce_vtt: bool = True,
 ) -> list[dict]:
-    segments: list[dict] = []
-    for partial in sorted(partials_dir.glob("*.json")):
-        data = json.loads(partial.read_text(encoding="utf-8"))
-        for seg in data.get("segments", []):
-            segments.append(seg)
-
-    merged = _normalize_segments(segments)
-    full_text = " ".join([s["text"] for s in merged]).strip()
-
-    final_txt.write_text(full_text + "\n", encoding="utf-8")
-
-    payload = {"segments": merged, "text": full_text}
-    if produce_json:
-        final_json.write_text(json.dumps(payload, indent=2), encoding="utf-8")
-
-    if produce_vtt and final_vtt is not None:
-        final_vtt.write_text(segments_to_vtt(merged), encoding="utf-8")
-
+    # Partials are walked in chunk order and each one is read only while it is being merged; only the
+    # merged segments handed back to the caller are kept.
+    writer = TranscriptWriter(
+        final_txt=final_txt,
+        final_json=final_json if produce_json else None,
+        final_vtt=final_vtt if produce_vtt else None,
+    )
+    merged: list[dict] = []
+    stream_merge(
+        iter_partial_segments(iter_partials(partials_dir)),
+        writer,
+        on_segment=merged.append,
+    )
     return merged
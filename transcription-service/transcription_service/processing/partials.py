@@ -0,0 +1,139 @@
+﻿from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+LOG_NAME = "segments.jsonl"
+INDEX_NAME = "segments.idx"
+
+# One index record per partial: chunk index, byte offset and length of its line in the log.
+_INDEX_RECORD = struct.Struct("<IQI")
+_APPEND_LOCK = threading.Lock()
+
+
+def encode_partial(payload: dict) -> bytes:
+    record = {
+        "i": int(payload["chunk_index"]),
+        "s": float(payload.get("chunk_start", 0.0)),
+        "e": float(payload.get("chunk_end", 0.0)),
+        "g": [[seg["start"], seg["end"], seg["text"]] for seg in payload.get("segments", [])],
+    }
+    return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def decode_partial(line: bytes) -> dict:
+    record = json.loads(line)
+    segments = [{"start": start, "end": end, "text": text} for start, end, text in record.get("g", [])]
+    return {
+        "chunk_index": int(record["i"]),
+        "chunk_start": float(record.get("s", 0.0)),
+        "chunk_end": float(record.get("e", 0.0)),
+        "segments": segments,
+        "text": " ".join(seg["text"] for seg in segments).strip(),
+    }
+
+
+class PartialLog:
+    # Partials live in one append-only JSONL log per job plus a fixed-width index of where each
+    # chunk's line starts. Legacy partials/<index>.json files are still read.
+    def __init__(self, partials_dir: Path):
+        self.partials_dir = Path(partials_dir)
+        self.log_path = self.partials_dir / LOG_NAME
+        self.index_path = self.partials_dir / INDEX_NAME
+        self._index: dict[int, tuple[int, int]] | None = None
+        self._legacy: dict[int, Path] | None = None
+
+    def append(self, payload: dict) -> None:
+        line = encode_partial(payload)
+        self.partials_dir.mkdir(parents=True, exist_ok=True)
+        with _APPEND_LOCK:
+            log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(log_fd, fcntl.LOCK_EX)
+                offset = os.fstat(log_fd).st_size
+                os.write(log_fd, line)
+                # The index entry is written last, so a crash in between only leaves an unreferenced line.
+                index_fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(index_fd, _INDEX_RECORD.pack(int(payload["chunk_index"]), offset, len(line)))
+                finally:
+                    os.close(index_fd)
+            finally:
+                os.close(log_fd)
+        self._index = None
+
+    def _read_index(self) -> dict[int, tuple[int, int]]:
+        index: dict[int, tuple[int, int]] = {}
+        if self.index_path.exists():
+            data = self.index_path.read_bytes()
+            usable = len(data) - len(data) % _INDEX_RECORD.size
+            for chunk_index, offset, length in _INDEX_RECORD.iter_unpack(data[:usable]):
+                index.setdefault(chunk_index, (offset, length))
+        elif self.log_path.exists():
+            index = self._scan_log()
+        return index
+
+    def _scan_log(self) -> dict[int, tuple[int, int]]:
+        # Recovery path when the index is missing: one pass over the log.
+        index: dict[int, tuple[int, int]] = {}
+        offset = 0
+        with self.log_path.open("rb") as f:
+            for line in f:
+                if line.endswith(b"\n"):
+                    try:
+                        index.setdefault(int(json.loads(line)["i"]), (offset, len(line)))
+                    except (ValueError, KeyError, TypeError):
+                        pass
+                offset += len(line)
+        return index
+
+    @property
+    def index(self) -> dict[int, tuple[int, int]]:
+        if self._index is None:
+            self._index = self._read_index()
+        return self._index
+
+    @property
+    def legacy(self) -> dict[int, Path]:
+        if self._legacy is None:
+            self._legacy = {}
+            if self.partials_dir.exists():
+                for path in self.partials_dir.glob("*.json"):
+                    if path.stem.isdigit():
+                        self._legacy[int(path.stem)] = path
+        return self._legacy
+
+    def indices(self) -> set[int]:
+        return set(self.index) | set(self.legacy)
+
+    def __contains__(self, chunk_index: int) -> bool:
+        return int(chunk_index) in self.index or int(chunk_index) in self.legacy
+
+    def load(self, chunk_index: int) -> dict | None:
+        entry = self.index.get(int(chunk_index))
+        if entry is not None:
+            offset, length = entry
+            with self.log_path.open("rb") as f:
+                f.seek(offset)
+                return decode_partial(f.read(length))
+        path = self.legacy.get(int(chunk_index))
+        if path is not None:
+            return json.loads(path.read_text(encoding="utf-8"))
+        return None
+
+    def iter_chunks(self) -> Iterator[dict]:
+        for chunk_index in sorted(self.indices()):
+            data = self.load(chunk_index)
+            if data is not None:
+                yield data
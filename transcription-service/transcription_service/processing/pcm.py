@@ -0,0 +1,169 @@
+﻿from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+_WAVE_FORMAT_PCM = 1
+_UNKNOWN_SIZES = {0, 0xFFFFFFFF}
+
+
+@dataclass
+class PcmWavInfo:
+    audio_format: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+    data_offset: int
+    data_size: int
+
+    @property
+    def frame_count(self) -> int:
+        frame_bytes = self.channels * (self.bits_per_sample // 8)
+        return self.data_size // frame_bytes if frame_bytes else 0
+
+    @property
+    def duration(self) -> float:
+        return self.frame_count / float(self.sample_rate) if self.sample_rate else 0.0
+
+    @property
+    def is_normalized(self) -> bool:
+        return (
+            self.audio_format == _WAVE_FORMAT_PCM
+            and self.channels == 1
+            and self.sample_rate == SAMPLE_RATE
+            and self.bits_per_sample == 16
+        )
+
+
+def read_pcm_wav_info(path: Path) -> PcmWavInfo | None:
+    path = Path(path)
+    if not path.exists():
+        return None
+    file_size = path.stat().st_size
+    fmt: tuple[int, int, int, int] | None = None
+
+    with path.open("rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+            return None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                body = f.read(chunk_size)
+                if len(body) < 16:
+                    return None
+                audio_format, channels, sample_rate, _byte_rate, _align, bits = struct.unpack("<HHIIHH", body[:16])
+                fmt = (audio_format, channels, sample_rate, bits)
+                if chunk_size % 2:
+                    f.seek(1, 1)
+                continue
+            if chunk_id == b"data":
+                if fmt is None:
+                    return None
+                data_offset = f.tell()
+                available = file_size - data_offset
+                # Streamed writers (ffmpeg to a pipe, progressive ingest) leave the size unset.
+                if chunk_size in _UNKNOWN_SIZES or chunk_size > available:
+                    chunk_size = available
+                audio_format, channels, sample_rate, bits = fmt
+                return PcmWavInfo(
+                    audio_format=audio_format,
+                    channels=channels,
+                    sample_rate=sample_rate,
+                    bits_per_sample=bits,
+                    data_offset=data_offset,
+                    data_size=chunk_size,
+                )
+            f.seek(chunk_size + (chunk_size % 2), 1)
+
+
+def pcm_wav_header(data_size: int | None = None) -> bytes:
+    # Without a size (or past the 4 GiB RIFF limit) both sizes are left unset, which read_pcm_wav_info
+    # resolves from the file size.
+    if data_size is None or data_size > 0xFFFFFFFF - 36:
+        riff_size = data_size = 0xFFFFFFFF
+    else:
+        riff_size = 36 + data_size
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", riff_size, b"WAVE",
+        b"fmt ", 16, _WAVE_FORMAT_PCM, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16,
+        b"data", data_size,
+    )
+
+
+class PcmWavWriter:
+    # Appends 16 kHz mono s16le samples to a wav that readers can map while it grows: everything up to
+    # the last flush() is visible to PcmAudio. close() fills in the sizes.
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.data_size = 0
+        self._f = self.path.open("wb")
+        self._f.write(pcm_wav_header())
+
+    @property
+    def duration(self) -> float:
+        return self.data_size / 2 / float(SAMPLE_RATE)
+
+    def write(self, data: bytes) -> None:
+        self._f.write(data)
+        self.data_size += len(data)
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def close(self) -> None:
+        if self._f is None:
+            return
+        self._f.seek(0)
+        self._f.write(pcm_wav_header(self.data_size))
+        self._f.close()
+        self._f = None
+
+
+class PcmAudio:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        info = read_pcm_wav_info(self.path)
+        if info is None or not info.is_normalized:
+            raise ValueError(f"not a 16 kHz mono s16le wav: {self.path}")
+        self.info = info
+        if info.frame_count:
+            self.samples = np.memmap(self.path, dtype="<i2", mode="r", offset=info.data_offset, shape=(info.frame_count,))
+        else:
+            self.samples = np.zeros(0, dtype="<i2")
+
+    @property
+    def duration(self) -> float:
+        return self.info.duration
+
+    def _bounds(self, start: float, end: float) -> tuple[int, int]:
+        total = int(self.samples.shape[0])
+        lo = min(max(int(round(start * SAMPLE_RATE)), 0), total)
+        hi = min(max(int(round(end * SAMPLE_RATE)), lo), total)
+        return lo, hi
+
+    def slice_int16(self, start: float, end: float) -> np.ndarray:
+        lo, hi = self._bounds(start, end)
+        return self.samples[lo:hi]
+
+    def slice_float32(self, start: float, end: float) -> np.ndarray:
+        view = self.slice_int16(start, end)
+        out = np.empty(view.shape[0], dtype=np.float32)
+        np.multiply(view, 1.0 / 32768.0, out=out, casting="unsafe")
+        return out
+
+
+def open_pcm_audio(path: Path) -> PcmAudio | None:
+    try:
+        return PcmAudio(path)
+    except (OSError, ValueError):
+        return None
@@ -6,6 +6,8 @@ from dataclasses import dataclass
 from pathlib import Path
 
 from ..shared.fs__shared_util import run
+from .energy import detect_silences_energy
+from .pcm import PcmAudio, read_pcm_wav_info
 
 
 @dataclass
@@ -44,6 +46,17 @@ def ffprobe_duration_seconds(ffprobe: Path, media_path: Path) -> float:
         return 0.0
 
 
+def audio_duration_seconds(ffprobe: Path, audio_path: Path) -> float:
+    info = read_pcm_wav_info(audio_path)
+    if info is not None and info.sample_rate:
+        return info.duration
+    return ffprobe_duration_seconds(ffprobe, audio_path)
+
+
+def silencedetect_filter(silence_db: str, silence_min_duration: float) -> str:
+    return f"silencedetect=noise={silence_db}:d={silence_min_duration}"
+
+
 def parse_silencedetect_output(output: str) -> list[tuple[float, float]]:
     silences: list[tuple[float, float]] = []
     cur_start: float | None = None
@@ -98,6 +111,95 @@ def segments_from_silence(silences: list[tuple[float, float]], duration: float,
     return _split_long_segments(segments, max_chunk_seconds)
 
 
+def packing_target_seconds(
+    duration: float,
+    *,
+    parallelism: int,
+    max_chunk_seconds: int,
+    min_target_seconds: float,
+    chunks_per_slot: int = 4,
+) -> float:
+    # Aim for a few chunks per transcriber slot so work stays balanced, never below the floor.
+    slots = max(int(parallelism), 1) * max(int(chunks_per_slot), 1)
+    target = max(duration / slots, float(min_target_seconds))
+    if max_chunk_seconds > 0:
+        target = min(target, float(max_chunk_seconds))
+    return target
+
+
+def pack_segments(segments: list[Segment], target_seconds: float) -> list[Segment]:
+    packed: list[tuple[float, float]] = []
+    for seg in segments:
+        if packed and seg.end - packed[-1][0] <= target_seconds:
+            packed[-1] = (packed[-1][0], seg.end)
+            continue
+        packed.append((seg.start, seg.end))
+    return [
+        Segment(index=i + 1, start=s, end=e)
+        for i, (s, e) in enumerate(packed)
+    ]
+
+
+class StreamingSegmenter:
+    # segments_from_silence + pack_segments for audio that is still arriving. Silences are pushed as the
+    # detector closes them, together with the point before which nothing can change any more, and a chunk
+    # is released as soon as it is final. Given the same silences it yields exactly the batch chunks.
+    def __init__(self, *, max_chunk_seconds: int, target_seconds: float = 0.0):
+        self.max_chunk_seconds = int(max_chunk_seconds)
+        self.target_seconds = float(target_seconds)
+        self.count = 0
+        self._cur = 0.0
+        self._packed: tuple[float, float] | None = None
+
+    def _release(self, out: list[Segment]) -> None:
+        self.count += 1
+        out.append(Segment(index=self.count, start=self._packed[0], end=self._packed[1]))
+        self._packed = None
+
+    def _add(self, start: float, end: float, out: list[Segment]) -> None:
+        if end <= start:
+            return
+        for s, e in _split_long_segments([(start, end)], self.max_chunk_seconds):
+            if self._packed is not None and e - self._packed[0] <= self.target_seconds:
+                self._packed = (self._packed[0], e)
+                continue
+            if self._packed is not None:
+                self._release(out)
+            self._packed = (s, e)
+
+    def _take(self, silences: list[tuple[float, float]], out: list[Segment]) -> None:
+        for s, e in silences:
+            if s > self._cur:
+                self._add(self._cur, s, out)
+            self._cur = max(self._cur, e)
+
+    def push(self, silences: list[tuple[float, float]], settled: float) -> list[Segment]:
+        out: list[Segment] = []
+        self._take(silences, out)
+        # Speech longer than max_chunk_seconds is cut where _split_long_segments would cut it.
+        if self.max_chunk_seconds > 0:
+            while settled - self._cur >= self.max_chunk_seconds:
+                nxt = self._cur + self.max_chunk_seconds
+                self._add(self._cur, nxt, out)
+                self._cur = nxt
+        # Whatever comes next ends at or after settled, so it can no longer join a chunk that is already
+        # longer than the target.
+        if self._packed is not None and settled - self._packed[0] > self.target_seconds:
+            self._release(out)
+        return out
+
+    def finish(self, silences: list[tuple[float, float]], duration: float) -> list[Segment]:
+        out: list[Segment] = []
+        self._take(silences, out)
+        if duration > self._cur:
+            self._add(self._cur, duration, out)
+        if not self.count and self._packed is None and duration > 0:
+            self._add(0.0, duration, out)
+        if self._packed is not None:
+            self._release(out)
+        return out
+
+
 def segment_audio_silence(
     *,
     ffmpeg: Path,
@@ -111,14 +213,18 @@ def segment_audio_silence(
         str(ffmpeg),
         "-hide_banner",
         "-i", str(audio_path),
-        "-af", f"silencedetect=noise={silence_db}:d={silence_min_duration}",
+        "-af", silencedetect_filter(silence_db, silence_min_duration),
         "-f", "null",
         "-",
     ]
     res = run(cmd, capture=True, check=False)
     output = (res.stderr or "") + "\n" + (res.stdout or "")
     silences = parse_silencedetect_output(output)
-    duration = ffprobe_duration_seconds(ffprobe, audio_path)
+    duration = audio_duration_seconds(ffprobe, audio_path)
+    return segment_from_silences(silences, duration, max_chunk_seconds)
+
+
+def segment_from_silences(silences: list[tuple[float, float]], duration: float, max_chunk_seconds: int) -> SegmenterResult:
     segments_raw = segments_from_silence(silences, duration, max_chunk_seconds)
 
     segments: list[Segment] = [
@@ -128,6 +234,21 @@ def segment_audio_silence(
     return SegmenterResult(duration=duration, segments=segments)
 
 
+def segment_audio_energy(
+    *,
+    audio_path: Path,
+    silence_db: str,
+    silence_min_duration: float,
+    max_chunk_seconds: int,
+) -> SegmenterResult:
+    try:
+        audio = PcmAudio(audio_path)
+    except ValueError as exc:
+        raise RuntimeError("CHUNK_MODE=energy requires a 16 kHz mono s16le audio.wav") from exc
+    silences = detect_silences_energy(audio, silence_db=silence_db, min_duration=silence_min_duration)
+    return segment_from_silences(silences, audio.duration, max_chunk_seconds)
+
+
 def segment_audio_vad(
     *,
     audio_path: Path,
@@ -205,6 +326,14 @@ def segment_audio(
             max_chunk_seconds=max_chunk_seconds,
         )
 
+    if mode == "energy":
+        return segment_audio_energy(
+            audio_path=audio_path,
+            silence_db=silence_db,
+            silence_min_duration=silence_min_duration,
+            max_chunk_seconds=max_chunk_seconds,
+        )
+
     return segment_audio_silence(
         ffmpeg=ffmpeg,
         ffprobe=ffprobe,
@@ -220,4 +349,4 @@ def write_segments_json(segments: list[Segment], out_path: Path) -> None:
         {"index": s.index, "start": s.start, "end": s.end}
         for s in segments
     ]
-    out_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    out_path.write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
@@ -18,21 +18,47 @@ class Settings(BaseSettings):
     TRANSCRIPTION_FW_COMPUTE: str = "int8"
     TRANSCRIPTION_FW_BEAM_SIZE: int = 2
     TRANSCRIPTION_FW_VAD_FILTER: bool = False
+    TRANSCRIPTION_FW_BATCH_SIZE: int = 0
     TRANSCRIPTION_SPONSOR_TEXT: str = "Esta transcripcion fue patrocinada por mi Deus Raed, Akuuuuum"
 
     STORAGE_ROOT: str = "./_data/transcription"
 
     REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_POOL_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 20
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
     RQ_RETRY_MAX: int = 3
     RQ_RETRY_INTERVAL: int = 60
     RQ_RETRY_INTERVALS: str | None = "10,60,300"
+    JOB_STORE_BACKEND: str = "json"
+    JOB_STATE_SNAPSHOT_SECONDS: float = 5.0
+    JOB_DEDUPE_ENABLED: bool = True
+    JOB_DEDUPE_TTL_SECONDS: int = 7 * 24 * 3600
 
     MAX_PARALLEL_CHUNKS: int = 2
+    TRANSCRIBE_FANOUT: bool = False
+    TRANSCRIBER_PRELOAD_MODEL: bool = False
+    CHUNK_CACHE_ENABLED: bool = True
+    CHUNK_CACHE_DIR: str | None = None
+    CHUNK_CACHE_MAX_MB: int = 512
+    MERGE_INCREMENTAL: bool = True
+    PARTIALS_FORMAT: str = "log"
+    PACKAGER_THREADS: int = 4
+    PACKAGER_STREAM_ZIP: bool = False
+    DOWNLOAD_CONNECTIONS: int = 4
+    DOWNLOAD_PART_MB: int = 16
+    URL_AUDIO_ONLY: bool = False
+    VIDEO_FETCH_MODE: str = "parallel"
+    INGEST_STREAMING: bool = False
     CHUNK_MODE: str = "silence"
 
     SILENCE_DB: str = "-35dB"
     SILENCE_MIN_DURATION: float = 0.6
     MAX_CHUNK_SECONDS: int = 120
+    CHUNK_SLICING: str = "memmap"
+    CHUNK_PACKING: bool = True
+    CHUNK_TARGET_SECONDS: int = 0
+    CHUNK_MIN_TARGET_SECONDS: int = 30
 
     VAD_THRESHOLD: float = 0.5
     VAD_MIN_SPEECH_MS: int = 250
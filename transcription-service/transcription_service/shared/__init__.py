@@ -1,5 +1,6 @@
 ﻿from .fs__shared_util import (
     ensure_directory,
+    file_checksums,
     hash_file_sha256,
     is_windows,
     remove_diacritics_to_ascii,
@@ -10,6 +11,7 @@
 
 __all__ = [
     "ensure_directory",
+    "file_checksums",
     "hash_file_sha256",
     "is_windows",
     "remove_diacritics_to_ascii",
@@ -6,6 +6,7 @@ import re
 import shutil
 import subprocess
 import unicodedata
+import zlib
 from pathlib import Path
 
 _WIN_BAD = re.compile(r'[<>:"/\\|?*\x00-\x1F]')
@@ -17,6 +18,15 @@ def ensure_directory(path: Path) -> Path:
     return path
 
 
+def copy_file_atomic(src: Path, dest: Path) -> Path:
+    # dest never exists half-written: readers treat its presence as "ready".
+    ensure_directory(dest.parent)
+    tmp = dest.with_name(dest.name + ".part")
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dest)
+    return dest
+
+
 def hash_file_sha256(path: Path) -> str:
     sha256 = hashlib.sha256()
     with open(path, "rb") as f:
@@ -25,6 +35,18 @@ def hash_file_sha256(path: Path) -> str:
     return sha256.hexdigest()
 
 
+def file_checksums(path: Path, *, sha256: bool = True) -> tuple[int, str | None]:
+    # One pass for the ZIP CRC-32 and, unless the caller already has it, the SHA-256.
+    digest = hashlib.sha256() if sha256 else None
+    crc = 0
+    with Path(path).open("rb") as f:
+        while block := f.read(1024 * 1024):
+            crc = zlib.crc32(block, crc)
+            if digest is not None:
+                digest.update(block)
+    return crc, digest.hexdigest() if digest is not None else None
+
+
 def remove_diacritics_to_ascii(s: str) -> str:
     if not s:
         return ""
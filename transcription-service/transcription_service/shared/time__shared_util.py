@@ -0,0 +1,22 @@
+﻿from __future__ import annotations
+
+from typing import Mapping
+
+
+def segment_timestamp(seconds: float) -> str:
+    total = int(seconds)
+    return f"[{total // 3600:02d}:{(total % 3600) // 60:02d}:{total % 60:02d}]"
+
+
+def duration_header(seconds: float | None) -> list[str]:
+    # The PDF header picks its "Duration:" line out of these.
+    if not seconds or seconds <= 0:
+        return []
+    total = int(seconds)
+    return [f"Duration: {total // 60}:{total % 60:02d}"]
+
+
+def last_segment_end(segments: list[Mapping]) -> float | None:
+    if not segments:
+        return None
+    return float(segments[-1].get("end", 0.0) or 0.0)
@@ -4,24 +4,101 @@ import json
 import traceback
 from pathlib import Path
 
+from redis.exceptions import LockError
 from rq import Worker
 
 from ..settings import settings
+from ..jobs.models import JobState
 from ..jobs.paths import JobPaths
-from ..jobs.store import JobStore
 from ..jobs.logger import JobLogger
+from ..jobs.cancel import is_canceled
+from ..jobs.digests import record_digest
+from ..jobs.locks import keep_alive
 from ..jobs.queue import QUEUE_MERGER, QUEUE_PACKAGER, enqueue, get_redis
-from ..jobs.utils import storage_root
-from ..processing.merge import merge_partials
+from ..jobs.utils import open_job_store, storage_root
+from ..processing.merge import TranscriptWriter, advance_merge, load_merge_cursor
+from ..processing.partials import PartialLog
 from .packager import package_job
 
 
+def _chunk_order(paths: JobPaths, partials: PartialLog) -> list[int]:
+    # The streaming ingest writes chunks.json before it drops chunks.stream.jsonl, so a second look
+    # always finds one of them while an ingest is finishing.
+    for _ in range(2):
+        if paths.chunks_meta_path.exists():
+            chunks = json.loads(paths.chunks_meta_path.read_text(encoding="utf-8"))
+            return [int(c["index"]) for c in chunks]
+        try:
+            # Still being appended to; a line without its newline is not written yet.
+            with paths.chunks_stream_path.open("r", encoding="utf-8") as f:
+                return [int(json.loads(line)["index"]) for line in f if line.endswith("\n")]
+        except FileNotFoundError:
+            continue
+    return sorted(partials.indices())
+
+
+_MERGE_LOCK_SECONDS = 600
+
+
+class MergeLockTimeout(RuntimeError):
+    pass
+
+
+def merge_available(job: JobState, paths: JobPaths, *, finalize: bool = False) -> dict | None:
+    # Transcribers advance the merge opportunistically and skip it when another process holds the
+    # lock; the final merge waits for it so the tail is never lost.
+    lock = get_redis().lock(
+        f"transcription:job:{job.job_id}:merge",
+        timeout=_MERGE_LOCK_SECONDS,
+        blocking_timeout=_MERGE_LOCK_SECONDS,
+        # Renewed from a helper thread, which must see the token.
+        thread_local=False,
+    )
+    if not lock.acquire(blocking=finalize):
+        if finalize:
+            raise MergeLockTimeout(f"merge lock for job {job.job_id} not acquired")
+        return None
+    try:
+        paths.merged_dir.mkdir(parents=True, exist_ok=True)
+        writer = TranscriptWriter(
+            final_txt=paths.final_txt,
+            final_json=paths.final_json if job.options.produce_json else None,
+            final_vtt=paths.final_vtt if job.options.produce_vtt else None,
+        )
+        partials = PartialLog(paths.partials_dir)
+        # A long merge must not outlive the lock's TTL, or a transcriber could start merging underneath.
+        with keep_alive(lock):
+            cursor = advance_merge(
+                cursor_path=paths.merge_cursor_path,
+                chunk_order=_chunk_order(paths, partials),
+                load_partial=partials.load,
+                writer=writer,
+                finalize=finalize,
+            )
+        # The packager reuses these instead of reading the transcripts again.
+        for path, digest in writer.digests.items():
+            record_digest(paths, path, digest["sha256"], crc32=digest.get("crc32"))
+        return cursor
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            pass
+
+
+def _merged_position(paths: JobPaths) -> int:
+    cursor = load_merge_cursor(paths.merge_cursor_path)
+    if cursor is None or cursor.get("final"):
+        return 0
+    return int(cursor.get("position", 0))
+
+
 def merge_job(job_id: str) -> None:
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         return
-    if job.status == "canceled":
+    if job.status == "canceled" or is_canceled(get_redis(), job_id):
         return
 
     paths = JobPaths(storage_root(), job_id)
@@ -29,22 +106,14 @@ def merge_job(job_id: str) -> None:
 
     try:
         store.set_status(job_id, "merging")
-        paths.merged_dir.mkdir(parents=True, exist_ok=True)
-
-        produce_json = bool(job.options.produce_json)
-        produce_vtt = bool(job.options.produce_vtt)
 
-        merge_partials(
-            partials_dir=paths.partials_dir,
-            final_json=paths.final_json,
-            final_txt=paths.final_txt,
-            final_vtt=paths.final_vtt if produce_vtt else None,
-            produce_json=produce_json,
-            produce_vtt=produce_vtt,
-        )
+        before = _merged_position(paths)
+        cursor = merge_available(job, paths, finalize=True)
+        if not cursor or not cursor.get("final"):
+            raise RuntimeError(f"merge of job {job_id} did not finalize")
 
         enqueue(QUEUE_PACKAGER, package_job, job_id)
-        logger.write("merger completed")
+        logger.write(f"merger completed: {cursor['position'] - before} chunks merged at the end, {cursor['count']} segments")
     except Exception as exc:
         store.add_error(job_id, str(exc))
         store.set_status(job_id, "failed")
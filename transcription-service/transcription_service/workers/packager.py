@@ -2,93 +2,232 @@
 
 import json
 import shutil
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import Iterator
 
 from rq import Worker
 
 from ..settings import settings
 from ..jobs.paths import JobPaths
-from ..jobs.store import JobStore
 from ..jobs.logger import JobLogger
+from ..jobs.cancel import CancelWatcher, is_canceled
+from ..jobs.digests import known_digest, known_entry, load_digests
 from ..jobs.queue import QUEUE_PACKAGER, get_redis
-from ..jobs.utils import storage_root
+from ..jobs.utils import open_job_store, storage_root
 from ..infrastructure.pdf.reportlab_adapter import ReportLabPdfWriterAdapter
 from ..infrastructure.packaging.zip_packager import ZipPackagerAdapter
+from ..infrastructure.packaging.zip_stream import (
+    DEFLATED,
+    HashingWriter,
+    StoredSource,
+    StoredZipLayout,
+    ZipEntry,
+    ZipStreamWriter,
+    compression_for,
+    deflate_bytes,
+    deflate_file,
+    file_checksums,
+)
+from ..processing.merge import (
+    iter_json_segments,
+    iter_partial_segments,
+    iter_partials,
+    load_merge_cursor,
+    merge_segments,
+)
 from ..shared.fs__shared_util import ensure_directory, hash_file_sha256
+from .video import ensure_video, needs_video
 
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _load_final_text(paths: JobPaths) -> list[str]:
-    if not paths.final_txt.exists():
-        return []
-    lines = paths.final_txt.read_text(encoding="utf-8").splitlines()
-    return [line.strip() for line in lines if line.strip()]
+def _transcript_segments(paths: JobPaths) -> Iterator[dict]:
+    if paths.final_json.exists():
+        return iter_json_segments(paths.final_json)
+    # produce_json=false: merge the partials again, which yields the same segments.
+    return merge_segments(iter_partial_segments(iter_partials(paths.partials_dir)))
+
+
+def _transcript_end(paths: JobPaths) -> float | None:
+    # The final merge cursor remembers where the last merged segment ended.
+    cursor = load_merge_cursor(paths.merge_cursor_path)
+    if not cursor or not cursor.get("final"):
+        return None
+    return float(cursor.get("emitted_end") or 0.0)
+
 
+_MANIFEST_FILES = [
+    "input/original.mp4",
+    "output/transcript.pdf",
+    "merged/final.json",
+    "merged/final.vtt",
+    "merged/final.txt",
+]
 
-def _write_manifest(paths: JobPaths, job_id: str) -> Path:
+
+def _manifest_bytes(paths: JobPaths, job_id: str, hashed: dict[str, dict]) -> bytes:
     payload = {
         "job_id": job_id,
         "created_at": _now_iso(),
         "files": {},
     }
-    for rel in [
-        "input/original.mp4",
-        "output/transcript.pdf",
-        "merged/final.json",
-        "merged/final.vtt",
-        "merged/final.txt",
-    ]:
+    for rel in _MANIFEST_FILES:
         fp = paths.job_dir / rel
         if fp.exists():
-            payload["files"][rel] = {
+            # Files left out of the archive (produce_json/produce_vtt off) are still listed.
+            payload["files"][rel] = hashed.get(rel) or {
                 "sha256": hash_file_sha256(fp),
                 "size": fp.stat().st_size,
             }
-    paths.manifest_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
-    return paths.manifest_path
+    return json.dumps(payload, indent=2).encode("utf-8")
+
 
+def _artifact_sources(
+    paths: JobPaths,
+    produce_json: bool,
+    produce_vtt: bool,
+    include_video: bool = True,
+) -> list[tuple[Path, str]]:
+    sources: list[tuple[Path, str]] = []
+    if include_video and paths.original_mp4.exists():
+        sources.append((paths.original_mp4, "video.mp4"))
+    if paths.output_pdf().exists():
+        sources.append((paths.output_pdf(), "transcript.pdf"))
+    if produce_json and paths.final_json.exists():
+        sources.append((paths.final_json, "transcript.json"))
+    if produce_vtt and paths.final_vtt.exists():
+        sources.append((paths.final_vtt, "transcript.vtt"))
+    if paths.final_txt.exists():
+        sources.append((paths.final_txt, "transcript.txt"))
+    return sources
 
-def _zip_add(zf, src: Path, arcname: str) -> None:
-    zf.write(src, arcname)
+
+def _log_sources(paths: JobPaths) -> list[tuple[Path, str]]:
+    if not paths.logs_dir.exists():
+        return []
+    return [(log_file, f"logs/{log_file.name}") for log_file in sorted(paths.logs_dir.glob("*.log"))]
 
 
-def _build_zip(paths: JobPaths, job_id: str, produce_json: bool, produce_vtt: bool) -> Path:
+def _build_zip(
+    paths: JobPaths,
+    job_id: str,
+    produce_json: bool,
+    produce_vtt: bool,
+    include_video: bool = True,
+) -> tuple[Path, list[ZipEntry], str]:
     ensure_directory(paths.output_dir)
     zip_path = paths.output_zip()
+    artifacts = _artifact_sources(paths, produce_json, produce_vtt, include_video)
+    logs = _log_sources(paths)
+    recorded = load_digests(paths)
+
+    # Every artifact is read exactly once: CRC, SHA-256 and the archive bytes come from the same pass,
+    # and digests recorded upstream (upload, merger) are trusted while size and mtime still match.
+    # Text artifacts are deflated on worker threads while the media is copied in stored.
+    with ThreadPoolExecutor(max_workers=max(int(settings.PACKAGER_THREADS), 1)) as pool:
+        deflated = {
+            arcname: pool.submit(deflate_file, src, sha256=known_digest(recorded, paths, src) is None)
+            for src, arcname in artifacts + logs
+            if compression_for(arcname) == DEFLATED
+        }
+        with zip_path.open("wb") as f:
+            out = HashingWriter(f)
+            writer = ZipStreamWriter(out)
+            hashed: dict[str, dict] = {}
+            for src, arcname in artifacts:
+                known = known_digest(recorded, paths, src)
+                if arcname in deflated:
+                    entry = writer.add_deflated(arcname, deflated[arcname].result(), mtime=src.stat().st_mtime)
+                else:
+                    entry = writer.add_file(arcname, src, sha256=known is None)
+                rel = src.relative_to(paths.job_dir).as_posix()
+                hashed[rel] = {"sha256": known or entry.sha256, "size": entry.size}
+
+            manifest = _manifest_bytes(paths, job_id, hashed)
+            paths.manifest_path.write_bytes(manifest)
+            writer.add_deflated("manifest.json", deflate_bytes(manifest), mtime=paths.manifest_path.stat().st_mtime)
+
+            for src, arcname in logs:
+                writer.add_deflated(arcname, deflated[arcname].result(), mtime=src.stat().st_mtime)
+            writer.close()
+
+    return zip_path, writer.entries, out.hexdigest()
+
+
+def _checksums(paths: JobPaths, recorded: dict[str, dict], src: Path) -> tuple[int, str]:
+    entry = known_entry(recorded, paths, src)
+    if entry and entry.get("crc32") is not None:
+        return int(entry["crc32"]), entry["sha256"]
+    crc, sha256 = file_checksums(src, sha256=entry is None)
+    return crc, sha256 or entry["sha256"]
+
 
-    import zipfile
+def _stored_source(src: Path, arcname: str, crc: int) -> StoredSource:
+    st = src.stat()
+    return StoredSource(name=arcname, path=src, size=st.st_size, crc=crc, mtime_ns=st.st_mtime_ns)
 
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        if paths.original_mp4.exists():
-            _zip_add(zf, paths.original_mp4, "video.mp4")
-        if paths.output_pdf().exists():
-            _zip_add(zf, paths.output_pdf(), "transcript.pdf")
-        if produce_json and paths.final_json.exists():
-            _zip_add(zf, paths.final_json, "transcript.json")
-        if produce_vtt and paths.final_vtt.exists():
-            _zip_add(zf, paths.final_vtt, "transcript.vtt")
-        if paths.final_txt.exists():
-            _zip_add(zf, paths.final_txt, "transcript.txt")
-        if paths.manifest_path.exists():
-            _zip_add(zf, paths.manifest_path, "manifest.json")
-        if paths.logs_dir.exists():
-            for log_file in paths.logs_dir.glob("*.log"):
-                _zip_add(zf, log_file, f"logs/{log_file.name}")
 
-    return zip_path
+def _plan_zip(
+    paths: JobPaths,
+    job_id: str,
+    produce_json: bool,
+    produce_vtt: bool,
+    include_video: bool = True,
+) -> StoredZipLayout:
+    # Nothing is archived here: only the CRCs the download needs are computed (or taken from
+    # digests.json) and the entry list is saved, so GET /download can stream the ZIP on demand.
+    ensure_directory(paths.output_dir)
+    paths.output_zip().unlink(missing_ok=True)
+    artifacts = _artifact_sources(paths, produce_json, produce_vtt, include_video)
+    recorded = load_digests(paths)
+
+    with ThreadPoolExecutor(max_workers=max(int(settings.PACKAGER_THREADS), 1)) as pool:
+        checksums = list(pool.map(lambda src: _checksums(paths, recorded, src), [src for src, _ in artifacts]))
+
+    sources: list[StoredSource] = []
+    hashed: dict[str, dict] = {}
+    for (src, arcname), (crc, sha256) in zip(artifacts, checksums):
+        sources.append(_stored_source(src, arcname, crc))
+        hashed[src.relative_to(paths.job_dir).as_posix()] = {"sha256": sha256, "size": src.stat().st_size}
+
+    paths.manifest_path.write_bytes(_manifest_bytes(paths, job_id, hashed))
+    sources.append(_stored_source(paths.manifest_path, "manifest.json", file_checksums(paths.manifest_path, sha256=False)[0]))
+
+    # job.log keeps growing after packaging, so the archive points at a snapshot of it.
+    shutil.rmtree(paths.output_logs_dir, ignore_errors=True)
+    for src, arcname in _log_sources(paths):
+        snapshot = ensure_directory(paths.output_logs_dir) / src.name
+        shutil.copyfile(src, snapshot)
+        sources.append(_stored_source(snapshot, arcname, file_checksums(snapshot, sha256=False)[0]))
+
+    layout = StoredZipLayout(sources)
+    paths.package_plan().write_text(json.dumps(layout.to_dict(paths.job_dir), indent=2), encoding="utf-8")
+    return layout
+
+
+def _describe_zip(zip_path: Path, entries: list[ZipEntry], elapsed: float) -> str:
+    total = sum(e.size for e in entries)
+    text_in = sum(e.size for e in entries if e.method == DEFLATED)
+    text_out = sum(e.compressed_size for e in entries if e.method == DEFLATED)
+    ratio = (text_out / text_in) if text_in else 1.0
+    return (
+        f"packaged {len(entries)} entries in {elapsed:.2f}s: {total} -> {zip_path.stat().st_size} bytes, "
+        f"text deflated {text_in} -> {text_out} bytes ({ratio:.1%})"
+    )
 
 
 def package_job(job_id: str) -> None:
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         return
-    if job.status == "canceled":
+    if job.status == "canceled" or is_canceled(get_redis(), job_id):
         return
 
     paths = JobPaths(storage_root(), job_id)
@@ -102,28 +241,71 @@ def package_job(job_id: str) -> None:
 
         produce_pdf = bool(job.options.produce_pdf)
         if produce_pdf:
-            transcript_lines = _load_final_text(paths)
-            pdf_writer.write_pdf(
+            pdf_writer.write_segments_pdf(
                 paths.output_pdf(),
                 title=f"Transcription {job_id}",
                 source_url=job.input.value if job.input.type == "url" else None,
-                transcript_lines=transcript_lines,
+                segments=_transcript_segments(paths),
                 sponsor_text=settings.TRANSCRIPTION_SPONSOR_TEXT,
+                duration=_transcript_end(paths),
             )
 
-        _write_manifest(paths, job_id)
+        include_video = bool(job.options.include_video)
+        if needs_video(job, paths):
+            # The background fetch started by the splitter is usually done by now; if it failed or is
+            # still running, this waits for it or downloads the video itself. The transcript is worth
+            # delivering without it.
+            with CancelWatcher(get_redis(), job_id) as watcher:
+                try:
+                    ensure_video(job, paths, logger, watcher)
+                except InterruptedError:
+                    raise
+                except Exception as exc:
+                    logger.write("video download failed; packaging without video.mp4")
+                    logger.write(traceback.format_exc())
+                    store.add_error(job_id, f"video.mp4 left out of the package: {exc}")
 
-        zip_path = _build_zip(paths, job_id, bool(job.options.produce_json), bool(job.options.produce_vtt))
-
-        store.update(
-            job_id,
-            result={
+        t0 = time.perf_counter()
+        if settings.PACKAGER_STREAM_ZIP:
+            layout = _plan_zip(
+                paths,
+                job_id,
+                bool(job.options.produce_json),
+                bool(job.options.produce_vtt),
+                include_video,
+            )
+            logger.write(
+                f"planned streamed zip with {len(layout.entries)} entries in {time.perf_counter() - t0:.2f}s: "
+                f"{layout.size} bytes, etag {layout.etag}"
+            )
+            result = {
+                "zip_path": None,
+                "download_name": paths.output_zip().name,
+                "zip_size": layout.size,
+                "zip_etag": layout.etag,
+            }
+        else:
+            zip_path, entries, zip_sha256 = _build_zip(
+                paths,
+                job_id,
+                bool(job.options.produce_json),
+                bool(job.options.produce_vtt),
+                include_video,
+            )
+            logger.write(_describe_zip(zip_path, entries, time.perf_counter() - t0))
+            logger.write(f"zip sha256 {zip_sha256}")
+            result = {
                 "zip_path": str(zip_path),
                 "download_name": zip_path.name,
-            },
-        )
+                "zip_sha256": zip_sha256,
+                "zip_size": zip_path.stat().st_size,
+            }
+
+        store.update(job_id, result=result)
         store.set_status(job_id, "done")
         logger.write("packager completed")
+    except InterruptedError:
+        logger.write("packager canceled")
     except Exception as exc:
         store.add_error(job_id, str(exc))
         store.set_status(job_id, "failed")
@@ -1,43 +1,85 @@
 ﻿from __future__ import annotations
 
 import json
+import os
 import shutil
+import subprocess
+import time
 import traceback
+from contextlib import ExitStack
 from pathlib import Path
 from datetime import datetime, timezone
-from urllib.parse import urlparse
 
-import requests
+import numpy as np
 from rq import Worker
 
 from ..settings import settings
 from ..jobs.paths import JobPaths
 from ..jobs.store import JobStore
 from ..jobs.logger import JobLogger
-from ..jobs.queue import QUEUE_TRANSCRIBER, enqueue, get_redis
-from ..jobs.utils import storage_root
-from ..processing.segmenter import segment_audio, write_segments_json
-from ..shared.fs__shared_util import ensure_directory, run
+from ..jobs.barrier import ChunkBarrier
+from ..jobs.cancel import CancelWatcher
+from ..jobs.queue import QUEUE_MERGER, QUEUE_SPLITTER, QUEUE_TRANSCRIBER, QUEUE_VIDEO, enqueue, get_queue, get_redis
+from ..jobs.utils import open_job_store, storage_root
+from ..processing.energy import EnergySilenceDetector
+from ..processing.partials import PartialLog
+from ..processing.pcm import PcmWavWriter, read_pcm_wav_info
+from ..processing.segmenter import (
+    Segment,
+    StreamingSegmenter,
+    audio_duration_seconds,
+    pack_segments,
+    packing_target_seconds,
+    parse_silencedetect_output,
+    segment_audio,
+    segment_from_silences,
+    silencedetect_filter,
+    write_segments_json,
+)
+from ..shared.fs__shared_util import copy_file_atomic, ensure_directory, run
 from ..infrastructure.tools.ffmpeg_provider import ensure_ffmpeg
 from ..infrastructure.downloader.yt_dlp_adapter import YtDlpDownloaderAdapter
-from .transcriber import transcribe_job
+from .merger import merge_job
+from .transcriber import transcribe_chunk_job, transcribe_job
+from .video import download_direct, fetch_video_job, is_direct_mp4, needs_video
 
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _download_direct(url: str, dest: Path) -> None:
-    dest.parent.mkdir(parents=True, exist_ok=True)
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        with dest.open("wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
+def _source_audio(paths: JobPaths) -> Path | None:
+    found = [p for p in paths.input_dir.glob("source_audio.*") if p.suffix != ".part"]
+    return found[0] if found else None
 
 
-def _ensure_original(job, paths: JobPaths, logger: JobLogger, ffmpeg: Path) -> None:
+def _ensure_source(job, paths: JobPaths, logger: JobLogger, ffmpeg: Path, *, runner=run, check_canceled=None) -> Path:
+    # Returns the media audio.wav is decoded from. audio_only URL jobs that go through yt-dlp fetch just
+    # the audio stream here; the video follows in the background or when the packager needs it.
+    if paths.original_mp4.exists():
+        return paths.original_mp4
+    if not (job.options.audio_only and job.input.type == "url" and not is_direct_mp4(job.input.value)):
+        _ensure_original(job, paths, logger, ffmpeg, runner=runner, check_canceled=check_canceled)
+        return paths.original_mp4
+
+    source = _source_audio(paths)
+    if source is None:
+        downloader = YtDlpDownloaderAdapter(ffmpeg=ffmpeg, runner=runner)
+        logger.write("downloading audio only via yt-dlp")
+        work_dir = paths.input_dir / "ytdlp_audio"
+        media_path = downloader.download_audio(
+            job.input.value,
+            work_dir,
+            cookies_from_browser=job.options.cookies_from_browser,
+        )
+        source = copy_file_atomic(media_path, paths.input_dir / f"source_audio{media_path.suffix}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if settings.VIDEO_FETCH_MODE == "parallel" and needs_video(job, paths):
+        enqueue(QUEUE_VIDEO, fetch_video_job, job.job_id)
+    return source
+
+
+def _ensure_original(job, paths: JobPaths, logger: JobLogger, ffmpeg: Path, *, runner=run, check_canceled=None) -> None:
     if paths.original_mp4.exists():
         return
 
@@ -53,52 +95,81 @@ def _ensure_original(job, paths: JobPaths, logger: JobLogger, ffmpeg: Path) -> N
         src = Path(input_value)
         if not src.exists():
             raise RuntimeError(f"input path not found: {src}")
-        ensure_directory(paths.input_dir)
-        shutil.copy2(src, paths.original_mp4)
+        copy_file_atomic(src, paths.original_mp4)
         return
 
     if input_type == "url":
-        parsed = urlparse(input_value)
-        if parsed.scheme in {"http", "https"} and parsed.path.lower().endswith(".mp4"):
+        if is_direct_mp4(input_value):
             logger.write("downloading direct mp4")
-            _download_direct(input_value, paths.original_mp4)
+            download_direct(input_value, paths.original_mp4, logger, check_canceled=check_canceled)
             return
 
-        downloader = YtDlpDownloaderAdapter(ffmpeg=ffmpeg)
+        downloader = YtDlpDownloaderAdapter(ffmpeg=ffmpeg, runner=runner)
         logger.write("downloading via yt-dlp")
         media_path = downloader.download(input_value, paths.input_dir, cookies_from_browser=job.options.cookies_from_browser)
         if not media_path.exists():
             raise RuntimeError("downloaded media not found")
-        shutil.copy2(media_path, paths.original_mp4)
+        copy_file_atomic(media_path, paths.original_mp4)
         return
 
     raise RuntimeError(f"unsupported input type: {input_type}")
 
 
-def _normalize_audio(ffmpeg: Path, paths: JobPaths, logger: JobLogger) -> None:
+def _load_silences(paths: JobPaths) -> list[tuple[float, float]] | None:
+    if not paths.silences_path.exists():
+        return None
+    data = json.loads(paths.silences_path.read_text(encoding="utf-8"))
+    return [(float(s), float(e)) for s, e in data]
+
+
+def _normalize_audio(
+    ffmpeg: Path,
+    paths: JobPaths,
+    logger: JobLogger,
+    *,
+    source: Path,
+    detect_silence: bool,
+    runner=run,
+) -> list[tuple[float, float]] | None:
     if paths.audio_wav.exists():
-        return
-    if not paths.original_mp4.exists():
-        raise RuntimeError("original.mp4 not found")
+        return _load_silences(paths) if detect_silence else None
+    if not source.exists():
+        raise RuntimeError(f"{source.name} not found")
 
     ensure_directory(paths.input_dir)
+    tmp_wav = paths.audio_wav.with_name("audio.tmp.wav")
     cmd = [
         str(ffmpeg),
         "-hide_banner",
-        "-loglevel", "error",
+        "-nostats",
+        "-loglevel", "info" if detect_silence else "error",
         "-y",
-        "-i", str(paths.original_mp4),
+        "-i", str(source),
         "-ac", "1",
         "-ar", "16000",
         "-vn",
+    ]
+    if detect_silence:
+        # silencedetect passes audio through, so the same decode feeds both audio.wav and the detector.
+        cmd += ["-af", "aformat=sample_fmts=s16:sample_rates=16000:channel_layouts=mono," + silencedetect_filter(
+            settings.SILENCE_DB, settings.SILENCE_MIN_DURATION
+        )]
+    cmd += [
         "-c:a", "pcm_s16le",
-        str(paths.audio_wav),
+        str(tmp_wav),
     ]
-    logger.write("normalizing audio")
-    run(cmd, check=True)
+    logger.write("normalizing audio" + (" with silence detection" if detect_silence else ""))
+    res = runner(cmd, check=True, capture=detect_silence)
+
+    silences = None
+    if detect_silence:
+        silences = parse_silencedetect_output(res.stderr or "")
+        paths.silences_path.write_text(json.dumps(silences), encoding="utf-8")
+    tmp_wav.replace(paths.audio_wav)
+    return silences
 
 
-def _export_chunk(ffmpeg: Path, audio_path: Path, chunk_path: Path, start: float, end: float) -> None:
+def _export_chunk(ffmpeg: Path, audio_path: Path, chunk_path: Path, start: float, end: float, *, runner=run) -> None:
     duration = max(end - start, 0.01)
     cmd = [
         str(ffmpeg),
@@ -113,11 +184,253 @@ def _export_chunk(ffmpeg: Path, audio_path: Path, chunk_path: Path, start: float
         "-c:a", "pcm_s16le",
         str(chunk_path),
     ]
-    run(cmd, check=True)
+    runner(cmd, check=True)
+
+
+def _transcriber_parallelism(job) -> int:
+    if settings.TRANSCRIBE_FANOUT:
+        try:
+            workers = Worker.count(queue=get_queue(QUEUE_TRANSCRIBER))
+        except Exception:
+            workers = 0
+        if workers > 0:
+            return workers
+    return max(int(job.options.max_parallel_chunks or settings.MAX_PARALLEL_CHUNKS), 1)
+
+
+def _fixed_target_seconds() -> float:
+    # A configured target never packs past the chunk length limit; derived targets are capped by
+    # packing_target_seconds.
+    target = float(settings.CHUNK_TARGET_SECONDS)
+    if target > 0 and settings.MAX_CHUNK_SECONDS > 0:
+        target = min(target, float(settings.MAX_CHUNK_SECONDS))
+    return target
+
+
+def _pack(job, segments: list, duration: float, logger: JobLogger) -> list:
+    if not settings.CHUNK_PACKING or not segments:
+        return segments
+    target = _fixed_target_seconds()
+    if target <= 0:
+        target = packing_target_seconds(
+            duration,
+            parallelism=_transcriber_parallelism(job),
+            max_chunk_seconds=settings.MAX_CHUNK_SECONDS,
+            min_target_seconds=settings.CHUNK_MIN_TARGET_SECONDS,
+        )
+    packed = pack_segments(segments, target)
+    logger.write(f"packed {len(segments)} segments into {len(packed)} chunks (target {target:.1f}s)")
+    return packed
+
+
+def _can_slice_in_memory(paths: JobPaths) -> bool:
+    if settings.CHUNK_SLICING != "memmap":
+        return False
+    info = read_pcm_wav_info(paths.audio_wav)
+    return info is not None and info.is_normalized
+
+
+def _dispatch_chunks(
+    job_id: str,
+    store: JobStore,
+    paths: JobPaths,
+    segments: list[dict],
+    *,
+    generation: str | None = None,
+) -> None:
+    partials = PartialLog(paths.partials_dir)
+    missing = [seg for seg in segments if int(seg["index"]) not in partials]
+    store.set_status(job_id, "transcribing")
+    store.set_progress(job_id, chunks_total=len(segments), chunks_done=len(segments) - len(missing))
+
+    barrier = ChunkBarrier(get_redis(), job_id)
+    barrier.reset()
+    barrier.expect(int(seg["index"]) for seg in missing)
+    for seg in missing:
+        enqueue(
+            QUEUE_TRANSCRIBER,
+            transcribe_chunk_job,
+            job_id,
+            int(seg["index"]),
+            float(seg["start"]),
+            float(seg["end"]),
+            generation,
+        )
+    if barrier.seal():
+        enqueue(QUEUE_MERGER, merge_job, job_id)
+
+
+_STREAM_CHUNK_MODES = {"silence", "energy"}
+_STREAM_BLOCK = 64 * 1024
+
+
+def _streams(job) -> bool:
+    return (
+        job.input.type == "url"
+        and settings.TRANSCRIBE_FANOUT
+        and settings.CHUNK_SLICING == "memmap"
+        and job.options.chunk_mode in _STREAM_CHUNK_MODES
+    )
+
+
+def _stream_target_seconds() -> float:
+    if not settings.CHUNK_PACKING:
+        return 0.0
+    if _fixed_target_seconds() > 0:
+        return _fixed_target_seconds()
+    # The duration is unknown while streaming, so a derived target falls back to its floor.
+    return packing_target_seconds(
+        0.0,
+        parallelism=1,
+        max_chunk_seconds=settings.MAX_CHUNK_SECONDS,
+        min_target_seconds=settings.CHUNK_MIN_TARGET_SECONDS,
+    )
+
+
+def _decode_command(ffmpeg: Path, source: str) -> list[str]:
+    return [
+        str(ffmpeg),
+        "-hide_banner",
+        "-nostats",
+        "-loglevel", "error",
+        "-i", source,
+        "-vn",
+        "-ac", "1",
+        "-ar", "16000",
+        "-c:a", "pcm_s16le",
+        "-f", "s16le",
+        "pipe:1",
+    ]
+
+
+def _reset_stream(paths: JobPaths) -> None:
+    # An interrupted ingest cannot pick up where it stopped (a live source has moved on), so it starts over
+    # together with everything derived from the old audio.
+    for path in (paths.audio_wav, paths.chunks_stream_path, paths.merge_cursor_path):
+        path.unlink(missing_ok=True)
+    shutil.rmtree(paths.partials_dir, ignore_errors=True)
+
+
+def _await_stale_chunks(barrier: ChunkBarrier, generation: str, logger: JobLogger, watcher: CancelWatcher) -> None:
+    if not barrier.running_before(generation):
+        return
+    logger.write("streaming ingest: waiting for chunk jobs of the previous attempt to finish")
+    while barrier.running_before(generation):
+        watcher.raise_if_canceled()
+        time.sleep(1.0)
+
+
+def _write_chunks_meta(segments: list[Segment], paths: JobPaths) -> None:
+    # Merging transcribers read chunks.json as soon as it appears.
+    tmp = paths.chunks_meta_path.with_name(paths.chunks_meta_path.name + ".tmp")
+    write_segments_json(segments, tmp)
+    os.replace(tmp, paths.chunks_meta_path)
+
+
+def _stream_ingest(job, store: JobStore, paths: JobPaths, logger: JobLogger, ffmpeg: Path, watcher: CancelWatcher) -> None:
+    # Download, decode, silence detection and transcription overlap: ffmpeg turns the source into PCM that
+    # is appended to audio.wav and fed to the online energy detector, and every chunk is queued for the
+    # transcribers as soon as its end is final.
+    job_id = job.job_id
+    # Chunk jobs of an earlier attempt may still be queued or running; they must not touch what this one
+    # writes, so they are cut off first and the running ones are waited for before anything is removed.
+    barrier = ChunkBarrier(get_redis(), job_id)
+    generation = barrier.begin_generation()
+    _await_stale_chunks(barrier, generation, logger, watcher)
+    if paths.chunks_meta_path.exists():
+        # The ingest itself finished: only chunks without a partial are queued again, under this generation.
+        segments = json.loads(paths.chunks_meta_path.read_text(encoding="utf-8"))
+        _dispatch_chunks(job_id, store, paths, segments, generation=generation)
+        return
+
+    _reset_stream(paths)
+    barrier.reset()
+    ensure_directory(paths.input_dir)
+    ensure_directory(paths.logs_dir)
+    if settings.VIDEO_FETCH_MODE == "parallel" and needs_video(job, paths):
+        enqueue(QUEUE_VIDEO, fetch_video_job, job_id)
+
+    detector = EnergySilenceDetector(silence_db=settings.SILENCE_DB, min_duration=settings.SILENCE_MIN_DURATION)
+    segmenter = StreamingSegmenter(max_chunk_seconds=settings.MAX_CHUNK_SECONDS, target_seconds=_stream_target_seconds())
+    chunks: list[Segment] = []
+    t0 = time.perf_counter()
+
+    def _emit(segments: list[Segment]) -> None:
+        if not segments:
+            return
+        # Transcribers map audio.wav themselves, so a chunk's samples must be written before it is queued.
+        wav.flush()
+        with paths.chunks_stream_path.open("a", encoding="utf-8") as f:
+            for seg in segments:
+                f.write(json.dumps({"index": seg.index, "start": seg.start, "end": seg.end}) + "\n")
+        if not chunks:
+            store.set_status(job_id, "transcribing")
+            logger.write(f"streaming ingest: first chunk queued after {time.perf_counter() - t0:.2f}s")
+        chunks.extend(segments)
+        barrier.expect(seg.index for seg in segments)
+        store.set_progress(job_id, chunks_total=len(chunks))
+        for seg in segments:
+            enqueue(QUEUE_TRANSCRIBER, transcribe_chunk_job, job_id, seg.index, seg.start, seg.end, generation)
+
+    wav = PcmWavWriter(paths.audio_wav)
+    try:
+        with (paths.logs_dir / "ingest.log").open("ab") as ingest_log, ExitStack() as stack:
+            source = job.input.value
+            if is_direct_mp4(source):
+                logger.write("streaming ingest: decoding the URL with ffmpeg")
+                fetch = None
+                decoder = stack.enter_context(
+                    watcher.spawn(_decode_command(ffmpeg, source), stdout=subprocess.PIPE, stderr=ingest_log)
+                )
+            else:
+                logger.write("streaming ingest: piping yt-dlp audio into ffmpeg")
+                cmd = YtDlpDownloaderAdapter(ffmpeg=ffmpeg).stream_audio_command(
+                    source,
+                    cookies_from_browser=job.options.cookies_from_browser,
+                )
+                fetch = stack.enter_context(watcher.spawn(cmd, stdout=subprocess.PIPE, stderr=ingest_log))
+                decoder = stack.enter_context(
+                    watcher.spawn(
+                        _decode_command(ffmpeg, "pipe:0"),
+                        stdin=fetch.stdout,
+                        stdout=subprocess.PIPE,
+                        stderr=ingest_log,
+                    )
+                )
+                fetch.stdout.close()
+
+            carry = b""
+            while block := decoder.stdout.read(_STREAM_BLOCK):
+                data = carry + block
+                usable = len(data) - len(data) % 2
+                carry = data[usable:]
+                wav.write(data[:usable])
+                silences = detector.feed(np.frombuffer(data[:usable], dtype="<i2"))
+                _emit(segmenter.push(silences, detector.settled))
+
+            failed = [p.args[0] for p in (fetch, decoder) if p is not None and p.wait() != 0]
+        watcher.raise_if_canceled()
+        if failed:
+            raise RuntimeError(f"streaming ingest failed in {', '.join(map(os.path.basename, failed))} (see logs/ingest.log)")
+        if not wav.data_size:
+            raise RuntimeError("streaming ingest received no audio")
+
+        _emit(segmenter.finish(detector.finish(), detector.position))
+    finally:
+        wav.close()
+
+    _write_chunks_meta(chunks, paths)
+    paths.chunks_stream_path.unlink(missing_ok=True)
+    logger.write(
+        f"streaming ingest: {wav.duration:.1f}s of audio in {len(chunks)} chunks, "
+        f"{time.perf_counter() - t0:.2f}s"
+    )
+    if barrier.seal():
+        enqueue(QUEUE_MERGER, merge_job, job_id)
 
 
 def split_job(job_id: str) -> None:
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         return
@@ -126,58 +439,98 @@ def split_job(job_id: str) -> None:
 
     paths = JobPaths(storage_root(), job_id)
     logger = JobLogger(paths.logs_dir / "job.log")
+    watcher = CancelWatcher(get_redis(), job_id).start()
 
     try:
         store.set_status(job_id, "splitting")
         ffmpeg, ffprobe = ensure_ffmpeg(Path(__file__).resolve().parents[3] / "transcription-service" / ".tools")
 
-        _ensure_original(job, paths, logger, ffmpeg)
-        _normalize_audio(ffmpeg, paths, logger)
+        if settings.INGEST_STREAMING and _streams(job):
+            _stream_ingest(job, store, paths, logger, ffmpeg, watcher)
+            logger.write("splitter completed")
+            return
+        if settings.INGEST_STREAMING and job.input.type == "url":
+            logger.write("streaming ingest needs TRANSCRIBE_FANOUT, CHUNK_SLICING=memmap and chunk_mode silence or energy")
+
+        source = _ensure_source(
+            job,
+            paths,
+            logger,
+            ffmpeg,
+            runner=watcher.run,
+            check_canceled=watcher.raise_if_canceled,
+        )
+        silences = _normalize_audio(
+            ffmpeg,
+            paths,
+            logger,
+            source=source,
+            detect_silence=job.options.chunk_mode == "silence",
+            runner=watcher.run,
+        )
 
         if paths.chunks_meta_path.exists():
             segments_data = json.loads(paths.chunks_meta_path.read_text(encoding="utf-8"))
         else:
-            result = segment_audio(
-                mode=job.options.chunk_mode,
-                ffmpeg=ffmpeg,
-                ffprobe=ffprobe,
-                audio_path=paths.audio_wav,
-                silence_db=settings.SILENCE_DB,
-                silence_min_duration=settings.SILENCE_MIN_DURATION,
-                max_chunk_seconds=settings.MAX_CHUNK_SECONDS,
-                vad_model_path=Path(settings.SILERO_VAD_MODEL_PATH) if settings.SILERO_VAD_MODEL_PATH else None,
-                vad_threshold=settings.VAD_THRESHOLD,
-                vad_min_speech_ms=settings.VAD_MIN_SPEECH_MS,
-                vad_min_silence_ms=settings.VAD_MIN_SILENCE_MS,
-            )
+            if silences is not None:
+                result = segment_from_silences(
+                    silences,
+                    audio_duration_seconds(ffprobe, paths.audio_wav),
+                    settings.MAX_CHUNK_SECONDS,
+                )
+            else:
+                result = segment_audio(
+                    mode=job.options.chunk_mode,
+                    ffmpeg=ffmpeg,
+                    ffprobe=ffprobe,
+                    audio_path=paths.audio_wav,
+                    silence_db=settings.SILENCE_DB,
+                    silence_min_duration=settings.SILENCE_MIN_DURATION,
+                    max_chunk_seconds=settings.MAX_CHUNK_SECONDS,
+                    vad_model_path=Path(settings.SILERO_VAD_MODEL_PATH) if settings.SILERO_VAD_MODEL_PATH else None,
+                    vad_threshold=settings.VAD_THRESHOLD,
+                    vad_min_speech_ms=settings.VAD_MIN_SPEECH_MS,
+                    vad_min_silence_ms=settings.VAD_MIN_SILENCE_MS,
+                )
+            packed = _pack(job, result.segments, result.duration, logger)
             ensure_directory(paths.chunks_dir)
-            write_segments_json(result.segments, paths.chunks_meta_path)
+            write_segments_json(packed, paths.chunks_meta_path)
             segments_data = [
                 {"index": s.index, "start": s.start, "end": s.end}
-                for s in result.segments
+                for s in packed
             ]
 
         segments = segments_data or []
         ensure_directory(paths.chunks_dir)
-        for seg in segments:
-            if store.load(job_id).status == "canceled":
-                return
-            idx = int(seg["index"])
-            start = float(seg["start"])
-            end = float(seg["end"])
-            chunk_path = paths.chunk_path(idx)
-            if chunk_path.exists():
-                continue
-            _export_chunk(ffmpeg, paths.audio_wav, chunk_path, start, end)
-
-        store.set_progress(job_id, chunks_total=len(segments))
-        enqueue(QUEUE_TRANSCRIBER, transcribe_job, job_id)
+        if _can_slice_in_memory(paths):
+            logger.write("chunks will be sliced in memory from audio.wav")
+        else:
+            for seg in segments:
+                watcher.raise_if_canceled()
+                idx = int(seg["index"])
+                start = float(seg["start"])
+                end = float(seg["end"])
+                chunk_path = paths.chunk_path(idx)
+                if chunk_path.exists():
+                    continue
+                _export_chunk(ffmpeg, paths.audio_wav, chunk_path, start, end, runner=watcher.run)
+
+        watcher.raise_if_canceled()
+        if settings.TRANSCRIBE_FANOUT:
+            _dispatch_chunks(job_id, store, paths, segments)
+        else:
+            store.set_progress(job_id, chunks_total=len(segments))
+            enqueue(QUEUE_TRANSCRIBER, transcribe_job, job_id)
         logger.write("splitter completed")
+    except InterruptedError:
+        logger.write("splitter canceled")
     except Exception as exc:
         store.add_error(job_id, str(exc))
         store.set_status(job_id, "failed")
         logger.write(traceback.format_exc())
         raise
+    finally:
+        watcher.stop()
 
 
 def main() -> None:
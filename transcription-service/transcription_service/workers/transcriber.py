@@ -1,20 +1,29 @@
 ﻿from __future__ import annotations
 
 import json
+import logging
 import traceback
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from rq import Worker
+import numpy as np
+from rq import SimpleWorker, Worker
 
 from ..settings import settings
 from ..jobs.paths import JobPaths
-from ..jobs.store import JobStore
 from ..jobs.logger import JobLogger
+from ..jobs.barrier import ChunkBarrier
+from ..jobs.cancel import CancelWatcher, is_canceled
 from ..jobs.queue import QUEUE_MERGER, QUEUE_TRANSCRIBER, enqueue, get_redis
-from ..jobs.utils import storage_root
-from ..processing.chunk_transcriber import FasterWhisperChunkTranscriber
-from .merger import merge_job
+from ..jobs.utils import open_job_store, resolve_path, storage_root
+from ..processing.chunk_cache import ChunkCache, chunk_cache_key
+from ..processing.chunk_transcriber import FasterWhisperChunkTranscriber, get_shared_model, model_cache_stats
+from ..processing.partials import PartialLog
+from ..processing.pcm import SAMPLE_RATE, PcmAudio, open_pcm_audio
+from .merger import merge_available, merge_job
+
+
+log = logging.getLogger(__name__)
 
 
 def _load_segments(paths: JobPaths) -> list[dict]:
@@ -24,13 +33,163 @@ def _load_segments(paths: JobPaths) -> list[dict]:
 
 
 def _write_partial(paths: JobPaths, index: int, payload: dict) -> None:
-    paths.partials_dir.mkdir(parents=True, exist_ok=True)
-    out_path = paths.partial_path(index)
-    out_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    if settings.PARTIALS_FORMAT == "json":
+        paths.partials_dir.mkdir(parents=True, exist_ok=True)
+        paths.partial_path(index).write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        return
+    PartialLog(paths.partials_dir).append(payload)
+
+
+def _build_transcriber() -> FasterWhisperChunkTranscriber:
+    return FasterWhisperChunkTranscriber(
+        model_size=settings.TRANSCRIPTION_FW_MODEL,
+        device=settings.TRANSCRIPTION_FW_DEVICE,
+        compute_type=settings.TRANSCRIPTION_FW_COMPUTE,
+        beam_size=settings.TRANSCRIPTION_FW_BEAM_SIZE,
+        vad_filter=settings.TRANSCRIPTION_FW_VAD_FILTER,
+        shared_model=settings.TRANSCRIBER_PRELOAD_MODEL,
+        num_workers=settings.MAX_PARALLEL_CHUNKS,
+    )
+
+
+def _open_chunk_cache() -> ChunkCache | None:
+    if not settings.CHUNK_CACHE_ENABLED:
+        return None
+    root = resolve_path(settings.CHUNK_CACHE_DIR) if settings.CHUNK_CACHE_DIR else storage_root() / "cache" / "chunks"
+    return ChunkCache(root, max_bytes=int(settings.CHUNK_CACHE_MAX_MB) * 1024 * 1024)
+
+
+def _cache_key(paths: JobPaths, seg: dict, audio: PcmAudio | None, params: dict) -> str:
+    chunk_path = paths.chunk_path(int(seg["index"]))
+    if chunk_path.exists():
+        chunk_audio = open_pcm_audio(chunk_path)
+        return chunk_cache_key(chunk_audio.samples if chunk_audio is not None else chunk_path.read_bytes(), params)
+    if audio is not None:
+        return chunk_cache_key(audio.slice_int16(float(seg["start"]), float(seg["end"])), params)
+    raise RuntimeError(f"chunk not found: {chunk_path}")
+
+
+def _chunk_source(paths: JobPaths, seg: dict, audio: PcmAudio | None) -> Path | np.ndarray:
+    chunk_path = paths.chunk_path(int(seg["index"]))
+    if chunk_path.exists():
+        return chunk_path
+    if audio is not None:
+        return audio.slice_float32(float(seg["start"]), float(seg["end"]))
+    raise RuntimeError(f"chunk not found: {chunk_path}")
+
+
+def _store_result(paths: JobPaths, seg: dict, result: dict) -> dict:
+    idx = int(seg["index"])
+    payload = {
+        "chunk_index": idx,
+        "chunk_start": float(seg["start"]),
+        "chunk_end": float(seg["end"]),
+        "segments": result.get("segments", []),
+        "text": result.get("text", ""),
+    }
+    _write_partial(paths, idx, payload)
+    return payload
+
+
+def _transcribe_segment(
+    transcriber: FasterWhisperChunkTranscriber,
+    paths: JobPaths,
+    seg: dict,
+    language: str,
+    audio: PcmAudio | None,
+    watcher: CancelWatcher | None = None,
+    cache: ChunkCache | None = None,
+) -> dict:
+    chunk_start = float(seg["start"])
+    key = None
+    if cache is not None:
+        key = _cache_key(paths, seg, audio, transcriber.cache_params(language))
+        cached = cache.get(key, chunk_start=chunk_start)
+        if cached is not None:
+            return _store_result(paths, seg, cached)
+    result = transcriber.transcribe_chunk(
+        _chunk_source(paths, seg, audio),
+        chunk_start=chunk_start,
+        language=language,
+        should_stop=(lambda: watcher.canceled) if watcher is not None else None,
+    )
+    if key is not None:
+        cache.put(key, result, chunk_start=chunk_start)
+    return _store_result(paths, seg, result)
+
+
+def _transcribe_group(
+    transcriber: FasterWhisperChunkTranscriber,
+    paths: JobPaths,
+    group: list[dict],
+    language: str,
+    audio: PcmAudio | None,
+    batch_size: int,
+    watcher: CancelWatcher | None = None,
+    cache: ChunkCache | None = None,
+) -> list[dict]:
+    from faster_whisper import decode_audio
+
+    payloads: list[dict] = []
+    pending: list[tuple[dict, str | None]] = []
+    params = transcriber.cache_params(language, batched=True)
+    for seg in group:
+        key = None
+        if cache is not None:
+            key = _cache_key(paths, seg, audio, params)
+            cached = cache.get(key, chunk_start=float(seg["start"]))
+            if cached is not None:
+                payloads.append(_store_result(paths, seg, cached))
+                continue
+        pending.append((seg, key))
+    if not pending:
+        return payloads
+
+    chunks: list[tuple[np.ndarray, float]] = []
+    for seg, _key in pending:
+        source = _chunk_source(paths, seg, audio)
+        if isinstance(source, Path):
+            source = decode_audio(str(source), sampling_rate=SAMPLE_RATE)
+        chunks.append((source, float(seg["start"])))
+    results = transcriber.transcribe_batch(
+        chunks,
+        language=language,
+        batch_size=batch_size,
+        should_stop=(lambda: watcher.canceled) if watcher is not None else None,
+    )
+    for (seg, key), result in zip(pending, results):
+        if key is not None:
+            cache.put(key, result, chunk_start=float(seg["start"]))
+        payloads.append(_store_result(paths, seg, result))
+    return payloads
+
+
+def _batch_groups(segments: list[dict], batch_size: int, window_seconds: float = 30.0) -> list[list[dict]]:
+    # Enough audio per group to fill every batch slot with a full window.
+    budget = max(batch_size, 1) * window_seconds
+    groups: list[list[dict]] = []
+    current: list[dict] = []
+    seconds = 0.0
+    for seg in segments:
+        current.append(seg)
+        seconds += max(float(seg["end"]) - float(seg["start"]), 0.0)
+        if seconds >= budget:
+            groups.append(current)
+            current = []
+            seconds = 0.0
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _group_workers(batch_size: int, max_parallel: int) -> int:
+    # A batched group already keeps the cores busy; more threads would each load their own model
+    # (unless it is shared) and compete with the batch for the same cores.
+    return 1 if batch_size > 0 else max_parallel
 
 
 def transcribe_job(job_id: str) -> None:
-    store = JobStore(storage_root(), redis_url=settings.REDIS_URL)
+    store = open_job_store()
     job = store.load(job_id)
     if not job:
         return
@@ -45,10 +204,10 @@ def transcribe_job(job_id: str) -> None:
 
         segments = _load_segments(paths)
         total = len(segments)
-        done = len(list(paths.partials_dir.glob("*.json"))) if paths.partials_dir.exists() else 0
-        store.set_progress(job_id, chunks_total=total, chunks_done=done)
+        partials = PartialLog(paths.partials_dir)
+        missing = [seg for seg in segments if int(seg["index"]) not in partials]
+        store.set_progress(job_id, chunks_total=total, chunks_done=total - len(missing))
 
-        missing = [seg for seg in segments if not paths.partial_path(int(seg["index"])).exists()]
         if not missing:
             enqueue(QUEUE_MERGER, merge_job, job_id)
             return
@@ -57,48 +216,50 @@ def transcribe_job(job_id: str) -> None:
         if max_parallel < 1:
             max_parallel = settings.MAX_PARALLEL_CHUNKS
 
-        transcriber = FasterWhisperChunkTranscriber(
-            model_size=settings.TRANSCRIPTION_FW_MODEL,
-            device=settings.TRANSCRIPTION_FW_DEVICE,
-            compute_type=settings.TRANSCRIPTION_FW_COMPUTE,
-            beam_size=settings.TRANSCRIPTION_FW_BEAM_SIZE,
-            vad_filter=settings.TRANSCRIPTION_FW_VAD_FILTER,
-        )
-
-        def _process(seg: dict) -> dict:
-            idx = int(seg["index"])
-            start = float(seg["start"])
-            end = float(seg["end"])
-            chunk_path = paths.chunk_path(idx)
-            if not chunk_path.exists():
-                raise RuntimeError(f"chunk not found: {chunk_path}")
-            result = transcriber.transcribe_chunk(chunk_path, chunk_start=start, language=job.options.language)
-            payload = {
-                "chunk_index": idx,
-                "chunk_start": start,
-                "chunk_end": end,
-                "segments": result.get("segments", []),
-                "text": result.get("text", ""),
-            }
-            _write_partial(paths, idx, payload)
-            return payload
-
-        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
-            futures = {executor.submit(_process, seg): seg for seg in missing}
-            for future in as_completed(futures):
-                if store.load(job_id).status == "canceled":
-                    return
-                try:
-                    future.result()
-                except Exception as exc:
-                    store.add_error(job_id, str(exc))
-                    raise
-                else:
-                    done += 1
-                    store.set_progress(job_id, chunks_done=done)
+        transcriber = _build_transcriber()
+        audio = open_pcm_audio(paths.audio_wav)
+        batch_size = int(settings.TRANSCRIPTION_FW_BATCH_SIZE)
+        cache = _open_chunk_cache()
+
+        with CancelWatcher(get_redis(), job_id) as watcher:
+
+            def _process(group: list[dict]) -> list[dict]:
+                watcher.raise_if_canceled()
+                language = job.options.language
+                if batch_size > 0:
+                    return _transcribe_group(transcriber, paths, group, language, audio, batch_size, watcher, cache)
+                return [_transcribe_segment(transcriber, paths, seg, language, audio, watcher, cache) for seg in group]
+
+            groups = _batch_groups(missing, batch_size) if batch_size > 0 else [[seg] for seg in missing]
+            executor = ThreadPoolExecutor(max_workers=_group_workers(batch_size, max_parallel))
+            try:
+                futures = {executor.submit(_process, group): group for group in groups}
+                for future in as_completed(futures):
+                    watcher.raise_if_canceled()
+                    try:
+                        future.result()
+                    except InterruptedError:
+                        raise
+                    except Exception as exc:
+                        store.add_error(job_id, str(exc))
+                        raise
+                    else:
+                        store.incr_progress(job_id, len(futures[future]))
+                        if settings.MERGE_INCREMENTAL:
+                            merge_available(job, paths)
+            finally:
+                # On cancel or failure, queued chunks are dropped and running ones stop at their next segment.
+                executor.shutdown(wait=not watcher.canceled, cancel_futures=True)
 
         enqueue(QUEUE_MERGER, merge_job, job_id)
+        if batch_size > 0:
+            logger.write(f"transcriber batched {len(missing)} chunks into {len(groups)} groups (batch_size={batch_size})")
+        if cache is not None:
+            logger.write(cache.describe())
+        logger.write(transcriber.describe_model_usage())
         logger.write("transcriber completed")
+    except InterruptedError:
+        logger.write("transcriber canceled")
     except Exception as exc:
         store.add_error(job_id, str(exc))
         store.set_status(job_id, "failed")
@@ -106,9 +267,99 @@ def transcribe_job(job_id: str) -> None:
         raise
 
 
+_CHUNK_LEASE_SECONDS = 3600
+
+
+def transcribe_chunk_job(job_id: str, index: int, start: float, end: float, generation: str | None = None) -> None:
+    store = open_job_store()
+    job = store.load(job_id)
+    if not job:
+        return
+    if job.status == "canceled":
+        return
+
+    paths = JobPaths(storage_root(), job_id)
+    logger = JobLogger(paths.logs_dir / "job.log")
+
+    redis = get_redis()
+    if is_canceled(redis, job_id):
+        return
+    # Streamed chunks belong to one ingest; a restarted ingest replaces its audio and chunks.
+    barrier = ChunkBarrier(redis, job_id)
+    if generation is not None and not barrier.start(index, generation, lease_seconds=_CHUNK_LEASE_SECONDS):
+        logger.write(f"chunk {index}: dropped, its ingest was restarted")
+        return
+
+    try:
+        if int(index) not in PartialLog(paths.partials_dir):
+            seg = {"index": int(index), "start": float(start), "end": float(end)}
+            transcriber = _build_transcriber()
+            audio = open_pcm_audio(paths.audio_wav)
+            batch_size = int(settings.TRANSCRIPTION_FW_BATCH_SIZE)
+            cache = _open_chunk_cache()
+            with CancelWatcher(redis, job_id) as watcher:
+                if batch_size > 0:
+                    # Long fan-out chunks still split into several 30 s windows that share one batched pass.
+                    _transcribe_group(transcriber, paths, [seg], job.options.language, audio, batch_size, watcher, cache)
+                else:
+                    _transcribe_segment(transcriber, paths, seg, job.options.language, audio, watcher, cache)
+            if cache is not None:
+                logger.write(f"chunk {index}: {cache.describe()}")
+            logger.write(f"chunk {index}: {transcriber.describe_model_usage()}")
+
+        fire = barrier.arrive(int(index))
+        # A streaming ingest keeps raising chunks_total while chunks are already running.
+        total = (store.load(job_id) or job).progress.chunks_total
+        store.set_progress(job_id, chunks_done=max(total - barrier.remaining(), 0))
+        if fire:
+            enqueue(QUEUE_MERGER, merge_job, job_id)
+            logger.write("transcriber completed")
+        elif settings.MERGE_INCREMENTAL:
+            merge_available(job, paths)
+    except InterruptedError:
+        logger.write(f"chunk {index}: canceled")
+    except Exception as exc:
+        store.add_error(job_id, f"chunk {index}: {exc}")
+        store.set_status(job_id, "failed")
+        logger.write(traceback.format_exc())
+        raise
+    finally:
+        if generation is not None:
+            barrier.finish(index, generation)
+
+
+def preload_model() -> None:
+    _model, _warm, elapsed = get_shared_model(
+        settings.TRANSCRIPTION_FW_MODEL,
+        settings.TRANSCRIPTION_FW_DEVICE,
+        settings.TRANSCRIPTION_FW_COMPUTE,
+        num_workers=settings.MAX_PARALLEL_CHUNKS,
+    )
+    log.info("preloaded whisper model %s in %.2fs", settings.TRANSCRIPTION_FW_MODEL, elapsed)
+
+
+def _configure_logging() -> None:
+    # RQ only sets up its own rq.worker logger; without a handler these diagnostics are dropped at
+    # Python's default WARNING level.
+    if not log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s: %(message)s"))
+        log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+
 def main() -> None:
-    worker = Worker([QUEUE_TRANSCRIBER], connection=get_redis())
-    worker.work()
+    _configure_logging()
+    if settings.TRANSCRIBER_PRELOAD_MODEL:
+        # The work-horse must be this process, otherwise the preloaded model dies with every fork.
+        preload_model()
+        worker = SimpleWorker([QUEUE_TRANSCRIBER], connection=get_redis())
+    else:
+        worker = Worker([QUEUE_TRANSCRIBER], connection=get_redis())
+    try:
+        worker.work()
+    finally:
+        log.info("model cache %s", model_cache_stats())
 
 
 if __name__ == "__main__":
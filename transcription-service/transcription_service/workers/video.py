@@ -0,0 +1,141 @@
+﻿from __future__ import annotations
+
+import shutil
+import tempfile
+import traceback
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlparse
+
+from redis.exceptions import LockError
+from rq import Worker
+
+from ..settings import settings
+from ..jobs.models import JobState
+from ..jobs.paths import JobPaths
+from ..jobs.logger import JobLogger
+from ..jobs.cancel import CancelWatcher, is_canceled
+from ..jobs.locks import keep_alive
+from ..jobs.queue import QUEUE_VIDEO, get_redis
+from ..jobs.utils import open_job_store, storage_root
+from ..infrastructure.downloader.http_ranged import download_ranged
+from ..infrastructure.downloader.yt_dlp_adapter import YtDlpDownloaderAdapter
+from ..infrastructure.tools.ffmpeg_provider import ensure_ffmpeg
+from ..shared.fs__shared_util import copy_file_atomic
+
+
+def is_direct_mp4(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme in {"http", "https"} and parsed.path.lower().endswith(".mp4")
+
+
+def download_direct(
+    url: str,
+    dest: Path,
+    logger: JobLogger,
+    *,
+    check_canceled: Callable[[], None] | None = None,
+) -> None:
+    stats = download_ranged(
+        url,
+        dest,
+        connections=settings.DOWNLOAD_CONNECTIONS,
+        part_size=settings.DOWNLOAD_PART_MB * 1024 * 1024,
+        check_canceled=check_canceled,
+    )
+    if stats.ranged:
+        logger.write(
+            f"downloaded {stats.size} bytes in {stats.parts} ranged parts "
+            f"({stats.resumed_parts} resumed, {settings.DOWNLOAD_CONNECTIONS} connections)"
+        )
+    else:
+        logger.write(f"downloaded {stats.size} bytes (server does not support ranges)")
+
+
+_VIDEO_LOCK_SECONDS = 6 * 3600
+
+
+def needs_video(job: JobState, paths: JobPaths) -> bool:
+    # audio_only and streamed URL jobs transcribe without original.mp4; the video is only fetched
+    # for the package.
+    return job.input.type == "url" and job.options.include_video and not paths.original_mp4.exists()
+
+
+def ensure_video(job: JobState, paths: JobPaths, logger: JobLogger, watcher: CancelWatcher) -> Path:
+    if paths.original_mp4.exists():
+        return paths.original_mp4
+
+    # Whoever holds the lock is already downloading; waiting for it beats a second download.
+    lock = get_redis().lock(
+        f"transcription:job:{job.job_id}:video",
+        timeout=_VIDEO_LOCK_SECONDS,
+        # Renewed from a helper thread, which must see the token.
+        thread_local=False,
+    )
+    acquired = False
+    try:
+        while not acquired:
+            watcher.raise_if_canceled()
+            acquired = lock.acquire(blocking=True, blocking_timeout=5)
+        if paths.original_mp4.exists():
+            return paths.original_mp4
+        # A download that outlives the lock's TTL would let a waiting worker start a second one.
+        with keep_alive(lock):
+            _download_video(job, paths, logger, watcher)
+        return paths.original_mp4
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+
+def _download_video(job: JobState, paths: JobPaths, logger: JobLogger, watcher: CancelWatcher) -> None:
+    if is_direct_mp4(job.input.value):
+        download_direct(job.input.value, paths.original_mp4, logger, check_canceled=watcher.raise_if_canceled)
+        return
+    ffmpeg, _ = ensure_ffmpeg(Path(__file__).resolve().parents[3] / "transcription-service" / ".tools")
+    downloader = YtDlpDownloaderAdapter(ffmpeg=ffmpeg, runner=watcher.run)
+    work_dir = Path(tempfile.mkdtemp(prefix="video_", dir=paths.input_dir))
+    try:
+        logger.write("downloading video via yt-dlp")
+        media_path = downloader.download(
+            job.input.value,
+            work_dir,
+            cookies_from_browser=job.options.cookies_from_browser,
+        )
+        copy_file_atomic(media_path, paths.original_mp4)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    logger.write("video downloaded")
+
+
+def fetch_video_job(job_id: str) -> None:
+    # Runs alongside transcription. A failure here is only logged: the packager tries again.
+    store = open_job_store()
+    job = store.load(job_id)
+    if not job or job.status in {"canceled", "failed"} or is_canceled(get_redis(), job_id):
+        return
+    paths = JobPaths(storage_root(), job_id)
+    logger = JobLogger(paths.logs_dir / "job.log")
+    if not needs_video(job, paths):
+        return
+    try:
+        with CancelWatcher(get_redis(), job_id) as watcher:
+            ensure_video(job, paths, logger, watcher)
+    except InterruptedError:
+        logger.write("background video download canceled")
+    except Exception:
+        logger.write("background video download failed; the packager will retry")
+        logger.write(traceback.format_exc())
+
+
+def main() -> None:
+    # Video downloads get their own workers so they never hold up a splitter.
+    worker = Worker([QUEUE_VIDEO], connection=get_redis())
+    worker.work()
+
+
+if __name__ == "__main__":
+    main()